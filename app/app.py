@@ -9,6 +9,15 @@ from .routes.profile_routes import profile_bp
 from .routes.client_routes import client_bp
 from .routes.distributor_routes import distributor_bp
 from .routes.employee_routes import employee_bp  # Import the employee blueprint
+from .routes.batch_routes import batch_bp
+from .routes.analytics_routes import analytics_bp
+from .routes.alert_routes import alert_bp
+from .routes.dashboard_routes import dashboard_bp
+from .routes.telemetry_routes import telemetry_bp
+from .routes.import_routes import import_bp
+from .routes.machine_routes import machine_bp
+from .routes.sync_routes import sync_bp
+from .utils import admission, resilience
 
 def create_app():
     load_dotenv()
@@ -24,12 +33,25 @@ def create_app():
         "supports_credentials": True
     }})
     
+    # Per-route priority, concurrency, rate limits and statement timeouts;
+    # 503 or stale cached data while the database is unreachable
+    admission.init_app(app)
+    resilience.init_app(app)
+    
     # Register blueprints
     app.register_blueprint(auth_bp)
     app.register_blueprint(profile_bp)
     app.register_blueprint(client_bp)
     app.register_blueprint(distributor_bp)
     app.register_blueprint(employee_bp)  # Register the employee blueprint
+    app.register_blueprint(batch_bp)
+    app.register_blueprint(analytics_bp)
+    app.register_blueprint(alert_bp)
+    app.register_blueprint(dashboard_bp)
+    app.register_blueprint(telemetry_bp)
+    app.register_blueprint(import_bp)
+    app.register_blueprint(machine_bp)
+    app.register_blueprint(sync_bp)
     
     @app.route('/')
     def home():
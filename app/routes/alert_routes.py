@@ -0,0 +1,260 @@
+from flask import Blueprint, request, jsonify
+from psycopg2.extras import RealDictCursor
+from db_config import get_db_connection
+from ..utils.auth_utils import user_required
+from ..services.alert_rules import engine, METRICS, LOWER_OPERATORS, UPPER_OPERATORS
+from ..services.scope_service import client_scope_sql, visible_client_ids
+
+alert_bp = Blueprint('alert_bp', __name__)
+
+RULE_MANAGER_ROLES = ['admin', 'manager', 'distributor']
+SEVERITIES = ['info', 'warning', 'critical']
+RULE_FIELDS = ['rule_name', 'client_id', 'type_of_metal', 'type_of_machine', 'machine_id',
+               'metric', 'operator', 'threshold', 'severity', 'is_active']
+
+# Validate a rule payload; returns an error message or None
+def validate_rule(data):
+    for field in ['rule_name', 'metric', 'operator', 'threshold']:
+        if data.get(field) in (None, ''):
+            return f'{field} is required!'
+
+    if data['metric'] not in METRICS:
+        return f"metric must be one of: {', '.join(METRICS)}"
+
+    if data['operator'] not in LOWER_OPERATORS + UPPER_OPERATORS:
+        return 'operator must be one of: <, <=, >, >='
+
+    if data.get('severity', 'warning') not in SEVERITIES:
+        return f"severity must be one of: {', '.join(SEVERITIES)}"
+
+    try:
+        float(data['threshold'])
+    except (TypeError, ValueError):
+        return 'threshold must be a number!'
+
+    return None
+
+# Non-admins may only target clients and machines they can see; rules
+# without a client or machine apply fleet-wide and are admin only.
+# Returns an error message or None.
+def check_rule_scope(current_user, data):
+    if current_user['role'] == 'admin':
+        return None
+
+    client_id = data.get('client_id')
+    machine_id = data.get('machine_id')
+    if client_id in (None, '') and machine_id in (None, ''):
+        return 'Only admins can manage global rules!'
+
+    allowed = visible_client_ids(current_user)
+    if allowed is None:
+        return None
+
+    try:
+        client_ids = set()
+        if client_id not in (None, ''):
+            client_ids.add(int(client_id))
+        if machine_id not in (None, ''):
+            conn = get_db_connection()
+            cur = conn.cursor()
+            cur.execute('SELECT client_id FROM machine WHERE machine_id = %s', (int(machine_id),))
+            machine = cur.fetchone()
+            cur.close()
+            conn.close()
+            if machine is None:
+                return 'Unauthorized machine!'
+            client_ids.add(machine[0])
+    except (TypeError, ValueError):
+        return 'client_id and machine_id must be numbers!'
+
+    if not client_ids <= allowed:
+        return 'Unauthorized client or machine!'
+    return None
+
+# Rules that apply to clients the user can see, plus global rules
+@alert_bp.route('/api/alert-rules', methods=['GET'])
+@user_required
+def get_alert_rules(current_user):
+    query = """
+        SELECT rule_id, rule_name, client_id, type_of_metal, type_of_machine, machine_id,
+               metric, operator, threshold, severity, is_active, created_by, updated_at
+        FROM alert_rule WHERE 1=1
+    """
+    params = []
+
+    scope_query, scope_params = client_scope_sql(current_user)
+    if scope_query is not None:
+        query += f" AND (client_id IS NULL OR client_id IN ({scope_query}))"
+        params.extend(scope_params)
+
+    query += " ORDER BY rule_id"
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+
+    cur.execute(query, params)
+    rules = cur.fetchall()
+
+    cur.close()
+    conn.close()
+
+    return jsonify({'rules': rules})
+
+@alert_bp.route('/api/alert-rules', methods=['POST'])
+@user_required
+def add_alert_rule(current_user):
+    if current_user['role'] not in RULE_MANAGER_ROLES:
+        return jsonify({'message': 'Unauthorized!'}), 403
+
+    data = request.get_json(silent=True) or {}
+    error = validate_rule(data)
+    if error:
+        return jsonify({'message': error}), 400
+
+    error = check_rule_scope(current_user, data)
+    if error:
+        return jsonify({'message': error}), 403
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+        INSERT INTO alert_rule (
+            rule_name, client_id, type_of_metal, type_of_machine, machine_id,
+            metric, operator, threshold, severity, is_active, created_by
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        RETURNING rule_id
+    """, (
+        data['rule_name'], data.get('client_id'), data.get('type_of_metal'),
+        data.get('type_of_machine'), data.get('machine_id'),
+        data['metric'], data['operator'], float(data['threshold']),
+        data.get('severity', 'warning'), data.get('is_active', True), current_user['user_id']
+    ))
+    rule_id = cur.fetchone()[0]
+
+    cur.close()
+    conn.close()
+
+    engine.invalidate()
+
+    return jsonify({'message': 'Alert rule added successfully!', 'rule_id': rule_id}), 201
+
+@alert_bp.route('/api/alert-rules/<int:rule_id>', methods=['PUT'])
+@user_required
+def update_alert_rule(current_user, rule_id):
+    if current_user['role'] not in RULE_MANAGER_ROLES:
+        return jsonify({'message': 'Unauthorized!'}), 403
+
+    data = request.get_json(silent=True) or {}
+    error = validate_rule(data)
+    if error:
+        return jsonify({'message': error}), 400
+
+    error = check_rule_scope(current_user, data)
+    if error:
+        return jsonify({'message': error}), 403
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    # Non-admins may only edit rules they created
+    cur.execute("""
+        UPDATE alert_rule SET
+            rule_name = %s, client_id = %s, type_of_metal = %s, type_of_machine = %s,
+            machine_id = %s, metric = %s, operator = %s, threshold = %s,
+            severity = %s, is_active = %s
+        WHERE rule_id = %s AND (%s = 'admin' OR created_by = %s)
+        RETURNING rule_id
+    """, (
+        data['rule_name'], data.get('client_id'), data.get('type_of_metal'),
+        data.get('type_of_machine'), data.get('machine_id'),
+        data['metric'], data['operator'], float(data['threshold']),
+        data.get('severity', 'warning'), data.get('is_active', True),
+        rule_id, current_user['role'], current_user['user_id']
+    ))
+    updated = cur.fetchone()
+
+    cur.close()
+    conn.close()
+
+    if not updated:
+        return jsonify({'message': 'Alert rule not found!'}), 404
+
+    engine.invalidate()
+
+    return jsonify({'message': 'Alert rule updated successfully!'})
+
+@alert_bp.route('/api/alert-rules/<int:rule_id>', methods=['DELETE'])
+@user_required
+def delete_alert_rule(current_user, rule_id):
+    if current_user['role'] not in RULE_MANAGER_ROLES:
+        return jsonify({'message': 'Unauthorized!'}), 403
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+        DELETE FROM alert_rule
+        WHERE rule_id = %s AND (%s = 'admin' OR created_by = %s)
+        RETURNING rule_id
+    """, (rule_id, current_user['role'], current_user['user_id']))
+    deleted = cur.fetchone()
+
+    cur.close()
+    conn.close()
+
+    if not deleted:
+        return jsonify({'message': 'Alert rule not found!'}), 404
+
+    engine.invalidate()
+
+    return jsonify({'message': 'Alert rule deleted successfully!'})
+
+# Alerts raised for machines the user can see
+@alert_bp.route('/api/alerts', methods=['GET'])
+@user_required
+def get_alerts(current_user):
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = min(int(request.args.get('per_page', 50)), 500)
+        machine_id = request.args.get('machine_id', type=int)
+    except ValueError:
+        return jsonify({'message': 'page and per_page must be numbers!'}), 400
+
+    severity = request.args.get('severity', '')
+
+    query = """
+        SELECT a.alert_id, a.reading_id, a.machine_id, m.machine_name, m.client_id,
+               a.rule_id, a.metric, a.value, a.operator, a.threshold, a.severity, a.created_at
+        FROM reading_alert a
+        JOIN machine m ON m.machine_id = a.machine_id
+        WHERE 1=1
+    """
+    params = []
+
+    if machine_id:
+        query += " AND a.machine_id = %s"
+        params.append(machine_id)
+
+    if severity:
+        query += " AND a.severity = %s"
+        params.append(severity)
+
+    scope_query, scope_params = client_scope_sql(current_user)
+    if scope_query is not None:
+        query += f" AND m.client_id IN ({scope_query})"
+        params.extend(scope_params)
+
+    query += " ORDER BY a.created_at DESC, a.alert_id DESC LIMIT %s OFFSET %s"
+    params.extend([per_page, (page - 1) * per_page])
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+
+    cur.execute(query, params)
+    alerts = cur.fetchall()
+
+    cur.close()
+    conn.close()
+
+    return jsonify({'alerts': alerts, 'page': page, 'per_page': per_page})
@@ -0,0 +1,270 @@
+import datetime
+from flask import Blueprint, request, jsonify
+from psycopg2.extras import RealDictCursor
+from db_config import get_db_connection
+from ..utils.auth_utils import user_required
+from ..services import job_queue, effectiveness_service, series_service
+from ..services.scope_service import client_scope_sql
+
+analytics_bp = Blueprint('analytics_bp', __name__)
+
+# Anomaly flags for the machines the user can see
+@analytics_bp.route('/api/analytics/anomalies', methods=['GET'])
+@user_required
+def get_anomalies(current_user):
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = min(int(request.args.get('per_page', 50)), 500)
+        machine_id = request.args.get('machine_id', type=int)
+        client_id = request.args.get('client_id', type=int)
+    except ValueError:
+        return jsonify({'message': 'page and per_page must be numbers!'}), 400
+
+    metric = request.args.get('metric', '')
+    kind = request.args.get('kind', '')
+    since = request.args.get('since', '')
+
+    query = """
+        SELECT a.anomaly_id, a.reading_id, a.machine_id, m.machine_name, m.client_id,
+               a.metric, a.kind, a.score, a.detected_at
+        FROM reading_anomaly a
+        JOIN machine m ON m.machine_id = a.machine_id
+        WHERE 1=1
+    """
+    params = []
+
+    if machine_id:
+        query += " AND a.machine_id = %s"
+        params.append(machine_id)
+
+    if client_id:
+        query += " AND m.client_id = %s"
+        params.append(client_id)
+
+    if metric:
+        query += " AND a.metric = %s"
+        params.append(metric)
+
+    if kind:
+        query += " AND a.kind = %s"
+        params.append(kind)
+
+    if since:
+        query += " AND a.detected_at >= %s"
+        params.append(since)
+
+    # Add role-based filtering
+    scope_query, scope_params = client_scope_sql(current_user)
+    if scope_query is not None:
+        query += f" AND m.client_id IN ({scope_query})"
+        params.extend(scope_params)
+
+    query += " ORDER BY a.detected_at DESC, a.anomaly_id DESC LIMIT %s OFFSET %s"
+    params.extend([per_page, (page - 1) * per_page])
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+
+    cur.execute(query, params)
+    anomalies = cur.fetchall()
+
+    cur.close()
+    conn.close()
+
+    return jsonify({'anomalies': anomalies, 'page': page, 'per_page': per_page})
+
+# Queue a fleet-wide anomaly scoring run
+@analytics_bp.route('/api/analytics/anomalies/run', methods=['POST'])
+@user_required
+def run_anomaly_scoring(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized!'}), 403
+
+    data = request.get_json(silent=True) or {}
+    days = int(data.get('days', 365))
+
+    job_id = job_queue.enqueue('score_anomalies', {'days': days}, max_attempts=2)
+
+    return jsonify({'message': 'Anomaly scoring queued!', 'job_id': job_id}), 202
+
+# Latest completed forecast, per machine or rolled up per client/distributor
+@analytics_bp.route('/api/analytics/forecasts', methods=['GET'])
+@user_required
+def get_forecasts(current_user):
+    level = request.args.get('level', 'client')
+    if level not in ('machine', 'client', 'distributor'):
+        return jsonify({'message': 'level must be one of: machine, client, distributor'}), 400
+
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = min(int(request.args.get('per_page', 50)), 500)
+        scope_id = request.args.get('id', type=int)
+    except ValueError:
+        return jsonify({'message': 'page and per_page must be numbers!'}), 400
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+
+    cur.execute("""
+        SELECT run_id, horizon_weeks, history_weeks, machines, finished_at
+        FROM forecast_run WHERE status = 'completed'
+        ORDER BY run_id DESC LIMIT 1
+    """)
+    run = cur.fetchone()
+
+    if not run:
+        cur.close()
+        conn.close()
+        return jsonify({'run': None, 'forecasts': []})
+
+    scope_query, scope_params = client_scope_sql(current_user)
+
+    if level == 'machine':
+        query = """
+            SELECT f.machine_id AS id, m.machine_name AS name, f.period_start, f.oil_top_up, f.water_input
+            FROM machine_forecast f
+            JOIN machine m ON m.machine_id = f.machine_id
+            WHERE f.run_id = %s
+        """
+        params = [run['run_id']]
+        if scope_id:
+            query += " AND f.machine_id = %s"
+            params.append(scope_id)
+        if scope_query is not None:
+            query += f" AND m.client_id IN ({scope_query})"
+            params.extend(scope_params)
+        order_column = 'f.machine_id'
+    else:
+        name_join = {
+            'client': "JOIN client s ON s.client_id = f.scope_id",
+            'distributor': "JOIN distributor s ON s.distributor_id = f.scope_id",
+        }[level]
+        query = f"""
+            SELECT f.scope_id AS id, s.{level}_name AS name, f.period_start,
+                   f.oil_top_up, f.water_input, f.machines
+            FROM forecast_rollup f
+            {name_join}
+            WHERE f.run_id = %s AND f.scope_type = %s
+        """
+        params = [run['run_id'], level]
+        if scope_id:
+            query += " AND f.scope_id = %s"
+            params.append(scope_id)
+        if scope_query is not None:
+            # Distributors are visible through their visible clients
+            if level == 'client':
+                query += f" AND f.scope_id IN ({scope_query})"
+            else:
+                query += f" AND f.scope_id IN (SELECT distributor_id FROM client WHERE client_id IN ({scope_query}))"
+            params.extend(scope_params)
+        order_column = 'f.scope_id'
+
+    # Page by entity so every entity comes back with its whole horizon
+    query += f" ORDER BY {order_column}, f.period_start LIMIT %s OFFSET %s"
+    horizon = run['horizon_weeks']
+    params.extend([per_page * horizon, (page - 1) * per_page * horizon])
+
+    cur.execute(query, params)
+    forecasts = cur.fetchall()
+
+    cur.close()
+    conn.close()
+
+    return jsonify({'run': run, 'forecasts': forecasts, 'page': page, 'per_page': per_page})
+
+# Queue a full-fleet forecast refit
+@analytics_bp.route('/api/analytics/forecasts/run', methods=['POST'])
+@user_required
+def run_forecast_refit(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized!'}), 403
+
+    data = request.get_json(silent=True) or {}
+    payload = {'horizon_weeks': int(data.get('horizon_weeks', 4))}
+    if data.get('processes'):
+        payload['processes'] = int(data['processes'])
+
+    job_id = job_queue.enqueue('refit_forecasts', payload, max_attempts=2)
+
+    return jsonify({'message': 'Forecast refit queued!', 'job_id': job_id}), 202
+
+# Pre/post response effectiveness, grouped by responder, distributor,
+# client, machine type and oil dose
+@analytics_bp.route('/api/analytics/effectiveness', methods=['GET'])
+@user_required
+def get_effectiveness(current_user):
+    today = datetime.date.today()
+    try:
+        end = datetime.date.fromisoformat(request.args['end']) if request.args.get('end') else today + datetime.timedelta(days=1)
+        start = datetime.date.fromisoformat(request.args['start']) if request.args.get('start') else end - datetime.timedelta(days=365)
+    except ValueError:
+        return jsonify({'message': 'start and end must be dates (YYYY-MM-DD)!'}), 400
+
+    if start >= end:
+        return jsonify({'message': 'start must be before end!'}), 400
+
+    result = effectiveness_service.get_effectiveness(current_user, start, end)
+
+    return jsonify({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'target_ranges': effectiveness_service.TARGET_RANGES,
+        **result
+    })
+
+# Downsampled chart series for one or more machines
+@analytics_bp.route('/api/analytics/series', methods=['GET'])
+@user_required
+def get_series(current_user):
+    try:
+        machine_ids = [int(m) for m in request.args.get('machine_id', '').split(',') if m.strip()]
+        width = min(max(int(request.args.get('width', 800)), 10), series_service.MAX_WIDTH)
+        end = datetime.datetime.fromisoformat(request.args['end']) if request.args.get('end') else datetime.datetime.now(datetime.timezone.utc)
+        start = datetime.datetime.fromisoformat(request.args['start']) if request.args.get('start') else end - datetime.timedelta(days=365)
+    except ValueError:
+        return jsonify({'message': 'Invalid machine_id, width, start or end!'}), 400
+
+    if not machine_ids:
+        return jsonify({'message': 'machine_id is required!'}), 400
+
+    if len(machine_ids) > series_service.MAX_MACHINES:
+        return jsonify({'message': f'At most {series_service.MAX_MACHINES} machines per request!'}), 400
+
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=datetime.timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=datetime.timezone.utc)
+    if start >= end:
+        return jsonify({'message': 'start must be before end!'}), 400
+
+    mode = request.args.get('mode', 'lttb')
+    if mode not in ('lttb', 'minmax'):
+        return jsonify({'message': 'mode must be lttb or minmax'}), 400
+
+    metrics = [m for m in request.args.get('metrics', ','.join(series_service.METRICS)).split(',') if m]
+    if not metrics or any(m not in series_service.METRICS for m in metrics):
+        return jsonify({'message': f"metrics must be from: {', '.join(series_service.METRICS)}"}), 400
+
+    # Drop machines outside the caller's scope
+    scope_query, scope_params = client_scope_sql(current_user)
+    if scope_query is not None:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT machine_id FROM machine
+            WHERE machine_id = ANY(%s) AND client_id IN ({scope_query})
+        """, [machine_ids, *scope_params])
+        visible = {row[0] for row in cur.fetchall()}
+        cur.close()
+        conn.close()
+        machine_ids = [m for m in machine_ids if m in visible]
+
+    series = series_service.machine_series(machine_ids, start, end, width, mode, metrics) if machine_ids else []
+
+    return jsonify({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'width': width,
+        'mode': mode,
+        'series': series
+    })
@@ -0,0 +1,89 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from flask import Blueprint, request, jsonify, current_app
+import jwt
+from db_config import shared_connection
+from ..utils.auth_utils import set_batch_identity, reset_batch_identity
+
+batch_bp = Blueprint('batch_bp', __name__)
+
+MAX_SUB_REQUESTS = 20
+MAX_PARALLEL = 4
+
+# Run one GET sub-request through the normal routing and view functions.
+# Its queries share one pooled connection of its own, so sub-requests on
+# different threads really run side by side.
+def run_sub_request(app, path, headers):
+    with shared_connection(), app.test_request_context(path, method='GET', headers=headers):
+        response = app.full_dispatch_request()
+        body = response.get_json(silent=True)
+        if body is None:
+            body = response.get_data(as_text=True)
+        return {'status': response.status_code, 'body': body}
+
+# Execute several GET requests with one authentication
+@batch_bp.route('/batch', methods=['POST'])
+def batch():
+    token = None
+    auth_header = request.headers.get('Authorization')
+
+    if auth_header:
+        token = auth_header.split(" ")[1]
+
+    if not token:
+        return jsonify({'message': 'Token is missing!'}), 401
+
+    try:
+        current_user = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
+    except:
+        return jsonify({'message': 'Token is invalid!'}), 401
+
+    data = request.get_json(silent=True) or {}
+    sub_requests = data.get('requests')
+
+    if not isinstance(sub_requests, list) or not sub_requests:
+        return jsonify({'message': 'requests must be a non-empty list!'}), 400
+
+    if len(sub_requests) > MAX_SUB_REQUESTS:
+        return jsonify({'message': f'At most {MAX_SUB_REQUESTS} requests per batch!'}), 400
+
+    # Validate every sub-request before running any of them
+    paths = []
+    for index, sub in enumerate(sub_requests):
+        if not isinstance(sub, dict) or not isinstance(sub.get('path'), str):
+            return jsonify({'message': f'requests[{index}].path is required!'}), 400
+
+        method = sub.get('method', 'GET').upper()
+        if method != 'GET':
+            return jsonify({'message': f'requests[{index}]: only GET requests can be batched!'}), 400
+
+        parts = urlsplit(sub['path'])
+        path = parts.path + (f'?{parts.query}' if parts.query else '')
+        if not path.startswith('/') or parts.path.rstrip('/') == request.path.rstrip('/'):
+            return jsonify({'message': f'requests[{index}].path is invalid!'}), 400
+
+        paths.append(path)
+
+    app = current_app._get_current_object()
+    headers = {'Authorization': auth_header}
+
+    identity_token = set_batch_identity(current_user)
+    try:
+        # GET sub-requests are independent, so run them side by side. Each
+        # worker gets a copy of this context so it sees the verified identity.
+        with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL, len(paths))) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, run_sub_request, app, path, headers)
+                for path in paths
+            ]
+            results = [future.result() for future in futures]
+    finally:
+        reset_batch_identity(identity_token)
+
+    responses = []
+    for sub, result in zip(sub_requests, results):
+        result['id'] = sub.get('id', sub['path'])
+        responses.append(result)
+
+    return jsonify({'responses': responses}), 200
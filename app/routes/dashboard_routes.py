@@ -0,0 +1,56 @@
+from flask import Blueprint, request, jsonify
+from ..utils.auth_utils import user_required
+from ..services import dashboard_service, fleet_service, job_queue
+
+dashboard_bp = Blueprint('dashboard_bp', __name__)
+
+# Reading and machine counts for the landing dashboard
+@dashboard_bp.route('/api/dashboard/summary', methods=['GET'])
+@user_required
+def get_dashboard_summary(current_user):
+    try:
+        overdue_hours = int(request.args.get('overdue_hours', dashboard_service.OVERDUE_HOURS))
+        stale_days = int(request.args.get('stale_days', dashboard_service.STALE_DAYS))
+    except ValueError:
+        return jsonify({'message': 'overdue_hours and stale_days must be numbers!'}), 400
+
+    if overdue_hours < 1 or stale_days < 1:
+        return jsonify({'message': 'overdue_hours and stale_days must be positive!'}), 400
+
+    summary = dashboard_service.get_summary(current_user, overdue_hours, stale_days)
+
+    return jsonify(summary)
+
+# Latest reading of every visible machine, paginated
+@dashboard_bp.route('/api/fleet/status', methods=['GET'])
+@user_required
+def get_fleet_status(current_user):
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        per_page = min(int(request.args.get('per_page', 50)), 500)
+        client_id = request.args.get('client_id', type=int)
+        distributor_id = request.args.get('distributor_id', type=int)
+        stale_days = int(request.args.get('stale_days', 0))
+    except ValueError:
+        return jsonify({'message': 'page, per_page and stale_days must be numbers!'}), 400
+
+    status = request.args.get('status', '')
+    if status and status != 'none' and status not in fleet_service.STATUSES:
+        return jsonify({'message': f"status must be one of: {', '.join(fleet_service.STATUSES)}, none"}), 400
+
+    machines = fleet_service.list_fleet_status(
+        current_user, page, per_page, status, client_id, distributor_id, stale_days
+    )
+
+    return jsonify({'machines': machines, 'page': page, 'per_page': per_page})
+
+# Queue a consistency check and repair of machine_latest_reading
+@dashboard_bp.route('/api/fleet/status/repair', methods=['POST'])
+@user_required
+def repair_fleet_status(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized!'}), 403
+
+    job_id = job_queue.enqueue('repair_machine_latest', {}, max_attempts=2)
+
+    return jsonify({'message': 'Repair queued!', 'job_id': job_id}), 202
@@ -7,6 +7,8 @@ from werkzeug.utils import secure_filename
 import jwt
 from db_config import get_db_connection
 from ..utils.auth_utils import token_required, role_required
+from ..services import job_queue
+from ..utils import cache
 
 distributor_bp = Blueprint('distributor', __name__)
 
@@ -288,33 +290,13 @@ def update_distributor(distributor_id):
     if 'secondary_mobile_number' not in data:
         data['secondary_mobile_number'] = None
     
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # Get current distributor data to check permissions and existing logo
     token = request.headers.get('Authorization').split(" ")[1]
     user_data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
     user_id = user_data['id']
     user_role = user_data['role']
     
-    cur.execute("SELECT created_by, distributor_logo FROM public.distributor WHERE distributor_id = %s", (distributor_id,))
-    result = cur.fetchone()
-    
-    if not result:
-        cur.close()
-        conn.close()
-        return jsonify({'error': 'Distributor not found'}), 404
-    
-    created_by, existing_logo = result
-    
-    # Check permissions - only Admin or the creator can edit
-    if user_role != 'Admin' and int(created_by) != int(user_id):
-        cur.close()
-        conn.close()
-        return jsonify({'error': 'You do not have permission to edit this distributor'}), 403
-    
     # Process logo file if provided
-    logo_path = existing_logo
+    new_logo = None
     if 'distributor_logo' in request.files and request.files['distributor_logo'].filename:
         file = request.files['distributor_logo']
         if allowed_file(file.filename):
@@ -324,8 +306,6 @@ def update_distributor(distributor_id):
             file.seek(0)
             
             if file_size > MAX_FILE_SIZE:
-                cur.close()
-                conn.close()
                 return jsonify({'error': 'File size exceeds the 2MB limit'}), 400
             
             # Generate unique filename
@@ -338,48 +318,73 @@ def update_distributor(distributor_id):
             
             filepath = os.path.join(upload_folder, filename)
             file.save(filepath)
-            logo_path = f'/static/distributor_logos/{filename}'
-            
-            # Delete old logo if it exists
-            if existing_logo and existing_logo.startswith('/static/distributor_logos/'):
-                old_logo_path = os.path.join(current_app.static_folder, existing_logo.replace('/static/', ''))
-                try:
-                    if os.path.exists(old_logo_path):
-                        os.remove(old_logo_path)
-                except Exception as e:
-                    print(f"Error removing old logo: {str(e)}")
+            new_logo = f'/static/distributor_logos/{filename}'
     
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    # The update and its logo cleanup job commit together
+    conn.autocommit = False
     try:
-        cur.execute("""
-            UPDATE public.distributor SET
-                distributor_name = %s, city = %s, address = %s,
-                primary_contact_person = %s, primary_country_code = %s, primary_mobile_number = %s,
-                secondary_contact_person = %s, secondary_country_code = %s, secondary_mobile_number = %s,
-                email_id = %s, gst_number = %s, distributor_category = %s,
-                whatsapp_country_code = %s, whatsapp_communication_number = %s,
-                distributor_logo = %s, updated_at = %s
-            WHERE distributor_id = %s
-        """, (
-            data['distributor_name'], data['city'], data['address'],
-            data['primary_contact_person'], data['primary_country_code'], data['primary_mobile_number'],
-            data['secondary_contact_person'], data['secondary_country_code'], data['secondary_mobile_number'],
-            data['email_id'], data['gst_number'], data['distributor_category'],
-            data['whatsapp_country_code'], data['whatsapp_communication_number'],
-            logo_path, datetime.now(), distributor_id
-        ))
+        with conn:
+            # Only Admin or the creator can edit; the permission check and the
+            # previous logo lookup are part of the update itself
+            cur.execute("""
+                UPDATE public.distributor d SET
+                    distributor_name = %s, city = %s, address = %s,
+                    primary_contact_person = %s, primary_country_code = %s, primary_mobile_number = %s,
+                    secondary_contact_person = %s, secondary_country_code = %s, secondary_mobile_number = %s,
+                    email_id = %s, gst_number = %s, distributor_category = %s,
+                    whatsapp_country_code = %s, whatsapp_communication_number = %s,
+                    distributor_logo = COALESCE(%s, previous.distributor_logo), updated_at = %s
+                FROM (
+                    SELECT distributor_id, distributor_logo FROM public.distributor
+                    WHERE distributor_id = %s FOR UPDATE
+                ) AS previous
+                WHERE d.distributor_id = previous.distributor_id
+                AND (%s = 'Admin' OR d.created_by = %s)
+                RETURNING previous.distributor_logo
+            """, (
+                data['distributor_name'], data['city'], data['address'],
+                data['primary_contact_person'], data['primary_country_code'], data['primary_mobile_number'],
+                data['secondary_contact_person'], data['secondary_country_code'], data['secondary_mobile_number'],
+                data['email_id'], data['gst_number'], data['distributor_category'],
+                data['whatsapp_country_code'], data['whatsapp_communication_number'],
+                new_logo, datetime.now(), distributor_id, user_role, int(user_id)
+            ))
+            result = cur.fetchone()
+            
+            if not result:
+                # Only failed updates pay for the lookup that explains why
+                cur.execute("SELECT 1 FROM public.distributor WHERE distributor_id = %s", (distributor_id,))
+                exists = cur.fetchone()
+                
+                if new_logo:
+                    job_queue.enqueue('delete_file', {'path': new_logo.replace('/static/', '', 1)}, conn=conn)
+            else:
+                # Distributor names are part of cached scans
+                cache.invalidate('machine_scan', cur=cur)
+                
+                # Delete the replaced logo in the background
+                existing_logo = result[0]
+                if new_logo and existing_logo and existing_logo.startswith('/static/distributor_logos/'):
+                    job_queue.enqueue('delete_file', {'path': existing_logo.replace('/static/', '', 1)}, conn=conn)
         
-        conn.commit()
+        if not result:
+            if not exists:
+                return jsonify({'error': 'Distributor not found'}), 404
+            return jsonify({'error': 'You do not have permission to edit this distributor'}), 403
         
         return jsonify({
             'message': 'Distributor updated successfully'
         })
     
     except Exception as e:
-        conn.rollback()
         return jsonify({'error': str(e)}), 500
     
     finally:
         cur.close()
+        conn.autocommit = True
         conn.close()
 
 @distributor_bp.route('/api/distributor/<int:distributor_id>', methods=['DELETE'])
@@ -389,41 +394,36 @@ def delete_distributor(distributor_id):
     conn = get_db_connection()
     cur = conn.cursor()
     
-    # Get distributor logo path to delete the file
-    cur.execute("SELECT distributor_logo FROM public.distributor WHERE distributor_id = %s", (distributor_id,))
-    result = cur.fetchone()
-    
-    if not result:
-        cur.close()
-        conn.close()
-        return jsonify({'error': 'Distributor not found'}), 404
-    
-    logo_path = result[0]
-    
+    # The delete and its logo cleanup job commit together
+    conn.autocommit = False
     try:
-        # Delete from database
-        cur.execute("DELETE FROM public.distributor WHERE distributor_id = %s", (distributor_id,))
-        conn.commit()
+        with conn:
+            # Delete from database, returning the logo path to delete the file
+            cur.execute("DELETE FROM public.distributor WHERE distributor_id = %s RETURNING distributor_logo", (distributor_id,))
+            result = cur.fetchone()
+            
+            if result:
+                cache.invalidate('machine_scan', cur=cur)
+                cache.invalidate('scan_scope', cur=cur)
+            
+            # Delete logo file in the background
+            logo_path = result[0] if result else None
+            if logo_path and logo_path.startswith('/static/distributor_logos/'):
+                job_queue.enqueue('delete_file', {'path': logo_path.replace('/static/', '', 1)}, conn=conn)
         
-        # Delete logo file if it exists
-        if logo_path and logo_path.startswith('/static/distributor_logos/'):
-            file_path = os.path.join(current_app.static_folder, logo_path.replace('/static/', ''))
-            try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-            except Exception as e:
-                print(f"Error removing logo file: {str(e)}")
+        if not result:
+            return jsonify({'error': 'Distributor not found'}), 404
         
         return jsonify({
             'message': 'Distributor deleted successfully'
         })
     
     except Exception as e:
-        conn.rollback()
         return jsonify({'error': str(e)}), 500
     
     finally:
         cur.close()
+        conn.autocommit = True
         conn.close()
 
 @distributor_bp.route('/api/distributor/qrcode/<int:distributor_id>', methods=['GET'])
@@ -7,13 +7,24 @@ import jwt
 from functools import wraps
 from db_config import get_db_connection
 from datetime import datetime
+from ..utils.auth_utils import get_batch_identity
+from ..utils.cache import TieredCache, invalidate
+from ..services.hierarchy_service import employee_scope_sql, subtree_sql, resolve_manager
 
 employee_bp = Blueprint('employee_bp', __name__)
 
+# Dropdown data; also served (marked stale) during database outages
+employee_list_cache = TieredCache('employee_lists', maxsize=16, ttl=300)
+
 # Token verification middleware
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
+        # Sub-requests of a batch reuse the identity verified by the batch
+        batch_user = get_batch_identity()
+        if batch_user is not None:
+            return f(batch_user, *args, **kwargs)
+
         token = None
         auth_header = request.headers.get('Authorization')
         
@@ -68,15 +79,19 @@ def get_employees(current_user):
             count_query += " AND employee_type = %s"
             params.append(employee_type)
         
-        # Add role-based filtering
-        if current_user['role'] == 'manager':
-            query += " AND manager_name = %s"
-            count_query += " AND manager_name = %s"
-            params.append(current_user['full_name'])
-        elif current_user['role'] == 'employee':
-            query += " AND email = %s"
-            count_query += " AND email = %s"
-            params.append(current_user['email'])
+        # Everyone reporting to a manager, at any depth
+        under = request.args.get('under', type=int)
+        if under:
+            subtree_query, subtree_params = subtree_sql(under)
+            query += subtree_query
+            count_query += subtree_query
+            params.extend(subtree_params)
+        
+        # Add role-based filtering: managers see their whole subtree
+        scope_query, scope_params = employee_scope_sql(current_user)
+        query += scope_query
+        count_query += scope_query
+        params.extend(scope_params)
         
         # Get total count
         cur.execute(count_query, params)
@@ -107,46 +122,69 @@ def get_employees(current_user):
             }
         }), 200
     
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        raise
     except Exception as e:
-        return jsonify({'message': str(e)}), 500
+        print(f"Employee request failed: {e}")
+        return jsonify({'message': 'Internal server error!'}), 500
+
+def load_employee_types():
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    
+    cur.execute("SELECT DISTINCT employee_type FROM employee_details WHERE employee_type IS NOT NULL")
+    types = [row['employee_type'] for row in cur.fetchall()]
+    
+    cur.close()
+    conn.close()
+    
+    return types
+
+def load_managers():
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    
+    cur.execute("SELECT id, employee_name FROM employee_details WHERE employee_type = 'Manager' ORDER BY employee_name, id")
+    rows = [dict(row) for row in cur.fetchall()]
+    
+    cur.close()
+    conn.close()
+    
+    return rows
 
 # Get employee types for filter dropdown
 @employee_bp.route('/employees/types', methods=['GET'])
 @token_required
 def get_employee_types(current_user):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cur.execute("SELECT DISTINCT employee_type FROM employee_details WHERE employee_type IS NOT NULL")
-        types = [row['employee_type'] for row in cur.fetchall()]
-        
-        cur.close()
-        conn.close()
+        types = employee_list_cache.get_or_set('types', load_employee_types)
         
         return jsonify({'types': types}), 200
     
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        raise
     except Exception as e:
-        return jsonify({'message': str(e)}), 500
+        print(f"Employee request failed: {e}")
+        return jsonify({'message': 'Internal server error!'}), 500
 
 # Get managers for dropdown
 @employee_bp.route('/employees/managers', methods=['GET'])
 @token_required
 def get_managers(current_user):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cur.execute("SELECT employee_name FROM employee_details WHERE employee_type = 'Manager'")
-        managers = [row['employee_name'] for row in cur.fetchall()]
-        
-        cur.close()
-        conn.close()
+        rows = employee_list_cache.get_or_set('managers', load_managers)
         
-        return jsonify({'managers': managers}), 200
+        # Names kept for older clients; manager_options carries the ids
+        return jsonify({
+            'managers': [row['employee_name'] for row in rows],
+            'manager_options': [{'id': row['id'], 'name': row['employee_name']} for row in rows]
+        }), 200
     
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        raise
     except Exception as e:
-        return jsonify({'message': str(e)}), 500
+        print(f"Employee request failed: {e}")
+        return jsonify({'message': 'Internal server error!'}), 500
 
 # Create a new employee
 @employee_bp.route('/employees', methods=['POST'])
@@ -176,17 +214,16 @@ def create_employee(current_user):
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
-        # For manager role, only allow assignment of employees to themselves
-        if current_user['role'] == 'manager' and data.get('manager_name') != current_user['full_name']:
-            data['manager_name'] = current_user['full_name']
+        # Managers may only assign employees within their own subtree
+        manager_id, manager_name = resolve_manager(cur, current_user, data)
         
-        # Insert new employee
+        # Insert new employee; the trigger adds it to the hierarchy
         cur.execute("""
             INSERT INTO employee_details (
                 employee_name, address, mobile_number, mobile_country_code,
                 whatsapp_number, whatsapp_country_code, email, employee_type,
-                manager_name
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id
+                manager_name, manager_id
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id
         """, (
             data['employee_name'],
             data['address'],
@@ -196,10 +233,12 @@ def create_employee(current_user):
             data.get('whatsapp_country_code', '+91'),
             data['email'],
             data['employee_type'],
-            data.get('manager_name')
+            manager_name,
+            manager_id
         ))
         
         new_id = cur.fetchone()['id']
+        invalidate('employee_lists', cur=cur)
         conn.commit()
         
         cur.close()
@@ -207,8 +246,11 @@ def create_employee(current_user):
         
         return jsonify({'message': 'Employee created successfully!', 'id': new_id}), 201
     
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        raise
     except Exception as e:
-        return jsonify({'message': str(e)}), 500
+        print(f"Employee request failed: {e}")
+        return jsonify({'message': 'Internal server error!'}), 500
 
 # Get a specific employee
 @employee_bp.route('/employees/<int:id>', methods=['GET'])
@@ -218,7 +260,12 @@ def get_employee(current_user, id):
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
-        cur.execute("SELECT * FROM employee_details WHERE id = %s", (id,))
+        # Check if user has permission to view this employee
+        scope_query, scope_params = employee_scope_sql(current_user)
+        cur.execute(f"""
+            SELECT *, EXISTS (SELECT 1 WHERE TRUE {scope_query}) AS in_scope
+            FROM employee_details WHERE id = %s
+        """, scope_params + [id])
         employee = cur.fetchone()
         
         cur.close()
@@ -227,49 +274,28 @@ def get_employee(current_user, id):
         if not employee:
             return jsonify({'message': 'Employee not found!'}), 404
         
-        # Check if user has permission to view this employee
-        if current_user['role'] == 'manager' and employee['manager_name'] != current_user['full_name']:
-            return jsonify({'message': 'Permission denied!'}), 403
-        
-        if current_user['role'] == 'employee' and employee['email'] != current_user['email']:
+        if not employee.pop('in_scope'):
             return jsonify({'message': 'Permission denied!'}), 403
         
         return jsonify({'employee': employee}), 200
     
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        raise
     except Exception as e:
-        return jsonify({'message': str(e)}), 500
+        print(f"Employee request failed: {e}")
+        return jsonify({'message': 'Internal server error!'}), 500
 
 # Update employee
 @employee_bp.route('/employees/<int:id>', methods=['PUT'])
 @token_required
 def update_employee(current_user, id):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Check if employee exists
-        cur.execute("SELECT * FROM employee_details WHERE id = %s", (id,))
-        employee = cur.fetchone()
-        
-        if not employee:
-            cur.close()
-            conn.close()
-            return jsonify({'message': 'Employee not found!'}), 404
-        
-        # Check permission
-        if current_user['role'] == 'manager' and employee['manager_name'] != current_user['full_name']:
-            cur.close()
-            conn.close()
-            return jsonify({'message': 'Permission denied!'}), 403
-        
-        if current_user['role'] == 'employee' and employee['email'] != current_user['email']:
-            cur.close()
-            conn.close()
-            return jsonify({'message': 'Permission denied!'}), 403
-        
-        # For employee role, only allow updating specific fields
         data = request.get_json()
         
+        # Permission is part of each statement's WHERE clause: managers only
+        # touch their subtree and employees only their own record
+        scope, scope_params = employee_scope_sql(current_user)
+        
         if current_user['role'] == 'employee':
             # Employees can only update their address and phone numbers
             allowed_fields = ['address', 'mobile_number', 'mobile_country_code', 
@@ -279,50 +305,36 @@ def update_employee(current_user, id):
             
             # Validate mobile numbers
             if 'mobile_number' in update_data and len(update_data['mobile_number']) != 10:
-                cur.close()
-                conn.close()
                 return jsonify({'message': 'Mobile number must be 10 digits!'}), 400
             
             if 'whatsapp_number' in update_data and len(update_data['whatsapp_number']) != 10:
-                cur.close()
-                conn.close()
                 return jsonify({'message': 'WhatsApp number must be 10 digits!'}), 400
             
             # Create SQL for update
             if update_data:
                 fields = ', '.join([f"{k} = %s" for k in update_data.keys()])
-                values = list(update_data.values())
-                values.append(id)
-                
-                cur.execute(f"UPDATE employee_details SET {fields} WHERE id = %s", values)
-                conn.commit()
+                query = f"UPDATE employee_details SET {fields} WHERE id = %s{scope} RETURNING id"
+                values = list(update_data.values()) + [id] + scope_params
+            else:
+                query = f"SELECT id FROM employee_details WHERE id = %s{scope}"
+                values = [id] + scope_params
         else:
             # Managers and admins can update all fields
             # Validate required fields
             required_fields = ['employee_name', 'address', 'mobile_number', 'email', 'employee_type']
             for field in required_fields:
                 if field not in data or not data[field]:
-                    cur.close()
-                    conn.close()
                     return jsonify({'message': f'{field} is required!'}), 400
             
             # Validate mobile numbers
             if len(data['mobile_number']) != 10:
-                cur.close()
-                conn.close()
                 return jsonify({'message': 'Mobile number must be 10 digits!'}), 400
             
             if len(data['whatsapp_number']) != 10:
-                cur.close()
-                conn.close()
                 return jsonify({'message': 'WhatsApp number must be 10 digits!'}), 400
             
-            # For manager role, only allow assignment of employees to themselves
-            if current_user['role'] == 'manager' and data.get('manager_name') != current_user['full_name']:
-                data['manager_name'] = current_user['full_name']
-            
             # Update employee
-            cur.execute("""
+            query = f"""
                 UPDATE employee_details SET
                     employee_name = %s,
                     address = %s,
@@ -332,9 +344,12 @@ def update_employee(current_user, id):
                     whatsapp_country_code = %s,
                     email = %s,
                     employee_type = %s,
-                    manager_name = %s
-                WHERE id = %s
-            """, (
+                    manager_name = %s,
+                    manager_id = %s
+                WHERE id = %s{scope}
+                RETURNING id
+            """
+            values = [
                 data['employee_name'],
                 data['address'],
                 data['mobile_number'],
@@ -343,18 +358,47 @@ def update_employee(current_user, id):
                 data.get('whatsapp_country_code', '+91'),
                 data['email'],
                 data['employee_type'],
-                data.get('manager_name'),
+                None,
+                None,
                 id
-            ))
-            conn.commit()
+            ] + scope_params
+        
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        
+        # Managers may only move employees within their own subtree; the
+        # trigger re-parents the employee's subtree in the hierarchy
+        if current_user['role'] != 'employee':
+            manager_id, manager_name = resolve_manager(cur, current_user, data)
+            values[8], values[9] = manager_name, manager_id
+        
+        cur.execute(query, values)
+        updated = cur.fetchone()
+        
+        if not updated:
+            # Only failed updates pay for the lookup that explains why
+            cur.execute("SELECT 1 FROM employee_details WHERE id = %s", (id,))
+            exists = cur.fetchone()
+            
+            cur.close()
+            conn.close()
+            
+            if not exists:
+                return jsonify({'message': 'Employee not found!'}), 404
+            return jsonify({'message': 'Permission denied!'}), 403
+        
+        invalidate('employee_lists', cur=cur)
         
         cur.close()
         conn.close()
         
         return jsonify({'message': 'Employee updated successfully!'}), 200
     
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        raise
     except Exception as e:
-        return jsonify({'message': str(e)}), 500
+        print(f"Employee request failed: {e}")
+        return jsonify({'message': 'Internal server error!'}), 500
 
 # Delete employee
 @employee_bp.route('/employees/<int:id>', methods=['DELETE'])
@@ -368,29 +412,35 @@ def delete_employee(current_user, id):
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
-        # Check if employee exists
-        cur.execute("SELECT * FROM employee_details WHERE id = %s", (id,))
-        employee = cur.fetchone()
-        
-        if not employee:
-            cur.close()
-            conn.close()
-            return jsonify({'message': 'Employee not found!'}), 404
-        
-        # Check permission for manager
-        if current_user['role'] == 'manager' and employee['manager_name'] != current_user['full_name']:
+        # Delete employee; managers may only delete within their subtree.
+        # Direct reports are left without a manager and the deleted
+        # record's hierarchy rows cascade away.
+        scope_query, scope_params = employee_scope_sql(current_user)
+        cur.execute(f"DELETE FROM employee_details WHERE id = %s {scope_query} RETURNING id",
+                    [id] + scope_params)
+        deleted = cur.fetchone()
+        
+        if not deleted:
+            # Only failed deletes pay for the lookup that explains why
+            cur.execute("SELECT 1 FROM employee_details WHERE id = %s", (id,))
+            exists = cur.fetchone()
+            
             cur.close()
             conn.close()
+            
+            if not exists:
+                return jsonify({'message': 'Employee not found!'}), 404
             return jsonify({'message': 'Permission denied!'}), 403
         
-        # Delete employee
-        cur.execute("DELETE FROM employee_details WHERE id = %s", (id,))
-        conn.commit()
+        invalidate('employee_lists', cur=cur)
         
         cur.close()
         conn.close()
         
         return jsonify({'message': 'Employee deleted successfully!'}), 200
     
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        raise
     except Exception as e:
-        return jsonify({'message': str(e)}), 500
+        print(f"Employee request failed: {e}")
+        return jsonify({'message': 'Internal server error!'}), 500
@@ -0,0 +1,91 @@
+import os
+from flask import Blueprint, request, jsonify, send_file
+from psycopg2.extras import RealDictCursor
+from db_config import get_db_connection
+from ..utils.auth_utils import user_required
+from ..services import import_service
+
+import_bp = Blueprint('import_bp', __name__)
+
+# Roles allowed to bulk import each entity (same as the single-row forms)
+IMPORT_ROLES = {
+    'clients': ('admin', 'manager', 'distributor', 'employee'),
+    'distributors': ('admin', 'manager'),
+}
+
+# Multipart upload with a "file" CSV whose header uses the form field names
+@import_bp.route('/api/import/<entity>', methods=['POST'])
+@user_required
+def import_csv(current_user, entity):
+    if entity not in IMPORT_ROLES:
+        return jsonify({'message': 'Unknown import type!'}), 404
+
+    if current_user['role'] not in IMPORT_ROLES[entity]:
+        return jsonify({'message': 'Unauthorized!'}), 403
+
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return jsonify({'message': 'No file uploaded!'}), 400
+
+    if not file.filename.lower().endswith('.csv'):
+        return jsonify({'message': 'Only .csv files are allowed!'}), 400
+
+    try:
+        result = import_service.run_import(entity, file.stream, file.filename, current_user)
+    except (import_service.CsvImportError, UnicodeDecodeError) as e:
+        return jsonify({'message': str(e)}), 400
+
+    if result['errors']:
+        result['error_report'] = f"/api/import/{result['import_id']}/errors"
+
+    return jsonify(result), 201
+
+# Past imports by the caller (all imports for admins)
+@import_bp.route('/api/import', methods=['GET'])
+@user_required
+def list_imports(current_user):
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+
+    query = '''
+        SELECT import_id, entity, file_name, total_rows, inserted_rows, failed_rows,
+               error_file IS NOT NULL AS has_errors, created_by, created_at
+        FROM data_import
+    '''
+    params = []
+    if current_user['role'] != 'admin':
+        query += ' WHERE created_by = %s'
+        params.append(current_user['user_id'])
+    query += ' ORDER BY created_at DESC LIMIT 100'
+
+    cur.execute(query, params)
+    imports = cur.fetchall()
+
+    cur.close()
+    conn.close()
+
+    return jsonify(imports)
+
+# Download the per-row error report of an import
+@import_bp.route('/api/import/<int:import_id>/errors', methods=['GET'])
+@user_required
+def download_import_errors(current_user, import_id):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT error_file, created_by FROM data_import WHERE import_id = %s', (import_id,))
+    row = cur.fetchone()
+    cur.close()
+    conn.close()
+
+    if not row:
+        return jsonify({'message': 'Import not found!'}), 404
+
+    error_file, created_by = row
+    if current_user['role'] != 'admin' and created_by != current_user['user_id']:
+        return jsonify({'message': 'Unauthorized!'}), 403
+
+    if not error_file or not os.path.exists(error_file):
+        return jsonify({'message': 'No error report for this import!'}), 404
+
+    return send_file(error_file, mimetype='text/csv', as_attachment=True,
+                     download_name=f'import_{import_id}_errors.csv')
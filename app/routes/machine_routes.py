@@ -0,0 +1,130 @@
+import os
+import time
+from flask import Blueprint, request, jsonify, send_file
+from db_config import get_db_connection
+from ..utils.auth_utils import user_required
+from ..utils import metrics
+from ..services import machine_service, telemetry
+from ..services.scope_service import visible_client_ids
+from ..utils import cache
+from ..utils.cache import TTLCache
+
+machine_bp = Blueprint('machine_bp', __name__)
+
+# Visible client ids per user, so scoped scans don't pay for the scope query.
+# Cleared on every worker when clients or distributors change.
+SCOPE_TTL = 60
+scope_cache = cache.register(TTLCache('scan_scope', maxsize=10000, ttl=SCOPE_TTL))
+
+# Roles that may register machines
+REGISTER_ROLES = ('admin', 'manager', 'distributor')
+
+# Register up to MAX_BATCH machines in one request. Body: either
+# {"machines": [{machine_name, type_of_machine, type_of_metal, client_id}, ...]}
+# or {"count", "machine_name_prefix", ...}, with batch-level defaults for
+# type_of_machine, type_of_metal and client_id.
+@machine_bp.route('/api/machines/bulk', methods=['POST'])
+@user_required
+def register_machines(current_user):
+    if current_user['role'] not in REGISTER_ROLES:
+        return jsonify({'message': 'Unauthorized!'}), 403
+
+    data = request.get_json(silent=True) or {}
+    started = time.perf_counter()
+
+    try:
+        names, types, metals, client_ids = machine_service.validate_batch(data)
+
+        allowed = visible_client_ids(current_user)
+        if allowed is not None and not set(client_ids) <= allowed:
+            return jsonify({'message': 'Unauthorized client!'}), 403
+
+        batch_id, machines = machine_service.register_batch(
+            names, types, metals, client_ids, current_user['user_id']
+        )
+    except machine_service.MachineBatchError as e:
+        return jsonify({'message': str(e)}), 400
+
+    metrics.record_timing('machines.bulk_register', time.perf_counter() - started)
+    metrics.increment('machines.registered', len(machines))
+
+    return jsonify({
+        'batch_id': batch_id,
+        'count': len(machines),
+        'machines': machines,
+        'labels': f'/api/machines/batches/{batch_id}/labels'
+    }), 201
+
+# Issue (or rotate) the key a machine's sensor posts telemetry with. The key
+# is returned once; the printed unique_code alone is not enough to post.
+@machine_bp.route('/api/machines/<int:machine_id>/telemetry-key', methods=['POST'])
+@user_required
+def issue_telemetry_key(current_user, machine_id):
+    if current_user['role'] not in REGISTER_ROLES:
+        return jsonify({'message': 'Unauthorized!'}), 403
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT client_id FROM machine WHERE machine_id = %s', (machine_id,))
+    machine = cur.fetchone()
+    cur.close()
+    conn.close()
+
+    allowed = visible_client_ids(current_user)
+    if not machine or (allowed is not None and machine[0] not in allowed):
+        return jsonify({'message': 'Machine not found!'}), 404
+
+    issued = telemetry.issue_device_key(machine_id)
+    if issued is None:
+        return jsonify({'message': 'Machine not found!'}), 404
+
+    unique_code, device_key = issued
+    return jsonify({'machine_id': machine_id, 'unique_code': unique_code, 'device_key': device_key}), 201
+
+# Printable QR label sheet of a batch (202 while the worker renders it)
+@machine_bp.route('/api/machines/batches/<int:batch_id>/labels', methods=['GET'])
+@user_required
+def get_batch_labels(current_user, batch_id):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('''
+        SELECT label_status, label_file, created_by
+        FROM machine_batch WHERE batch_id = %s
+    ''', (batch_id,))
+    batch = cur.fetchone()
+    cur.close()
+    conn.close()
+
+    if not batch:
+        return jsonify({'message': 'Batch not found!'}), 404
+
+    label_status, label_file, created_by = batch
+    if current_user['role'] != 'admin' and created_by != current_user['user_id']:
+        return jsonify({'message': 'Unauthorized!'}), 403
+
+    if label_status != 'ready' or not label_file or not os.path.exists(label_file):
+        return jsonify({'message': 'Label sheet is being generated, retry later!'}), 202, {'Retry-After': '5'}
+
+    return send_file(label_file, mimetype='text/html', download_name=f'machine_labels_{batch_id}.html')
+
+# Everything the reading form needs after a QR scan, in one call
+@machine_bp.route('/api/machines/scan/<unique_code>', methods=['GET'])
+@user_required
+def scan_machine(current_user, unique_code):
+    started = time.perf_counter()
+
+    machine = machine_service.resolve_scan(unique_code)
+    if machine is None:
+        return jsonify({'message': 'Machine not found!'}), 404
+
+    # Wrapped in a tuple since None (unrestricted) would read as a cache miss
+    allowed, = scope_cache.get_or_set(
+        (current_user['user_id'], current_user['role']),
+        lambda: (visible_client_ids(current_user),)
+    )
+    if allowed is not None and machine['client_id'] not in allowed:
+        return jsonify({'message': 'Machine not found!'}), 404
+
+    metrics.record_timing('machines.scan', time.perf_counter() - started)
+
+    return jsonify(machine)
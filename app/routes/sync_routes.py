@@ -0,0 +1,28 @@
+from flask import Blueprint, request, jsonify
+from ..utils.auth_utils import user_required
+from ..services import sync_service
+
+sync_bp = Blueprint('sync_bp', __name__)
+
+# Delta sync for offline devices. Call without a token for the initial
+# download, then keep passing back sync_token; while has_more is true there
+# is another batch waiting. Each entity comes back as
+# {"columns": [...], "rows": [[...]], "deleted": [ids]}.
+@sync_bp.route('/api/sync', methods=['GET'])
+@user_required
+def sync_changes(current_user):
+    try:
+        limit = int(request.args.get('limit', sync_service.DEFAULT_BATCH))
+    except ValueError:
+        return jsonify({'message': 'limit must be a number!'}), 400
+    limit = max(1, min(limit, sync_service.MAX_BATCH))
+
+    try:
+        result = sync_service.sync(current_user, request.args.get('token'), limit)
+    except sync_service.SyncTokenError as e:
+        return jsonify({'message': str(e)}), 400
+    except sync_service.SyncTokenExpired:
+        # The log no longer reaches back this far; start over without a token
+        return jsonify({'message': 'Sync token expired, full resync required!', 'resync': True}), 410
+
+    return jsonify(result)
@@ -0,0 +1,71 @@
+import time
+from flask import Blueprint, request, jsonify
+from ..utils.auth_utils import user_required
+from ..utils import metrics
+from ..services import telemetry
+
+telemetry_bp = Blueprint('telemetry_bp', __name__)
+
+# Errors echoed back per request
+MAX_ERRORS = 100
+
+# Sensor messages: JSON (one message or {"messages": [...]}) or text/plain
+# line protocol. Sensors send their machine's device key (issued by
+# POST /api/machines/<id>/telemetry-key) in X-Device-Key; a gateway key
+# from TELEMETRY_GATEWAY_KEYS may post for any machine.
+@telemetry_bp.route('/api/telemetry', methods=['POST'])
+def ingest_telemetry():
+    device_key = request.headers.get('X-Device-Key', '')
+    if not device_key:
+        return jsonify({'message': 'X-Device-Key is missing!'}), 401
+    trusted = telemetry.is_gateway_key(device_key)
+
+    received_at = time.time()
+    rows = []
+    errors = []
+    unauthorized = False
+
+    if request.mimetype == 'text/plain':
+        items = [line for line in request.get_data(as_text=True).splitlines() if line.strip()]
+        parse = lambda item: telemetry.parse_line(item, received_at, device_key, trusted)
+    else:
+        data = request.get_json(silent=True)
+        if data is None:
+            return jsonify({'message': 'Expected JSON or text/plain body!'}), 400
+        items = data.get('messages', [data]) if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            return jsonify({'message': 'Expected a message, a list of messages or {"messages": [...]}!'}), 400
+        parse = lambda item: telemetry.parse_message(item, received_at, device_key, trusted)
+
+    for index, item in enumerate(items):
+        try:
+            rows.append(parse(item))
+        except (telemetry.TelemetryError, ValueError, AttributeError) as e:
+            unauthorized = unauthorized or isinstance(e, telemetry.TelemetryAuthError)
+            if len(errors) < MAX_ERRORS:
+                errors.append({'index': index, 'error': str(e)})
+
+    if not rows:
+        if unauthorized:
+            return jsonify({'message': 'Invalid unique_code or device key!', 'errors': errors}), 401
+        return jsonify({'message': 'No valid telemetry!', 'errors': errors}), 400
+
+    telemetry.buffer.start()
+    if not telemetry.buffer.offer(rows):
+        # Buffer full: the flusher is behind, tell the sensor to back off
+        return jsonify({'message': 'Telemetry buffer is full, retry later!'}), 503, {'Retry-After': '1'}
+
+    return jsonify({'accepted': len(rows), 'rejected': len(items) - len(rows), 'errors': errors}), 202
+
+# Buffer depth and flush statistics
+@telemetry_bp.route('/api/telemetry/stats', methods=['GET'])
+@user_required
+def telemetry_stats(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized!'}), 403
+
+    return jsonify({
+        'buffered': telemetry.buffer.size(),
+        'max_buffer': telemetry.buffer.max_size,
+        **metrics.snapshot('telemetry.')
+    })
@@ -0,0 +1,2 @@
+
+# This file is needed to make the directory a Python package
@@ -0,0 +1,193 @@
+import threading
+import time
+from bisect import bisect_left, bisect_right
+import psycopg2.extras
+from db_config import get_db_connection
+from app.utils import metrics
+
+METRICS = ('oil_refractometer', 'oil_ph_level', 'water_ph_level', 'oil_top_up', 'water_input')
+LOWER_OPERATORS = ('<', '<=')
+UPPER_OPERATORS = ('>', '>=')
+
+# Rules are reloaded at least this often so edits on other workers show up
+RELOAD_INTERVAL = 30
+
+
+def normalize(value):
+    return value.strip().lower() if isinstance(value, str) and value.strip() else None
+
+
+# Thresholds for one metric, sorted so violated rules are found by bisection
+class MetricThresholds:
+    def __init__(self, rules):
+        lower = sorted((r for r in rules if r['operator'] in LOWER_OPERATORS), key=lambda r: r['threshold'])
+        upper = sorted((r for r in rules if r['operator'] in UPPER_OPERATORS), key=lambda r: r['threshold'])
+        self.lower_rules = lower
+        self.lower_thresholds = [r['threshold'] for r in lower]
+        self.upper_rules = upper
+        self.upper_thresholds = [r['threshold'] for r in upper]
+
+    def violations(self, value):
+        hits = []
+
+        # value < t (or <= t): only rules with t >= value can fire
+        for rule in self.lower_rules[bisect_left(self.lower_thresholds, value):]:
+            if value < rule['threshold'] or rule['operator'] == '<=':
+                hits.append(rule)
+
+        # value > t (or >= t): only rules with t <= value can fire
+        for rule in self.upper_rules[:bisect_right(self.upper_thresholds, value)]:
+            if value > rule['threshold'] or rule['operator'] == '>=':
+                hits.append(rule)
+
+        return hits
+
+
+# Compiled rules for one machine: metric -> MetricThresholds
+class CompiledRuleSet:
+    def __init__(self, rules):
+        by_metric = {}
+        for rule in rules:
+            by_metric.setdefault(rule['metric'], []).append(rule)
+        self.metrics = {metric: MetricThresholds(metric_rules) for metric, metric_rules in by_metric.items()}
+
+    def evaluate(self, reading):
+        alerts = []
+        for metric, thresholds in self.metrics.items():
+            try:
+                value = float(reading.get(metric))
+            except (TypeError, ValueError):
+                continue
+            for rule in thresholds.violations(value):
+                alerts.append((rule, metric, value))
+        return alerts
+
+
+EMPTY_RULE_SET = CompiledRuleSet([])
+
+
+# Rule index with per-machine compiled rule sets. Machines with the same
+# applicable rules share one compiled set.
+class AlertRuleEngine:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded_at = 0.0
+        self._rules_by_scope = {}
+        self._machines = {}
+        self._compiled = {}
+        self._interned = {}
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = 0.0
+
+    def _load(self):
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+
+        cur.execute('''
+            SELECT rule_id, rule_name, client_id, type_of_metal, type_of_machine, machine_id,
+                   metric, operator, threshold, severity
+            FROM alert_rule WHERE is_active
+        ''')
+        rules = cur.fetchall()
+
+        cur.execute('SELECT machine_id, client_id, type_of_metal, type_of_machine FROM machine')
+        machines = {
+            row['machine_id']: (row['client_id'], normalize(row['type_of_metal']), row['type_of_machine'])
+            for row in cur.fetchall()
+        }
+
+        cur.close()
+        conn.close()
+
+        rules_by_scope = {}
+        for rule in rules:
+            key = (rule['machine_id'], rule['client_id'], normalize(rule['type_of_metal']), rule['type_of_machine'])
+            rules_by_scope.setdefault(key, []).append(rule)
+
+        self._rules_by_scope = rules_by_scope
+        self._machines = machines
+        self._compiled = {}
+        self._interned = {}
+        self._loaded_at = time.time()
+
+    def _ensure_loaded(self):
+        if time.time() - self._loaded_at > RELOAD_INTERVAL:
+            with self._lock:
+                if time.time() - self._loaded_at > RELOAD_INTERVAL:
+                    self._load()
+
+    def _machine_attributes(self, machine_id):
+        attributes = self._machines.get(machine_id)
+        if attributes is None:
+            # Machine registered after the last load
+            conn = get_db_connection()
+            cur = conn.cursor()
+            cur.execute('SELECT client_id, type_of_metal, type_of_machine FROM machine WHERE machine_id = %s', (machine_id,))
+            row = cur.fetchone()
+            cur.close()
+            conn.close()
+            if row is None:
+                return None
+            attributes = (row[0], normalize(row[1]), row[2])
+            self._machines[machine_id] = attributes
+        return attributes
+
+    def rule_set_for(self, machine_id):
+        compiled = self._compiled.get(machine_id)
+        if compiled is not None:
+            return compiled
+
+        attributes = self._machine_attributes(machine_id)
+        if attributes is None:
+            return EMPTY_RULE_SET
+
+        # Each scope field either matches the machine or is a wildcard
+        client_id, metal, machine_type = attributes
+        rules = []
+        for scope_machine in (machine_id, None):
+            for scope_client in (client_id, None):
+                for scope_metal in (metal, None):
+                    for scope_type in (machine_type, None):
+                        rules.extend(self._rules_by_scope.get((scope_machine, scope_client, scope_metal, scope_type), ()))
+
+        key = tuple(sorted(rule['rule_id'] for rule in rules))
+        compiled = self._interned.get(key)
+        if compiled is None:
+            compiled = self._interned[key] = CompiledRuleSet(rules) if rules else EMPTY_RULE_SET
+        self._compiled[machine_id] = compiled
+        return compiled
+
+    # Alerts for a list of reading dicts (each with reading_id and machine_id)
+    def evaluate(self, readings):
+        self._ensure_loaded()
+        started = time.perf_counter()
+
+        alerts = []
+        for reading in readings:
+            for rule, metric, value in self.rule_set_for(reading['machine_id']).evaluate(reading):
+                alerts.append((
+                    reading['reading_id'], reading['machine_id'], rule['rule_id'], metric, value,
+                    rule['operator'], rule['threshold'], rule['severity']
+                ))
+
+        if readings:
+            metrics.record_timing('alert_rules.evaluate_per_reading', (time.perf_counter() - started) / len(readings))
+        metrics.increment('alert_rules.readings', len(readings))
+        metrics.increment('alert_rules.alerts', len(alerts))
+        return alerts
+
+
+engine = AlertRuleEngine()
+
+
+# Evaluate readings and store any alerts using the caller's cursor
+def evaluate_and_record(cur, readings):
+    alerts = engine.evaluate(readings)
+    if alerts:
+        psycopg2.extras.execute_values(cur, '''
+            INSERT INTO reading_alert (reading_id, machine_id, rule_id, metric, value, operator, threshold, severity)
+            VALUES %s
+        ''', alerts, page_size=1000)
+    return alerts
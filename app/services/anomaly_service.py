@@ -0,0 +1,206 @@
+import datetime
+import numpy as np
+import psycopg2.extras
+from db_config import get_db_connection
+from app.utils.pg_columns import fetch_columns
+
+METRICS = ('oil_refractometer', 'oil_ph_level', 'water_ph_level')
+
+# Machines loaded per query
+BATCH_SIZE = 5000
+
+# Rolling z-score: window of previous readings and flag threshold
+ZSCORE_WINDOW = 30
+ZSCORE_MIN_HISTORY = 20
+ZSCORE_THRESHOLD = 4.5
+
+# EWMA drift: smoothing factor and threshold in baseline standard deviations
+EWMA_ALPHA = 0.2
+DRIFT_BASELINE = 30
+DRIFT_THRESHOLD = 3.0
+
+# Two-sided CUSUM change-point detection on standardized values
+CUSUM_SLACK = 1.0
+CUSUM_THRESHOLD = 10.0
+
+
+# Position of every element within its machine's run. machine_ids must be
+# sorted so each machine's readings are contiguous.
+def group_layout(machine_ids):
+    n = len(machine_ids)
+    if n == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    boundaries = np.flatnonzero(np.diff(machine_ids)) + 1
+    starts = np.concatenate(([0], boundaries))
+    lengths = np.diff(np.concatenate((starts, [n])))
+    positions = np.arange(n) - np.repeat(starts, lengths)
+    return starts, lengths, positions
+
+
+# Z-score of each value against the previous `window` values of the same
+# machine, via cumulative sums so the whole fleet is one vector operation.
+def rolling_zscores(values, starts, lengths, positions, window=ZSCORE_WINDOW, min_history=ZSCORE_MIN_HISTORY):
+    valid = ~np.isnan(values)
+    x = np.where(valid, values, 0.0)
+
+    csum = np.concatenate(([0.0], np.cumsum(x)))
+    csq = np.concatenate(([0.0], np.cumsum(x * x)))
+    ccount = np.concatenate(([0], np.cumsum(valid)))
+
+    index = np.arange(len(values))
+    group_start = np.repeat(starts, lengths)
+    lo = np.maximum(index - window, group_start)
+
+    count = ccount[index] - ccount[lo]
+    total = csum[index] - csum[lo]
+    total_sq = csq[index] - csq[lo]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        variance = np.maximum(total_sq / count - mean * mean, 0.0)
+        std = np.sqrt(variance)
+        z = (values - mean) / std
+
+    z[(count < min_history) | ~valid | (std == 0)] = np.nan
+    return z
+
+
+# EWMA drift and CUSUM statistics for each machine's series. Both are
+# recursive, so this steps through reading positions while vectorizing
+# across all machines at each step.
+def drift_and_changepoints(values, starts, lengths, positions):
+    n = len(values)
+    machines = len(starts)
+    drift = np.full(n, np.nan)
+    cusum = np.full(n, np.nan)
+
+    if n == 0:
+        return drift, cusum
+
+    # Baseline mean/std from each machine's first readings
+    machine_index = np.repeat(np.arange(machines), lengths)
+    in_baseline = (positions < DRIFT_BASELINE) & ~np.isnan(values)
+    baseline_of = machine_index[in_baseline]
+    baseline_values = values[in_baseline]
+    counts = np.bincount(baseline_of, minlength=machines)
+    sums = np.bincount(baseline_of, weights=baseline_values, minlength=machines)
+    squares = np.bincount(baseline_of, weights=baseline_values ** 2, minlength=machines)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        baseline_mean = sums / counts
+        baseline_std = np.sqrt(np.maximum(squares / counts - baseline_mean ** 2, 0.0))
+    baseline_std[baseline_std == 0] = np.nan
+
+    ewma = np.full(n, np.nan)
+    level = np.full(machines, np.nan)
+    high = np.zeros(machines)
+    low = np.zeros(machines)
+
+    for k in range(int(lengths.max())):
+        active = np.flatnonzero(lengths > k)
+        idx = starts[active] + k
+        v = values[idx]
+        missing = np.isnan(v)
+
+        previous = level[active]
+        current = np.where(np.isnan(previous), v, EWMA_ALPHA * v + (1 - EWMA_ALPHA) * previous)
+        current = np.where(missing, previous, current)
+        level[active] = current
+        ewma[idx] = current
+
+        with np.errstate(invalid='ignore'):
+            standardized = (v - baseline_mean[active]) / baseline_std[active]
+        standardized = np.where(np.isnan(standardized), 0.0, standardized)
+        high[active] = np.maximum(0.0, high[active] + standardized - CUSUM_SLACK)
+        low[active] = np.maximum(0.0, low[active] - standardized - CUSUM_SLACK)
+        cusum[idx] = np.maximum(high[active], low[active])
+
+        # Restart after a detected change so later shifts are found too
+        reset = active[cusum[idx] > CUSUM_THRESHOLD]
+        high[reset] = 0.0
+        low[reset] = 0.0
+
+    with np.errstate(invalid='ignore'):
+        drift = (ewma - baseline_mean[machine_index]) / baseline_std[machine_index]
+    drift[positions < DRIFT_BASELINE] = np.nan
+
+    return drift, cusum
+
+
+# Score every machine's series; returns a list of flag tuples
+# (reading_id, machine_id, metric, kind, score)
+def score_series(columns):
+    order = np.lexsort((columns['created_at'], columns['machine_id']))
+    machine_ids = columns['machine_id'][order]
+    reading_ids = columns['reading_id'][order]
+    starts, lengths, positions = group_layout(machine_ids)
+
+    flags = []
+    for metric in METRICS:
+        values = columns[metric][order]
+
+        z = rolling_zscores(values, starts, lengths, positions)
+        drift, cusum = drift_and_changepoints(values, starts, lengths, positions)
+
+        for kind, scores, threshold in (
+            ('zscore', z, ZSCORE_THRESHOLD),
+            ('drift', drift, DRIFT_THRESHOLD),
+            ('changepoint', cusum, CUSUM_THRESHOLD)
+        ):
+            with np.errstate(invalid='ignore'):
+                hits = np.flatnonzero(np.abs(scores) > threshold)
+            flags.extend(zip(
+                reading_ids[hits].tolist(), machine_ids[hits].tolist(),
+                [metric] * len(hits), [kind] * len(hits),
+                np.round(scores[hits], 4).tolist()
+            ))
+
+    return flags
+
+
+# Load one batch of machines' readings as columns with a single COPY
+def load_batch(cur, machine_ids, since):
+    return fetch_columns(cur, '''
+        SELECT machine_id, reading_id,
+               EXTRACT(EPOCH FROM created_at)::float8,
+               COALESCE(oil_refractometer, 'NaN'),
+               COALESCE(oil_ph_level, 'NaN'),
+               COALESCE(water_ph_level, 'NaN')
+        FROM reading
+        WHERE machine_id = ANY(%s) AND created_at >= %s AND status <> 'Not In Use'
+    ''', (machine_ids, since), [
+        ('machine_id', 'i4'), ('reading_id', 'i4'), ('created_at', 'f8'),
+        ('oil_refractometer', 'f8'), ('oil_ph_level', 'f8'), ('water_ph_level', 'f8')
+    ])
+
+
+def save_flags(cur, flags):
+    psycopg2.extras.execute_values(cur, '''
+        INSERT INTO reading_anomaly (reading_id, machine_id, metric, kind, score)
+        VALUES %s
+        ON CONFLICT (reading_id, metric, kind) DO UPDATE SET score = EXCLUDED.score
+    ''', flags, page_size=1000)
+
+
+# Score the whole fleet over the last `days` days and persist the flags
+def score_fleet(days=365, batch_size=BATCH_SIZE):
+    since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days)
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    cur.execute('SELECT machine_id FROM machine ORDER BY machine_id')
+    machine_ids = [row[0] for row in cur.fetchall()]
+
+    flagged = 0
+    for i in range(0, len(machine_ids), batch_size):
+        columns = load_batch(cur, machine_ids[i:i + batch_size], since)
+        flags = score_series(columns)
+        if flags:
+            save_flags(cur, flags)
+        flagged += len(flags)
+
+    cur.close()
+    conn.close()
+
+    return {'machines': len(machine_ids), 'flags': flagged}
@@ -0,0 +1,263 @@
+import argparse
+import datetime
+import json
+import os
+import shutil
+import numpy as np
+from db_config import get_db_connection
+from app.utils.pg_columns import fetch_columns
+
+ARCHIVE_DIR = os.getenv(
+    'COLUMNAR_ARCHIVE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'archive', 'columnar')
+)
+MANIFEST = 'manifest.json'
+
+STATUS_CODES = {'Pending': 0, 'Completed': 1, 'Not In Use': 2, 'Telemetry': 3}
+
+# Statuses without a code come out as -1 and stop the export
+UNKNOWN_STATUS = -1
+
+# Column name -> (SQL expression, type). Missing ids are stored as -1 and
+# missing measurements / timestamps as NaN.
+COLUMNS = {
+    'reading_id': ('r.reading_id::int8', 'i8'),
+    'machine_id': ('COALESCE(r.machine_id, -1)', 'i4'),
+    'client_id': ('COALESCE(m.client_id, -1)', 'i4'),
+    'distributor_id': ('COALESCE(m.distributor_id, -1)', 'i4'),
+    'response_by': ('COALESCE(r.response_by, -1)', 'i4'),
+    'status': (
+        'CASE r.status::text '
+        + ' '.join(f"WHEN '{status}' THEN {code}" for status, code in STATUS_CODES.items())
+        + f' ELSE {UNKNOWN_STATUS} END',
+        'i4'
+    ),
+    'created_at': ('EXTRACT(EPOCH FROM r.created_at)::float8', 'f8'),
+    'response_at': ("COALESCE(EXTRACT(EPOCH FROM r.response_timestamp)::float8, 'NaN')", 'f8'),
+    'oil_refractometer': ("COALESCE(r.oil_refractometer, 'NaN')", 'f8'),
+    'oil_ph_level': ("COALESCE(r.oil_ph_level, 'NaN')", 'f8'),
+    'water_ph_level': ("COALESCE(r.water_ph_level, 'NaN')", 'f8'),
+    'oil_top_up': ("COALESCE(r.oil_top_up, 'NaN')", 'f8'),
+    'water_input': ("COALESCE(r.water_input, 'NaN')", 'f8'),
+    'post_oil_refractometer': ("COALESCE(r.post_oil_refractometer, 'NaN')", 'f8'),
+    'post_oil_ph_level': ("COALESCE(r.post_oil_ph_level, 'NaN')", 'f8'),
+    'post_oil_top_up': ("COALESCE(r.post_oil_top_up, 'NaN')", 'f8'),
+    'post_water': ("COALESCE(r.post_water, 'NaN')", 'f8'),
+    'post_water_ph_level': ("COALESCE(r.post_water_ph_level, 'NaN')", 'f8'),
+}
+
+# Months younger than this are re-exported on every snapshot because
+# readings in them can still get responses
+OPEN_MONTHS = 2
+
+# Rows processed per step by the query helpers
+CHUNK_ROWS = 1 << 20
+
+AGGREGATES = ('count', 'sum', 'mean', 'min', 'max')
+
+
+def month_key(month_start):
+    return month_start.strftime('%Y-%m')
+
+
+def next_month(month_start):
+    return (month_start.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+def load_manifest(archive_dir=ARCHIVE_DIR):
+    path = os.path.join(archive_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {'columns': {}, 'months': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, archive_dir=ARCHIVE_DIR):
+    path = os.path.join(archive_dir, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+# Write one month as one .npy file per column. Files go to a temporary
+# directory that replaces the old month in one rename.
+def export_month(cur, month_start, archive_dir=ARCHIVE_DIR):
+    select = ', '.join(expression for expression, _ in COLUMNS.values())
+    columns = fetch_columns(cur, f'''
+        SELECT {select}
+        FROM reading r
+        LEFT JOIN machine m ON m.machine_id = r.machine_id
+        WHERE r.created_at >= %s AND r.created_at < %s
+        ORDER BY r.created_at, r.reading_id
+    ''', (month_start, next_month(month_start)), [(name, kind) for name, (_, kind) in COLUMNS.items()])
+
+    if (columns['status'] == UNKNOWN_STATUS).any():
+        raise ValueError(
+            f'{month_key(month_start)}: readings with a status missing from STATUS_CODES; '
+            'add a code before archiving'
+        )
+
+    month_dir = os.path.join(archive_dir, month_key(month_start))
+    temp_dir = month_dir + '.tmp'
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    for name, values in columns.items():
+        np.save(os.path.join(temp_dir, f'{name}.npy'), values)
+
+    old_dir = month_dir + '.old'
+    if os.path.exists(month_dir):
+        os.replace(month_dir, old_dir)
+    os.replace(temp_dir, month_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    created_at = columns['created_at']
+    return {
+        'rows': int(len(created_at)),
+        'min_created_at': float(created_at.min()) if len(created_at) else None,
+        'max_created_at': float(created_at.max()) if len(created_at) else None,
+        'exported_at': datetime.datetime.now(datetime.timezone.utc).isoformat()
+    }
+
+
+# Bring the archive up to date: closed months already in the manifest are
+# kept, open months and anything missing are (re)exported
+def snapshot(archive_dir=ARCHIVE_DIR, full=False):
+    os.makedirs(archive_dir, exist_ok=True)
+    manifest = load_manifest(archive_dir)
+    manifest['columns'] = {name: kind for name, (_, kind) in COLUMNS.items()}
+    # Months written with other status codes are re-exported
+    if manifest.get('status_codes', STATUS_CODES) != STATUS_CODES:
+        full = True
+    manifest['status_codes'] = STATUS_CODES
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    cur.execute('SELECT MIN(created_at)::date FROM reading')
+    first = cur.fetchone()[0]
+    exported = []
+
+    if first is not None:
+        current = datetime.date.today().replace(day=1)
+        open_from = current
+        for _ in range(OPEN_MONTHS - 1):
+            open_from = (open_from - datetime.timedelta(days=1)).replace(day=1)
+
+        month_start = first.replace(day=1)
+        while month_start <= current:
+            key = month_key(month_start)
+            if full or month_start >= open_from or key not in manifest['months']:
+                manifest['months'][key] = export_month(cur, month_start, archive_dir)
+                save_manifest(manifest, archive_dir)
+                exported.append(key)
+            month_start = next_month(month_start)
+
+    cur.close()
+    conn.close()
+
+    save_manifest(manifest, archive_dir)
+    return exported
+
+
+# Months overlapping [start, end), as memory-mapped column dicts. Nothing
+# is read until a slice of a column is touched.
+def open_months(start, end, columns, archive_dir=ARCHIVE_DIR):
+    manifest = load_manifest(archive_dir)
+    start_epoch, end_epoch = start.timestamp(), end.timestamp()
+
+    for key in sorted(manifest['months']):
+        info = manifest['months'][key]
+        if not info['rows'] or info['max_created_at'] < start_epoch or info['min_created_at'] >= end_epoch:
+            continue
+        month_dir = os.path.join(archive_dir, key)
+        yield {name: np.load(os.path.join(month_dir, f'{name}.npy'), mmap_mode='r') for name in columns}
+
+
+# Chunks of the requested columns for rows in [start, end) matching
+# `filters` ({column: value or list of values}). Rows within a month are
+# sorted by created_at, so the time range is found by binary search.
+def scan(start, end, columns, filters=None, archive_dir=ARCHIVE_DIR, chunk_rows=CHUNK_ROWS):
+    filters = filters or {}
+    needed = set(columns) | set(filters) | {'created_at'}
+    start_epoch, end_epoch = start.timestamp(), end.timestamp()
+
+    for month in open_months(start, end, needed, archive_dir):
+        created_at = month['created_at']
+        lo = int(np.searchsorted(created_at, start_epoch, side='left'))
+        hi = int(np.searchsorted(created_at, end_epoch, side='left'))
+
+        for chunk_start in range(lo, hi, chunk_rows):
+            chunk_end = min(chunk_start + chunk_rows, hi)
+            mask = None
+            for name, wanted in filters.items():
+                values = month[name][chunk_start:chunk_end]
+                match = np.isin(values, np.atleast_1d(wanted))
+                mask = match if mask is None else mask & match
+
+            chunk = {}
+            for name in columns:
+                values = month[name][chunk_start:chunk_end]
+                chunk[name] = np.asarray(values[mask] if mask is not None else values)
+            yield chunk
+
+
+# Grouped aggregate of `value` over [start, end), e.g.
+#   aggregate(start, end, 'oil_ph_level', 'mean', group_by='machine_id')
+# NaN values are skipped. Returns {group: result}, or the single result
+# when group_by is None.
+def aggregate(start, end, value, agg='mean', group_by=None, filters=None, archive_dir=ARCHIVE_DIR):
+    if agg not in AGGREGATES:
+        raise ValueError(f"agg must be one of: {', '.join(AGGREGATES)}")
+
+    columns = [value] + ([group_by] if group_by else [])
+    counts = np.zeros(0)
+    sums = np.zeros(0)
+    mins = np.zeros(0)
+    maxs = np.zeros(0)
+
+    def grow(size):
+        nonlocal counts, sums, mins, maxs
+        if size > len(counts):
+            extra = size - len(counts)
+            counts = np.concatenate((counts, np.zeros(extra)))
+            sums = np.concatenate((sums, np.zeros(extra)))
+            mins = np.concatenate((mins, np.full(extra, np.inf)))
+            maxs = np.concatenate((maxs, np.full(extra, -np.inf)))
+
+    for chunk in scan(start, end, columns, filters, archive_dir):
+        values = chunk[value].astype(np.float64)
+        # Group ids are >= -1; shift so they index the accumulators
+        keys = (chunk[group_by].astype(np.int64) + 1) if group_by else np.zeros(len(values), dtype=np.int64)
+
+        valid = ~np.isnan(values)
+        values, keys = values[valid], keys[valid]
+        if not len(values):
+            continue
+
+        grow(int(keys.max()) + 1)
+        size = len(counts)
+        counts += np.bincount(keys, minlength=size)
+        sums += np.bincount(keys, weights=values, minlength=size)
+        if agg == 'min':
+            np.minimum.at(mins, keys, values)
+        elif agg == 'max':
+            np.maximum.at(maxs, keys, values)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = {
+            'count': counts, 'sum': sums, 'mean': sums / counts, 'min': mins, 'max': maxs
+        }[agg]
+
+    present = np.flatnonzero(counts)
+    if group_by is None:
+        return float(result[0]) if len(present) else None
+    return {int(key) - 1: float(result[key]) for key in present}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Snapshot readings into the columnar archive')
+    parser.add_argument('--full', action='store_true', help='re-export every month')
+    args = parser.parse_args()
+
+    months = snapshot(full=args.full)
+    print(f"Exported {len(months)} month(s): {', '.join(months)}")
@@ -0,0 +1,90 @@
+from psycopg2.extras import RealDictCursor
+from db_config import get_db_connection
+from app.services.scope_service import client_scope_sql, UNSCOPED_ROLES
+from app.utils.cache import TieredCache
+
+SUMMARY_TTL = 30
+
+# Pending readings older than this are overdue
+OVERDUE_HOURS = 48
+
+# Machines with no reading for this many days count as stale
+STALE_DAYS = 7
+
+_cache = TieredCache('dashboard', maxsize=512)
+
+COUNTERS = ('pending', 'completed', 'not_in_use', 'overdue', 'machines', 'stale_machines')
+
+
+# Reading counts per machine come from the covering (machine_id, created_at)
+# index; the outer GROUPING SETS produces per-client, per-distributor and
+# overall totals from the same pass
+def compute_summary(current_user, overdue_hours, stale_days):
+    scope_query, scope_params = client_scope_sql(current_user)
+    scope_filter = ''
+    params = [overdue_hours]
+    if scope_query is not None:
+        scope_filter = f'WHERE m.client_id IN ({scope_query})'
+        params.extend(scope_params)
+    params.append(stale_days)
+
+    query = f'''
+        WITH per_machine AS (
+            SELECT m.machine_id, m.client_id, m.distributor_id, counts.*
+            FROM machine m
+            CROSS JOIN LATERAL (
+                SELECT COUNT(*) FILTER (WHERE r.status = 'Pending') AS pending,
+                       COUNT(*) FILTER (WHERE r.status = 'Completed') AS completed,
+                       COUNT(*) FILTER (WHERE r.status = 'Not In Use') AS not_in_use,
+                       COUNT(*) FILTER (
+                           WHERE r.status = 'Pending'
+                           AND r.created_at < NOW() - make_interval(hours => %s)
+                       ) AS overdue,
+                       MAX(r.created_at) AS last_reading
+                FROM reading r
+                WHERE r.machine_id = m.machine_id
+            ) counts
+            {scope_filter}
+        )
+        SELECT GROUPING(client_id) AS g_client, GROUPING(distributor_id) AS g_distributor,
+               client_id, distributor_id,
+               SUM(pending)::int AS pending, SUM(completed)::int AS completed,
+               SUM(not_in_use)::int AS not_in_use, SUM(overdue)::int AS overdue,
+               COUNT(*) AS machines,
+               COUNT(*) FILTER (
+                   WHERE last_reading IS NULL OR last_reading < NOW() - make_interval(days => %s)
+               ) AS stale_machines
+        FROM per_machine
+        GROUP BY GROUPING SETS ((client_id), (distributor_id), ())
+    '''
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+
+    cur.execute(query, params)
+    rows = cur.fetchall()
+
+    cur.close()
+    conn.close()
+
+    summary = {'totals': {counter: 0 for counter in COUNTERS}, 'clients': [], 'distributors': []}
+    for row in rows:
+        counts = {counter: row[counter] for counter in COUNTERS}
+        if row['g_client'] == 0:
+            summary['clients'].append({'client_id': row['client_id'], **counts})
+        elif row['g_distributor'] == 0:
+            summary['distributors'].append({'distributor_id': row['distributor_id'], **counts})
+        else:
+            summary['totals'] = counts
+
+    return summary
+
+
+# Cached per caller scope for a few seconds; every admin shares one entry
+def get_summary(current_user, overdue_hours=OVERDUE_HOURS, stale_days=STALE_DAYS):
+    scope_key = 'all' if current_user['role'] in UNSCOPED_ROLES else current_user['user_id']
+    return _cache.get_or_set(
+        (scope_key, overdue_hours, stale_days),
+        lambda: compute_summary(current_user, overdue_hours, stale_days),
+        SUMMARY_TTL
+    )
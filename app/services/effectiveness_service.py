@@ -0,0 +1,147 @@
+import datetime
+from psycopg2.extras import RealDictCursor
+from db_config import get_db_connection
+from app.services.scope_service import client_scope_sql
+from app.utils.cache import TieredCache
+
+# Target ranges a response should bring each reading back into
+TARGET_RANGES = {
+    'oil_refractometer': (5.0, 10.0),
+    'oil_ph_level': (8.5, 9.5),
+    'water_ph_level': (6.5, 8.0),
+}
+
+# Width of the oil top-up buckets used for the dosing breakdown
+DOSE_STEP = 5.0
+
+# Closed periods don't change; the current one is refreshed often
+CLOSED_PERIOD_TTL = 3600
+OPEN_PERIOD_TTL = 60
+
+GROUPINGS = ('responder', 'distributor', 'client', 'machine_type', 'oil_dose')
+
+_cache = TieredCache('effectiveness', maxsize=256)
+
+
+def _in_range(prefix):
+    return ' AND '.join(
+        f'r.{prefix}{metric} BETWEEN {low} AND {high}'
+        for metric, (low, high) in TARGET_RANGES.items()
+    )
+
+
+# One pass over the responded readings in [start, end), aggregated under
+# every grouping at once with GROUPING SETS
+def compute_effectiveness(current_user, start, end):
+    scope_query, scope_params = client_scope_sql(current_user)
+    scope_filter = ''
+    params = [DOSE_STEP, start, end]
+    if scope_query is not None:
+        scope_filter = f'AND m.client_id IN ({scope_query})'
+        params.extend(scope_params)
+
+    query = f'''
+        WITH responses AS (
+            SELECT r.response_by, m.distributor_id, m.client_id, m.type_of_machine,
+                   FLOOR(COALESCE(r.post_oil_top_up, 0) / %s)::int AS dose_bucket,
+                   r.post_oil_refractometer - r.oil_refractometer AS refractometer_delta,
+                   r.post_oil_ph_level - r.oil_ph_level AS oil_ph_delta,
+                   r.post_water_ph_level - r.water_ph_level AS water_ph_delta,
+                   r.post_oil_top_up, r.post_water,
+                   EXTRACT(EPOCH FROM r.response_timestamp - r.created_at) / 3600.0 AS response_hours,
+                   NOT ({_in_range('')}) AS out_before,
+                   COALESCE({_in_range('post_')}, FALSE) AS in_range_after
+            FROM reading r
+            JOIN machine m ON m.machine_id = r.machine_id
+            WHERE r.status = 'Completed'
+            AND r.response_timestamp >= %s AND r.response_timestamp < %s
+            {scope_filter}
+        )
+        SELECT GROUPING(response_by) AS g_responder,
+               GROUPING(distributor_id) AS g_distributor,
+               GROUPING(client_id) AS g_client,
+               GROUPING(type_of_machine) AS g_machine_type,
+               response_by, distributor_id, client_id, type_of_machine, dose_bucket,
+               COUNT(*) AS responses,
+               AVG(in_range_after::int) AS success_rate,
+               COUNT(*) FILTER (WHERE out_before) AS out_of_range,
+               AVG(in_range_after::int) FILTER (WHERE out_before) AS recovery_rate,
+               AVG(refractometer_delta) AS avg_refractometer_delta,
+               AVG(oil_ph_delta) AS avg_oil_ph_delta,
+               AVG(water_ph_delta) AS avg_water_ph_delta,
+               AVG(post_oil_top_up) AS avg_oil_top_up,
+               AVG(post_water) AS avg_water,
+               AVG(response_hours) AS avg_response_hours,
+               percentile_cont(0.5) WITHIN GROUP (ORDER BY response_hours) AS median_response_hours,
+               percentile_cont(0.9) WITHIN GROUP (ORDER BY response_hours) AS p90_response_hours
+        FROM responses
+        GROUP BY GROUPING SETS ((response_by), (distributor_id), (client_id), (type_of_machine), (dose_bucket))
+    '''
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+
+    cur.execute(query, params)
+    rows = cur.fetchall()
+
+    # Names for the responders, distributors and clients in the result
+    names = {'responder': {}, 'distributor': {}, 'client': {}}
+    user_ids = [row['response_by'] for row in rows if row['g_responder'] == 0 and row['response_by']]
+    distributor_ids = [row['distributor_id'] for row in rows if row['g_distributor'] == 0 and row['distributor_id']]
+    client_ids = [row['client_id'] for row in rows if row['g_client'] == 0 and row['client_id']]
+
+    if user_ids:
+        cur.execute('SELECT user_id, full_name FROM user_details WHERE user_id = ANY(%s)', (user_ids,))
+        names['responder'] = {row['user_id']: row['full_name'] for row in cur.fetchall()}
+    if distributor_ids:
+        cur.execute('SELECT distributor_id, distributor_name FROM distributor WHERE distributor_id = ANY(%s)', (distributor_ids,))
+        names['distributor'] = {row['distributor_id']: row['distributor_name'] for row in cur.fetchall()}
+    if client_ids:
+        cur.execute('SELECT client_id, client_name FROM client WHERE client_id = ANY(%s)', (client_ids,))
+        names['client'] = {row['client_id']: row['client_name'] for row in cur.fetchall()}
+
+    cur.close()
+    conn.close()
+
+    result = {grouping: [] for grouping in GROUPINGS}
+    for row in rows:
+        if row['g_responder'] == 0:
+            grouping, key, name = 'responder', row['response_by'], names['responder'].get(row['response_by'])
+        elif row['g_distributor'] == 0:
+            grouping, key, name = 'distributor', row['distributor_id'], names['distributor'].get(row['distributor_id'])
+        elif row['g_client'] == 0:
+            grouping, key, name = 'client', row['client_id'], names['client'].get(row['client_id'])
+        elif row['g_machine_type'] == 0:
+            grouping, key, name = 'machine_type', row['type_of_machine'], row['type_of_machine']
+        else:
+            low = row['dose_bucket'] * DOSE_STEP
+            grouping, key, name = 'oil_dose', row['dose_bucket'], f'{low:g}-{low + DOSE_STEP:g}'
+
+        stats = {
+            field: (float(value) if value is not None else None)
+            for field, value in row.items()
+            if field.startswith(('avg_', 'median_', 'p90_')) or field.endswith('_rate')
+        }
+        result[grouping].append(dict(
+            key=key, name=name, responses=row['responses'], out_of_range=row['out_of_range'], **stats
+        ))
+
+    for grouping in GROUPINGS:
+        result[grouping].sort(key=lambda item: item['responses'], reverse=True)
+
+    return result
+
+
+# Cached per caller scope and period
+def get_effectiveness(current_user, start, end):
+    if current_user['role'] in ('admin', 'manufacturer'):
+        scope_key = 'all'
+    else:
+        scope_key = current_user['user_id']
+
+    ttl = CLOSED_PERIOD_TTL if end <= datetime.date.today() else OPEN_PERIOD_TTL
+    return _cache.get_or_set(
+        (scope_key, start, end),
+        lambda: compute_effectiveness(current_user, start, end),
+        ttl
+    )
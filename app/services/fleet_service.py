@@ -0,0 +1,123 @@
+import argparse
+from psycopg2.extras import RealDictCursor
+from db_config import get_db_connection
+from app.services.scope_service import client_scope_sql
+
+STATUSES = ('Pending', 'Completed', 'Not In Use')
+
+LATEST_COLUMNS = ('reading_id', 'raised_by', 'oil_refractometer', 'oil_ph_level', 'water_ph_level',
+                  'oil_top_up', 'water_input', 'status', 'response_by', 'response_timestamp',
+                  'created_at', 'updated_at')
+
+# Latest manual reading per machine recomputed from history
+ACTUAL_LATEST_SQL = f'''
+    SELECT DISTINCT ON (machine_id) machine_id, {', '.join(LATEST_COLUMNS)}
+    FROM reading
+    WHERE machine_id IS NOT NULL AND status <> 'Telemetry'
+    ORDER BY machine_id, created_at DESC, reading_id DESC
+'''
+
+
+# One page of machines with their latest reading (machine_latest_reading is
+# kept current by trigger, so this never touches the reading table)
+def list_fleet_status(current_user, page=1, per_page=50, status=None, client_id=None,
+                      distributor_id=None, stale_days=None):
+    query = '''
+        SELECT m.machine_id, m.machine_name, m.unique_code, m.type_of_machine,
+               m.client_id, c.client_name, m.distributor_id,
+               l.reading_id, l.status, l.oil_refractometer, l.oil_ph_level, l.water_ph_level,
+               l.oil_top_up, l.water_input, l.raised_by, l.response_by, l.response_timestamp,
+               l.created_at AS last_reading_at
+        FROM machine m
+        LEFT JOIN client c ON c.client_id = m.client_id
+        LEFT JOIN machine_latest_reading l ON l.machine_id = m.machine_id
+        WHERE TRUE
+    '''
+    params = []
+
+    if status == 'none':
+        query += ' AND l.machine_id IS NULL'
+    elif status:
+        query += ' AND l.status = %s'
+        params.append(status)
+
+    if client_id:
+        query += ' AND m.client_id = %s'
+        params.append(client_id)
+
+    if distributor_id:
+        query += ' AND m.distributor_id = %s'
+        params.append(distributor_id)
+
+    if stale_days:
+        query += " AND (l.created_at IS NULL OR l.created_at < NOW() - make_interval(days => %s))"
+        params.append(stale_days)
+
+    scope_query, scope_params = client_scope_sql(current_user)
+    if scope_query is not None:
+        query += f' AND m.client_id IN ({scope_query})'
+        params.extend(scope_params)
+
+    query += ' ORDER BY m.machine_id LIMIT %s OFFSET %s'
+    params.extend([per_page, (page - 1) * per_page])
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+
+    cur.execute(query, params)
+    machines = cur.fetchall()
+
+    cur.close()
+    conn.close()
+
+    return machines
+
+
+# Compare machine_latest_reading with history; with fix=True, rewrite the
+# rows that differ. Machines whose history has been archived away keep
+# their last known row.
+def verify_latest_readings(fix=False):
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    differs = ' OR '.join(f'l.{column} IS DISTINCT FROM a.{column}' for column in LATEST_COLUMNS)
+    cur.execute(f'''
+        CREATE TEMP TABLE latest_mismatch AS
+        SELECT a.*
+        FROM ({ACTUAL_LATEST_SQL}) a
+        LEFT JOIN machine_latest_reading l ON l.machine_id = a.machine_id
+        WHERE l.machine_id IS NULL OR {differs}
+    ''')
+    mismatched = cur.rowcount
+
+    repaired = 0
+    if fix and mismatched:
+        # Skip rows a newer reading has replaced since the snapshot above
+        cur.execute(f'''
+            INSERT INTO machine_latest_reading (machine_id, {', '.join(LATEST_COLUMNS)})
+            SELECT machine_id, {', '.join(LATEST_COLUMNS)} FROM latest_mismatch
+            ON CONFLICT (machine_id) DO UPDATE SET
+                {', '.join(f'{column} = EXCLUDED.{column}' for column in LATEST_COLUMNS)}
+            WHERE (EXCLUDED.created_at, EXCLUDED.reading_id)
+                  >= (machine_latest_reading.created_at, machine_latest_reading.reading_id)
+               OR NOT EXISTS (SELECT 1 FROM reading r
+                              WHERE r.reading_id = machine_latest_reading.reading_id
+                              AND r.machine_id = machine_latest_reading.machine_id)
+        ''')
+        repaired = cur.rowcount
+
+    cur.execute('DROP TABLE latest_mismatch')
+
+    cur.close()
+    conn.close()
+
+    return {'mismatched': mismatched, 'repaired': repaired}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Verify or repair machine_latest_reading against reading history')
+    parser.add_argument('--fix', action='store_true', help='rewrite rows that differ')
+    args = parser.parse_args()
+
+    result = verify_latest_readings(fix=args.fix)
+    print(f"{result['mismatched']} machine(s) differ, {result['repaired']} repaired")
@@ -0,0 +1,195 @@
+import argparse
+import datetime
+import io
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from db_config import get_db_connection
+from app.utils.pg_columns import fetch_columns
+
+HISTORY_WEEKS = 52
+HORIZON_WEEKS = 4
+
+# Machines fitted per worker task
+CHUNK_SIZE = 10000
+
+# Holt's linear smoothing parameters tried for every machine
+ALPHAS = np.array([0.1, 0.2, 0.3, 0.5, 0.7])
+BETAS = np.array([0.0, 0.05, 0.1, 0.2])
+
+SECONDS_PER_WEEK = 7 * 24 * 3600
+
+
+# Monday of the week containing `day`
+def week_start(day):
+    return day - datetime.timedelta(days=day.weekday())
+
+
+# Holt's linear method over the columns of `series` (machines x weeks) for
+# one (alpha, beta). Returns the one-step squared error per machine and the
+# final level and trend.
+def holt(series, alpha, beta):
+    level = series[:, 0].copy()
+    trend = np.zeros(series.shape[0])
+    sse = np.zeros(series.shape[0])
+
+    for t in range(1, series.shape[1]):
+        predicted = level + trend
+        error = series[:, t] - predicted
+        sse += error * error
+        new_level = alpha * series[:, t] + (1 - alpha) * predicted
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        level = new_level
+
+    return sse, level, trend
+
+
+# Fit every machine at once: try each parameter pair on the whole matrix and
+# keep, per machine, the pair with the lowest one-step error
+def fit_forecast(series, horizon=HORIZON_WEEKS):
+    machines = series.shape[0]
+    best_sse = np.full(machines, np.inf)
+    best_level = np.zeros(machines)
+    best_trend = np.zeros(machines)
+
+    for alpha in ALPHAS:
+        for beta in BETAS:
+            sse, level, trend = holt(series, alpha, beta)
+            better = sse < best_sse
+            best_sse[better] = sse[better]
+            best_level[better] = level[better]
+            best_trend[better] = trend[better]
+
+    steps = np.arange(1, horizon + 1)
+    forecast = best_level[:, None] + best_trend[:, None] * steps[None, :]
+    return np.maximum(forecast, 0.0)
+
+
+# Weekly oil and water consumption for a chunk of machines, as dense
+# machines x weeks matrices (weeks without readings count as zero)
+def load_weekly_consumption(cur, machine_ids, first_week, weeks):
+    columns = fetch_columns(cur, '''
+        SELECT machine_id,
+               EXTRACT(EPOCH FROM date_trunc('week', created_at))::float8,
+               COALESCE(SUM(COALESCE(oil_top_up, 0) + COALESCE(post_oil_top_up, 0)), 0)::float8,
+               COALESCE(SUM(COALESCE(water_input, 0) + COALESCE(post_water, 0)), 0)::float8
+        FROM reading
+        WHERE machine_id = ANY(%s) AND created_at >= %s
+        GROUP BY 1, 2
+    ''', (machine_ids, first_week), [
+        ('machine_id', 'i4'), ('week', 'f8'), ('oil', 'f8'), ('water', 'f8')
+    ])
+
+    ids = np.asarray(machine_ids)
+    order = np.argsort(ids)
+    rows = order[np.searchsorted(ids, columns['machine_id'], sorter=order)]
+
+    first_epoch = datetime.datetime.combine(first_week, datetime.time(), datetime.timezone.utc).timestamp()
+    cols = np.round((columns['week'] - first_epoch) / SECONDS_PER_WEEK).astype(np.int64)
+    in_range = (cols >= 0) & (cols < weeks)
+
+    oil = np.zeros((len(machine_ids), weeks))
+    water = np.zeros((len(machine_ids), weeks))
+    oil[rows[in_range], cols[in_range]] = columns['oil'][in_range]
+    water[rows[in_range], cols[in_range]] = columns['water'][in_range]
+    return oil, water
+
+
+# Worker task: load, fit and store forecasts for one chunk of machines
+def fit_chunk(run_id, machine_ids, first_week, history_weeks, horizon):
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    oil, water = load_weekly_consumption(cur, machine_ids, first_week, history_weeks)
+    oil_forecast = fit_forecast(oil, horizon)
+    water_forecast = fit_forecast(water, horizon)
+
+    forecast_start = first_week + datetime.timedelta(weeks=history_weeks)
+    periods = [(forecast_start + datetime.timedelta(weeks=h)).isoformat() for h in range(horizon)]
+
+    buffer = io.StringIO()
+    for i, machine_id in enumerate(machine_ids):
+        for h, period in enumerate(periods):
+            buffer.write(f"{run_id}\t{machine_id}\t{period}\t{oil_forecast[i, h]:.4f}\t{water_forecast[i, h]:.4f}\n")
+    buffer.seek(0)
+    cur.copy_expert(
+        'COPY machine_forecast (run_id, machine_id, period_start, oil_top_up, water_input) FROM STDIN',
+        buffer
+    )
+
+    cur.close()
+    conn.close()
+
+    return len(machine_ids)
+
+
+# Refit every machine and publish the new run. The last full week of
+# history ends at the start of the current week.
+def refit_all(processes=None, history_weeks=HISTORY_WEEKS, horizon=HORIZON_WEEKS, chunk_size=CHUNK_SIZE):
+    first_week = week_start(datetime.date.today()) - datetime.timedelta(weeks=history_weeks)
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    cur.execute('''
+        INSERT INTO forecast_run (horizon_weeks, history_weeks) VALUES (%s, %s) RETURNING run_id
+    ''', (horizon, history_weeks))
+    run_id = cur.fetchone()[0]
+
+    cur.execute('SELECT machine_id FROM machine ORDER BY machine_id')
+    machine_ids = [row[0] for row in cur.fetchall()]
+    chunks = [machine_ids[i:i + chunk_size] for i in range(0, len(machine_ids), chunk_size)]
+
+    try:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [
+                executor.submit(fit_chunk, run_id, chunk, first_week, history_weeks, horizon)
+                for chunk in chunks
+            ]
+            fitted = sum(future.result() for future in futures)
+
+        # Roll machine forecasts up to clients and distributors
+        for scope_type, column in (('client', 'client_id'), ('distributor', 'distributor_id')):
+            cur.execute(f'''
+                INSERT INTO forecast_rollup (run_id, scope_type, scope_id, period_start, oil_top_up, water_input, machines)
+                SELECT f.run_id, %s, m.{column}, f.period_start,
+                       SUM(f.oil_top_up), SUM(f.water_input), COUNT(*)
+                FROM machine_forecast f
+                JOIN machine m ON m.machine_id = f.machine_id
+                WHERE f.run_id = %s AND m.{column} IS NOT NULL
+                GROUP BY f.run_id, m.{column}, f.period_start
+            ''', (scope_type, run_id))
+
+        cur.execute('''
+            UPDATE forecast_run SET status = 'completed', machines = %s, finished_at = NOW()
+            WHERE run_id = %s
+        ''', (fitted, run_id))
+
+        # Keep the previous run around for comparison, drop older ones
+        cur.execute('''
+            DELETE FROM forecast_run
+            WHERE status <> 'running' AND run_id < (
+                SELECT MIN(run_id) FROM (
+                    SELECT run_id FROM forecast_run WHERE status = 'completed'
+                    ORDER BY run_id DESC LIMIT 2
+                ) AS recent
+            )
+        ''')
+    except Exception:
+        cur.execute("UPDATE forecast_run SET status = 'failed', finished_at = NOW() WHERE run_id = %s", (run_id,))
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+    return {'run_id': run_id, 'machines': fitted}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Refit oil and water top-up forecasts for every machine')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--history-weeks', type=int, default=HISTORY_WEEKS)
+    parser.add_argument('--horizon-weeks', type=int, default=HORIZON_WEEKS)
+    args = parser.parse_args()
+
+    result = refit_all(args.processes, args.history_weeks, args.horizon_weeks)
+    print(f"Forecast run {result['run_id']} completed for {result['machines']} machines")
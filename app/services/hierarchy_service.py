@@ -0,0 +1,78 @@
+# Employee scoping through the employee_hierarchy closure table. Callers
+# are matched to their employee record by login email.
+
+CALLER_EMPLOYEE_SQL = '''
+    SELECT e.id FROM employee_details e
+    JOIN user_details u ON u.user_mailid = e.email
+    WHERE u.user_id = %s
+    ORDER BY e.id LIMIT 1
+'''
+
+
+# WHERE fragment (prefixed with AND) limiting employee_details rows to what
+# the caller may see: managers get their whole subtree, employees their
+# own record, everyone else is unrestricted
+def employee_scope_sql(current_user, column='id'):
+    role = current_user['role']
+
+    if role == 'manager':
+        return f'''
+            AND {column} IN (
+                SELECT descendant_id FROM employee_hierarchy
+                WHERE ancestor_id = ({CALLER_EMPLOYEE_SQL}) AND depth > 0
+            )
+        ''', [current_user['user_id']]
+
+    if role == 'employee':
+        return f'''
+            AND {column} = ({CALLER_EMPLOYEE_SQL})
+        ''', [current_user['user_id']]
+
+    return '', []
+
+
+# Employees anywhere below `manager_id`
+def subtree_sql(manager_id, column='id'):
+    return f'''
+        AND {column} IN (
+            SELECT descendant_id FROM employee_hierarchy
+            WHERE ancestor_id = %s AND depth > 0
+        )
+    ''', [manager_id]
+
+
+# Resolve the manager for a create/update payload as (manager_id,
+# manager_name). Accepts manager_id or, for older clients, manager_name.
+# Managers may only place employees under themselves or someone in their
+# subtree; anything else falls back to themselves.
+def resolve_manager(cur, current_user, data):
+    manager_id = data.get('manager_id')
+    manager_name = data.get('manager_name')
+
+    cur.execute(f'''
+        WITH caller AS ({CALLER_EMPLOYEE_SQL}),
+        requested AS (
+            SELECT id, employee_name FROM employee_details
+            WHERE (id = %s OR (%s::int IS NULL AND employee_type = 'Manager' AND employee_name = %s))
+            ORDER BY id LIMIT 1
+        )
+        SELECT r.id AS requested_id, r.employee_name AS requested_name,
+               c.id AS caller_id, ce.employee_name AS caller_name,
+               EXISTS (
+                   SELECT 1 FROM employee_hierarchy h
+                   WHERE h.ancestor_id = c.id AND h.descendant_id = r.id
+               ) AS in_subtree
+        FROM (SELECT 1) one
+        LEFT JOIN requested r ON TRUE
+        LEFT JOIN caller c ON TRUE
+        LEFT JOIN employee_details ce ON ce.id = c.id
+    ''', (current_user['user_id'], manager_id, manager_id, manager_name))
+    row = cur.fetchone()
+
+    if current_user['role'] == 'manager' and row['caller_id'] and not row['in_subtree']:
+        return row['caller_id'], row['caller_name']
+
+    if row['requested_id']:
+        return row['requested_id'], row['requested_name']
+
+    return None, manager_name
@@ -0,0 +1,237 @@
+import csv
+import io
+import os
+import re
+import tempfile
+from db_config import get_db_connection
+from app.utils import cache
+
+IMPORT_DIR = os.getenv(
+    'IMPORT_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'archive', 'imports')
+)
+
+# Valid rows are spooled to disk past this size instead of held in memory
+SPOOL_BYTES = 8 * 1024 * 1024
+
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+COUNTRY_CODE_PATTERN = re.compile(r'^\+\d{1,4}$')
+
+# CSV column -> (table column, kind, max length, required, default).
+# Kinds mirror the DDL checks in 01_create_tables.sql / 02_constraints.sql.
+ENTITIES = {
+    'clients': {
+        'table': 'client',
+        'created_by_column': 'created_by',
+        'fields': {
+            'client_name': ('client_name', 'text', 100, True, None),
+            'city': ('city', 'text', 50, True, None),
+            'address': ('address', 'text', None, True, None),
+            'primary_contact_person': ('primary_contact_person', 'text', 100, True, None),
+            'primary_country_code': ('primary_country_code', 'country_code', 5, False, '+91'),
+            'primary_mobile_number': ('primary_mobile_number', 'mobile', 15, True, None),
+            'secondary_contact_person': ('secondary_contact_person', 'text', 100, False, None),
+            'secondary_country_code': ('secondary_country_code', 'country_code', 5, False, '+91'),
+            'secondary_mobile_number': ('secondary_mobile_number', 'mobile', 15, False, None),
+            'email': ('email_id', 'email', 100, True, None),
+            'gst_number': ('gst_number', 'gst', 20, True, None),
+            'types_of_metals': ('types_of_metals', 'text', None, True, None),
+            'client_category': ('client_category', ('Retail', 'Wholesale', 'Distributor'), 50, True, None),
+            'whatsapp_country_code': ('whatsapp_country_code', 'country_code', 5, False, '+91'),
+            'whatsapp_number': ('whatsapp_communication_number', 'mobile', 15, True, None),
+            'distributor_id': ('distributor_id', 'int', None, False, None),
+        },
+    },
+    'distributors': {
+        'table': 'distributor',
+        'created_by_column': 'created_by',
+        'fields': {
+            'distributor_name': ('distributor_name', 'text', 100, True, None),
+            'city': ('city', 'text', 50, True, None),
+            'address': ('address', 'text', None, True, None),
+            'primary_contact_person': ('primary_contact_person', 'text', 100, True, None),
+            'primary_country_code': ('primary_country_code', 'country_code', 5, False, '+91'),
+            'primary_mobile_number': ('primary_mobile_number', 'mobile', 15, True, None),
+            'secondary_contact_person': ('secondary_contact_person', 'text', 100, False, None),
+            'secondary_country_code': ('secondary_country_code', 'country_code', 5, False, '+91'),
+            'secondary_mobile_number': ('secondary_mobile_number', 'mobile', 15, False, None),
+            'email_id': ('email_id', 'email', 100, True, None),
+            'gst_number': ('gst_number', 'gst', 20, True, None),
+            'distributor_category': ('distributor_category', ('Wholesale', 'Retail', 'Industrial', 'Commercial'), 50, True, None),
+            'whatsapp_country_code': ('whatsapp_country_code', 'country_code', 5, False, '+91'),
+            'whatsapp_communication_number': ('whatsapp_communication_number', 'mobile', 15, True, None),
+        },
+    },
+}
+
+
+class CsvImportError(ValueError):
+    pass
+
+
+# Validate one CSV row; returns (values in field order, errors)
+def validate_row(spec, row):
+    values = []
+    errors = []
+
+    for field, (_, kind, max_length, required, default) in spec['fields'].items():
+        value = (row.get(field) or '').strip()
+        if not value:
+            if required:
+                errors.append((field, 'is required'))
+            values.append(default)
+            continue
+
+        if max_length and len(value) > max_length:
+            errors.append((field, f'must be at most {max_length} characters'))
+        elif kind == 'mobile' and not (value.isdigit() and len(value) == 10):
+            errors.append((field, 'must be 10 digits'))
+        elif kind == 'email' and not EMAIL_PATTERN.match(value):
+            errors.append((field, 'is not a valid email'))
+        elif kind == 'country_code' and not COUNTRY_CODE_PATTERN.match(value):
+            errors.append((field, 'must look like +91'))
+        elif kind == 'int' and not value.isdigit():
+            errors.append((field, 'must be a number'))
+        elif isinstance(kind, tuple) and value not in kind:
+            errors.append((field, f"must be one of: {', '.join(kind)}"))
+        elif kind == 'gst':
+            value = value.upper()
+
+        values.append(value)
+
+    return values, errors
+
+
+# Stream the CSV: validate each row, spool valid ones for COPY, then load
+# them through a staging table with set-based duplicate and reference checks
+def run_import(entity, stream, file_name, current_user):
+    spec = ENTITIES.get(entity)
+    if spec is None:
+        raise CsvImportError(f"entity must be one of: {', '.join(ENTITIES)}")
+
+    fields = list(spec['fields'])
+    gst_index = fields.index('gst_number')
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+
+    missing = [field for field, (_, _, _, required, _) in spec['fields'].items()
+               if required and field not in (reader.fieldnames or [])]
+    if missing:
+        raise CsvImportError(f"Missing columns: {', '.join(missing)}")
+
+    errors = []
+    seen_gst = set()
+    total = 0
+    valid = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES, mode='w+', newline='')
+    writer = csv.writer(valid)
+
+    # Line 1 is the header
+    for line_no, row in enumerate(reader, start=2):
+        total += 1
+        values, row_errors = validate_row(spec, row)
+
+        gst = values[gst_index]
+        if gst and gst in seen_gst:
+            row_errors.append(('gst_number', 'is duplicated earlier in the file'))
+
+        if row_errors:
+            errors.extend((line_no, gst, field, message) for field, message in row_errors)
+            continue
+
+        seen_gst.add(gst)
+        writer.writerow([line_no] + values)
+
+    valid.seek(0)
+    columns = [column for column, _, _, _, _ in spec['fields'].values()]
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    column_types = ', '.join(
+        f"{column} {'INT' if kind == 'int' else 'TEXT'}"
+        for column, kind, _, _, _ in spec['fields'].values()
+    )
+    cur.execute('DROP TABLE IF EXISTS import_staging')
+    cur.execute(f'CREATE TEMP TABLE import_staging (line_no INT, {column_types})')
+    cur.copy_expert(
+        f"COPY import_staging (line_no, {', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", valid
+    )
+    valid.close()
+
+    # GST numbers that already exist, in one lookup
+    cur.execute(f'''
+        SELECT s.line_no, s.gst_number FROM import_staging s
+        JOIN {spec['table']} t ON t.gst_number = s.gst_number
+    ''')
+    for line_no, gst in cur.fetchall():
+        errors.append((line_no, gst, 'gst_number', 'already exists'))
+
+    if entity == 'clients':
+        cur.execute('''
+            SELECT s.line_no, s.gst_number FROM import_staging s
+            WHERE s.distributor_id IS NOT NULL
+            AND NOT EXISTS (SELECT 1 FROM distributor d WHERE d.distributor_id = s.distributor_id)
+        ''')
+        for line_no, gst in cur.fetchall():
+            errors.append((line_no, gst, 'distributor_id', 'does not exist'))
+
+    rejected_lines = {error[0] for error in errors}
+
+    # ON CONFLICT covers GST numbers added by someone else since the check;
+    # staged rows missing from RETURNING were skipped that way
+    cur.execute(f'''
+        WITH inserted AS (
+            INSERT INTO {spec['table']} ({', '.join(columns)}, {spec['created_by_column']})
+            SELECT {', '.join('s.' + column for column in columns)}, %s
+            FROM import_staging s
+            WHERE NOT (s.line_no = ANY(%s))
+            ON CONFLICT (gst_number) DO NOTHING
+            RETURNING gst_number
+        )
+        SELECT s.line_no, s.gst_number, i.gst_number IS NOT NULL
+        FROM import_staging s
+        LEFT JOIN inserted i ON i.gst_number = s.gst_number
+        WHERE NOT (s.line_no = ANY(%s))
+    ''', (current_user['user_id'], list(rejected_lines), list(rejected_lines)))
+    inserted = 0
+    for line_no, gst, was_inserted in cur.fetchall():
+        if was_inserted:
+            inserted += 1
+        else:
+            errors.append((line_no, gst, 'gst_number', 'was added by someone else during the import'))
+    if inserted and entity == 'clients':
+        cache.invalidate('client_lists', cur=cur)
+        cache.invalidate('scan_scope', cur=cur)
+
+    cur.execute('DROP TABLE import_staging')
+
+    errors.sort()
+    error_file = None
+    if errors:
+        os.makedirs(IMPORT_DIR, exist_ok=True)
+        error_file = tempfile.NamedTemporaryFile(
+            mode='w', newline='', dir=IMPORT_DIR, prefix=f'{entity}_errors_', suffix='.csv', delete=False
+        )
+        with error_file:
+            error_writer = csv.writer(error_file)
+            error_writer.writerow(['line', 'gst_number', 'field', 'error'])
+            error_writer.writerows(errors)
+        error_file = error_file.name
+
+    failed = total - inserted
+    cur.execute('''
+        INSERT INTO data_import (entity, file_name, total_rows, inserted_rows, failed_rows, error_file, created_by)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        RETURNING import_id
+    ''', (entity, file_name, total, inserted, failed, error_file, current_user['user_id']))
+    import_id = cur.fetchone()[0]
+
+    cur.close()
+    conn.close()
+
+    return {
+        'import_id': import_id,
+        'total_rows': total,
+        'inserted_rows': inserted,
+        'failed_rows': failed,
+        'errors': len(errors)
+    }
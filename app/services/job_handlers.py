@@ -0,0 +1,112 @@
+import datetime
+import os
+import jwt
+from db_config import get_db_connection
+from app.services.job_queue import job_handler, recurring_job
+from app.utils.mailer import send_mail
+from app.services import anomaly_service, forecast_service, partition_service, columnar_archive, machine_service, fleet_service, sync_service
+
+SECRET_KEY = os.getenv('SECRET_KEY', 'coolant_management_secret_key')
+FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://localhost:5173')
+
+DAILY = 24 * 3600
+
+# Base folder for uploaded files
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'static')
+
+
+# Remove an uploaded file (e.g. the logo of a deleted client)
+@job_handler('delete_file')
+def delete_file(payload):
+    # Only files under static/ may be removed
+    file_path = os.path.realpath(os.path.join(STATIC_FOLDER, payload['path']))
+    if not file_path.startswith(os.path.realpath(STATIC_FOLDER) + os.sep):
+        raise ValueError(f"Refusing to delete file outside static folder: {payload['path']}")
+
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+
+# Generate a reset token and send the reset link
+@job_handler('send_password_reset')
+def send_password_reset(payload):
+    user_id = payload['user_id']
+    expires_at = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+    token = jwt.encode({
+        'user_id': user_id,
+        'exp': expires_at
+    }, SECRET_KEY, algorithm="HS256")
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    # Store token in database
+    cur.execute(
+        'INSERT INTO password_reset_token (user_id, token, expires_at) VALUES (%s, %s, %s)',
+        (user_id, token, expires_at)
+    )
+
+    cur.close()
+    conn.close()
+
+    reset_link = f"{FRONTEND_URL}/reset-password/{token}"
+    send_mail(
+        payload['email'],
+        'Reset your password',
+        f"Use this link within the next hour to reset your password:\n\n{reset_link}\n"
+    )
+
+
+# Score the fleet's reading series and store anomaly flags
+@job_handler('score_anomalies')
+def score_anomalies(payload):
+    result = anomaly_service.score_fleet(days=payload.get('days', 365))
+    print(f"Anomaly scoring finished: {result['machines']} machines, {result['flags']} flags")
+
+
+# Refit top-up forecasts for every machine
+@job_handler('refit_forecasts')
+def refit_forecasts(payload):
+    result = forecast_service.refit_all(
+        processes=payload.get('processes'),
+        history_weeks=payload.get('history_weeks', forecast_service.HISTORY_WEEKS),
+        horizon=payload.get('horizon_weeks', forecast_service.HORIZON_WEEKS)
+    )
+    print(f"Forecast run {result['run_id']} finished: {result['machines']} machines")
+
+
+# Create upcoming reading partitions and archive expired ones, daily
+@recurring_job('maintain_reading_partitions', DAILY)
+def maintain_reading_partitions(payload):
+    created = partition_service.ensure_partitions(payload.get('months_ahead', partition_service.MONTHS_AHEAD))
+    archived = partition_service.archive_expired(payload.get('retention_months', partition_service.RETENTION_MONTHS))
+    print(f"Reading partitions: {created} created, {len(archived)} archived")
+
+
+# Refresh the columnar reading archive nightly
+@recurring_job('snapshot_columnar_archive', DAILY, carry_payload=False)
+def snapshot_columnar_archive(payload):
+    months = columnar_archive.snapshot(full=payload.get('full', False))
+    print(f"Columnar archive: exported {len(months)} month(s)")
+
+
+# Render the QR label sheet of a bulk-registered machine batch
+@job_handler('generate_machine_labels')
+def generate_machine_labels(payload):
+    label_file = machine_service.generate_labels(payload['batch_id'])
+    print(f"Machine labels for batch {payload['batch_id']} written to {label_file}")
+
+
+# Check machine_latest_reading against history and fix drift, nightly
+@recurring_job('repair_machine_latest', DAILY, carry_payload=False)
+def repair_machine_latest(payload):
+    result = fleet_service.verify_latest_readings(fix=True)
+    print(f"Machine latest readings: {result['mismatched']} differed, {result['repaired']} repaired")
+
+
+# Trim the delta sync change log nightly
+@recurring_job('prune_sync_changes', DAILY)
+def prune_sync_changes(payload):
+    pruned = sync_service.prune_changes(payload.get('retention_days', sync_service.RETENTION_DAYS))
+    print(f"Sync change log: {pruned} entries pruned")
@@ -0,0 +1,260 @@
+import functools
+import os
+import random
+import socket
+import threading
+import traceback
+from contextlib import contextmanager
+import psycopg2.extras
+from db_config import get_db_connection
+
+DEFAULT_MAX_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 60 * 60
+
+# Workers refresh heartbeat_at this often while a job runs; a running job
+# whose heartbeat is older than STALE_JOB_SECONDS belongs to a dead worker
+HEARTBEAT_SECONDS = 30
+STALE_JOB_SECONDS = 5 * 60
+
+# Job type -> handler(payload)
+JOB_HANDLERS = {}
+
+# Job type -> seconds between runs, for jobs that reschedule themselves
+RECURRING_JOBS = {}
+
+
+def job_handler(job_type):
+    def decorator(f):
+        JOB_HANDLERS[job_type] = f
+        return f
+    return decorator
+
+
+# Handler that queues its next run `interval_seconds` later whether this
+# run succeeds or raises. With carry_payload=False the next run gets an
+# empty payload (for one-off options such as a full rebuild).
+def recurring_job(job_type, interval_seconds, carry_payload=True):
+    def decorator(f):
+        @functools.wraps(f)
+        def run(payload):
+            try:
+                f(payload)
+            finally:
+                enqueue_once(job_type, payload if carry_payload else {}, delay_seconds=interval_seconds)
+        RECURRING_JOBS[job_type] = interval_seconds
+        JOB_HANDLERS[job_type] = run
+        return f
+    return decorator
+
+
+# Queue a job. Connections are autocommit, so passing conn only makes the
+# job atomic with the caller's writes if the caller has opened a
+# transaction (conn.autocommit = False / with conn:) around both
+def enqueue(job_type, payload=None, delay_seconds=0, max_attempts=DEFAULT_MAX_ATTEMPTS, conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    cur = conn.cursor()
+
+    cur.execute('''
+        INSERT INTO job (job_type, payload, max_attempts, run_at)
+        VALUES (%s, %s, %s, NOW() + %s * INTERVAL '1 second')
+        RETURNING job_id
+    ''', (job_type, psycopg2.extras.Json(payload or {}), max_attempts, delay_seconds))
+    job_id = cur.fetchone()[0]
+
+    cur.close()
+    if own_conn:
+        conn.close()
+
+    return job_id
+
+
+
+# Queue a job unless one of the same type is already waiting (for
+# self-rescheduling periodic jobs)
+def enqueue_once(job_type, payload=None, delay_seconds=0, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    cur.execute('''
+        INSERT INTO job (job_type, payload, max_attempts, run_at)
+        SELECT %s, %s, %s, NOW() + %s * INTERVAL '1 second'
+        WHERE NOT EXISTS (SELECT 1 FROM job WHERE job_type = %s AND status = 'queued')
+        RETURNING job_id
+    ''', (job_type, psycopg2.extras.Json(payload or {}), max_attempts, delay_seconds, job_type))
+    row = cur.fetchone()
+
+    cur.close()
+    conn.close()
+
+    return row[0] if row else None
+
+# Queue a first run of every recurring job that has none queued or running
+# (fresh installs, or a chain broken by a lost worker)
+def seed_recurring_jobs():
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    seeded = 0
+    for job_type in RECURRING_JOBS:
+        cur.execute('''
+            INSERT INTO job (job_type, payload, max_attempts)
+            SELECT %s, '{}', %s
+            WHERE NOT EXISTS (SELECT 1 FROM job WHERE job_type = %s AND status IN ('queued', 'running'))
+        ''', (job_type, DEFAULT_MAX_ATTEMPTS, job_type))
+        seeded += cur.rowcount
+
+    cur.close()
+    conn.close()
+
+    return seeded
+
+def get_job(job_id):
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+
+    cur.execute('''
+        SELECT job_id, job_type, payload, status, attempts, max_attempts,
+               run_at, last_error, created_at, updated_at
+        FROM job WHERE job_id = %s
+    ''', (job_id,))
+    job = cur.fetchone()
+
+    cur.close()
+    conn.close()
+
+    return job
+
+
+# Lock the next due job for this worker; None when the queue is empty
+def dequeue(cur, worker_id):
+    cur.execute('''
+        WITH next AS (
+            SELECT job_id FROM job
+            WHERE status = 'queued' AND run_at <= NOW()
+            ORDER BY run_at
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE job j
+        SET status = 'running', attempts = j.attempts + 1,
+            locked_by = %s, locked_at = NOW(), heartbeat_at = NOW()
+        FROM next
+        WHERE j.job_id = next.job_id
+        RETURNING j.job_id, j.job_type, j.payload, j.attempts, j.max_attempts
+    ''', (worker_id,))
+    return cur.fetchone()
+
+
+def complete(cur, job_id):
+    cur.execute('''
+        UPDATE job SET status = 'succeeded', locked_by = NULL, locked_at = NULL, heartbeat_at = NULL, last_error = NULL
+        WHERE job_id = %s
+    ''', (job_id,))
+
+
+# Exponential backoff with jitter
+def backoff_seconds(attempts):
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** (attempts - 1)))
+    return delay * random.uniform(0.5, 1.0)
+
+
+# Retry later, or move to the dead-letter state once attempts run out
+def fail(cur, job, error):
+    if job['attempts'] >= job['max_attempts']:
+        cur.execute('''
+            UPDATE job SET status = 'dead', locked_by = NULL, locked_at = NULL, heartbeat_at = NULL, last_error = %s
+            WHERE job_id = %s
+        ''', (error, job['job_id']))
+    else:
+        cur.execute('''
+            UPDATE job SET status = 'queued', locked_by = NULL, locked_at = NULL, heartbeat_at = NULL, last_error = %s,
+                run_at = NOW() + %s * INTERVAL '1 second'
+            WHERE job_id = %s
+        ''', (error, backoff_seconds(job['attempts']), job['job_id']))
+
+
+# Put jobs abandoned by crashed workers back in the queue. Long jobs stay
+# running as long as their worker keeps the heartbeat going.
+def requeue_stale_jobs(cur):
+    cur.execute('''
+        UPDATE job SET status = 'queued', locked_by = NULL, locked_at = NULL, heartbeat_at = NULL,
+            last_error = 'Worker stopped before finishing the job'
+        WHERE status = 'running' AND heartbeat_at < NOW() - %s * INTERVAL '1 second'
+    ''', (STALE_JOB_SECONDS,))
+    return cur.rowcount
+
+
+# Refresh the job's heartbeat from a background thread while the body runs
+@contextmanager
+def heartbeat(job_id, worker_id, interval=None):
+    interval = interval or HEARTBEAT_SECONDS
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(interval):
+            try:
+                conn = get_db_connection()
+                cur = conn.cursor()
+                cur.execute('''
+                    UPDATE job SET heartbeat_at = NOW()
+                    WHERE job_id = %s AND locked_by = %s AND status = 'running'
+                ''', (job_id, worker_id))
+                cur.close()
+                conn.close()
+            except Exception as e:
+                print(f"Job {job_id} heartbeat error: {e}")
+
+    thread = threading.Thread(target=beat, name=f'job-heartbeat-{job_id}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(cur, job):
+    handler = JOB_HANDLERS.get(job['job_type'])
+    try:
+        if handler is None:
+            raise ValueError(f"No handler registered for job type '{job['job_type']}'")
+        handler(job['payload'])
+    except Exception:
+        fail(cur, job, traceback.format_exc(limit=5))
+        return False
+    complete(cur, job['job_id'])
+    return True
+
+
+# Worker loop for one thread; runs until stop_event is set
+def work(stop_event, poll_interval=1.0, worker_name=None):
+    worker_id = worker_name or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+    conn = None
+
+    while not stop_event.is_set():
+        try:
+            if conn is None or conn.closed:
+                conn = get_db_connection()
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+
+            job = dequeue(cur, worker_id)
+            if job is None:
+                cur.close()
+                stop_event.wait(poll_interval)
+                continue
+
+            with heartbeat(job['job_id'], worker_id):
+                run_job(cur, job)
+            cur.close()
+        except Exception as e:
+            print(f"Job worker {worker_id} error: {e}")
+            if conn is not None:
+                conn.close()
+                conn = None
+            stop_event.wait(poll_interval)
+
+    if conn is not None:
+        conn.close()
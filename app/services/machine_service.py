@@ -0,0 +1,271 @@
+import html
+import os
+import threading
+from psycopg2.extras import RealDictCursor
+from db_config import get_db_connection, pooled_connection
+from app.services.job_queue import enqueue
+from app.services import reading_events
+from app.utils import cache
+from app.utils.cache import TTLCache
+
+# Allowed values of machine.type_of_machine (machine_type_check in 02_constraints.sql)
+MACHINE_TYPES = ('Mill', 'Lathe', 'Drill', 'Grinder', 'Cutter', 'Press', 'Other')
+
+MAX_BATCH = 10000
+
+CODE_PREFIX = os.getenv('MACHINE_CODE_PREFIX', 'CFM')
+
+LABEL_DIR = os.getenv(
+    'LABEL_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'archive', 'labels')
+)
+
+# Scan lookups: unique_code -> machine_id rarely changes; the per-machine
+# payload (keyed by str(machine_id)) is dropped whenever a reading event for
+# the machine arrives, and on every worker when a client or distributor in
+# it changes (cache.invalidate('machine_scan'))
+RECENT_READINGS = 5
+SCAN_TTL = 300
+CODE_TTL = 3600
+SCAN_CACHE_SIZE = int(os.getenv('SCAN_CACHE_SIZE', 50000))
+
+code_cache = TTLCache('machine_codes', maxsize=SCAN_CACHE_SIZE)
+scan_cache = cache.register(TTLCache('machine_scan', maxsize=SCAN_CACHE_SIZE))
+
+_invalidation_lock = threading.Lock()
+_invalidation_started = False
+
+# QR codes are rendered as inline SVG; without the qrcode package the
+# sheet still prints, with the code in text only
+try:
+    import qrcode
+    import qrcode.image.svg
+except ImportError:
+    qrcode = None
+
+
+class MachineBatchError(ValueError):
+    pass
+
+
+# Check a bulk request; returns (names, types, metals, client_ids) arrays.
+# Each machine may override the batch-level type_of_machine, type_of_metal
+# and client_id.
+def validate_batch(data):
+    machines = data.get('machines')
+    if machines is None:
+        count = data.get('count')
+        if not isinstance(count, int) or count < 1:
+            raise MachineBatchError('Provide machines or a positive count')
+        prefix = data.get('machine_name_prefix') or 'Machine'
+        machines = [{'machine_name': f'{prefix} {i}'} for i in range(1, count + 1)]
+
+    if not isinstance(machines, list) or not machines:
+        raise MachineBatchError('machines must be a non-empty list')
+    if len(machines) > MAX_BATCH:
+        raise MachineBatchError(f'At most {MAX_BATCH} machines per batch')
+
+    names, types, metals, client_ids = [], [], [], []
+    for index, machine in enumerate(machines):
+        if not isinstance(machine, dict):
+            raise MachineBatchError(f'machines[{index}] must be an object')
+
+        name = (machine.get('machine_name') or '').strip()
+        type_of_machine = machine.get('type_of_machine', data.get('type_of_machine'))
+        type_of_metal = (machine.get('type_of_metal', data.get('type_of_metal')) or '').strip()
+        client_id = machine.get('client_id', data.get('client_id'))
+
+        if not name or len(name) > 100:
+            raise MachineBatchError(f'machines[{index}].machine_name is required (max 100 characters)')
+        if type_of_machine not in MACHINE_TYPES:
+            raise MachineBatchError(f"machines[{index}].type_of_machine must be one of: {', '.join(MACHINE_TYPES)}")
+        if not type_of_metal or len(type_of_metal) > 50:
+            raise MachineBatchError(f'machines[{index}].type_of_metal is required (max 50 characters)')
+        if not isinstance(client_id, int):
+            raise MachineBatchError(f'machines[{index}].client_id is required')
+
+        names.append(name)
+        types.append(type_of_machine)
+        metals.append(type_of_metal)
+        client_ids.append(client_id)
+
+    return names, types, metals, client_ids
+
+
+# Register a batch in one transaction: one INSERT ... SELECT over the
+# unnested arrays draws every unique_code from machine_code_seq and takes
+# distributor_id from the client. The label sheet is queued for the worker.
+def register_batch(names, types, metals, client_ids, created_by):
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        conn.autocommit = False
+        try:
+            with conn:
+                cur.execute('SELECT client_id FROM client WHERE client_id = ANY(%s)', (list(set(client_ids)),))
+                unknown = set(client_ids) - {row[0] for row in cur.fetchall()}
+                if unknown:
+                    raise MachineBatchError(f"Unknown client_id: {', '.join(map(str, sorted(unknown)))}")
+
+                cur.execute('''
+                    INSERT INTO machine_batch (machine_count, created_by)
+                    VALUES (%s, %s)
+                    RETURNING batch_id
+                ''', (len(names), created_by))
+                batch_id = cur.fetchone()[0]
+
+                cur.execute('''
+                    INSERT INTO machine (unique_code, machine_name, type_of_machine, type_of_metal,
+                                         client_id, distributor_id, created_by, batch_id)
+                    SELECT %s || '-' || lpad(nextval('machine_code_seq')::text, 8, '0'),
+                           m.machine_name, m.type_of_machine, m.type_of_metal,
+                           m.client_id, c.distributor_id, %s, %s
+                    FROM unnest(%s::text[], %s::text[], %s::text[], %s::int[])
+                         WITH ORDINALITY AS m(machine_name, type_of_machine, type_of_metal, client_id, position)
+                    JOIN client c ON c.client_id = m.client_id
+                    ORDER BY m.position
+                    RETURNING machine_id, unique_code, machine_name
+                ''', (CODE_PREFIX, created_by, batch_id, names, types, metals, client_ids))
+                machines = [
+                    {'machine_id': machine_id, 'unique_code': unique_code, 'machine_name': machine_name}
+                    for machine_id, unique_code, machine_name in cur.fetchall()
+                ]
+
+                enqueue('generate_machine_labels', {'batch_id': batch_id}, conn=conn)
+                cache.invalidate('machine_lists', cur=cur)
+        finally:
+            cur.close()
+            conn.autocommit = True
+
+    machines.sort(key=lambda machine: machine['machine_id'])
+    return batch_id, machines
+
+
+def _qr_svg(text):
+    image = qrcode.make(text, image_factory=qrcode.image.svg.SvgPathImage, box_size=8, border=2)
+    return image.to_string(encoding='unicode')
+
+
+# Printable A4 sheet (3 x 8 labels per page) with a QR code per machine
+def render_label_sheet(batch_id, machines):
+    labels = []
+    for unique_code, machine_name, client_name in machines:
+        qr = _qr_svg(unique_code) if qrcode is not None else ''
+        labels.append(
+            f'<div class="label">{qr}<div class="code">{html.escape(unique_code)}</div>'
+            f'<div>{html.escape(machine_name)}</div><div class="client">{html.escape(client_name)}</div></div>'
+        )
+
+    return f'''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Machine labels - batch {batch_id}</title>
+<style>
+@page {{ size: A4; margin: 10mm; }}
+body {{ margin: 0; font-family: sans-serif; }}
+.sheet {{ display: grid; grid-template-columns: repeat(3, 1fr); grid-auto-rows: 34mm; gap: 2mm; }}
+.label {{ border: 1px dashed #999; padding: 2mm; text-align: center; font-size: 9pt; overflow: hidden; break-inside: avoid; }}
+.label svg {{ height: 20mm; width: 20mm; }}
+.code {{ font-weight: bold; font-family: monospace; }}
+.client {{ color: #555; font-size: 8pt; }}
+</style></head>
+<body><div class="sheet">
+{chr(10).join(labels)}
+</div></body></html>
+'''
+
+
+# Worker side: render the batch's label sheet to LABEL_DIR
+def generate_labels(batch_id):
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    cur.execute('''
+        SELECT m.unique_code, m.machine_name, c.client_name
+        FROM machine m
+        JOIN client c ON c.client_id = m.client_id
+        WHERE m.batch_id = %s
+        ORDER BY m.machine_id
+    ''', (batch_id,))
+    machines = cur.fetchall()
+
+    os.makedirs(LABEL_DIR, exist_ok=True)
+    label_file = os.path.join(LABEL_DIR, f'batch_{batch_id}.html')
+    tmp_file = label_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write(render_label_sheet(batch_id, machines))
+    os.replace(tmp_file, label_file)
+
+    cur.execute('''
+        UPDATE machine_batch SET label_status = 'ready', label_file = %s
+        WHERE batch_id = %s
+    ''', (label_file, batch_id))
+
+    cur.close()
+    conn.close()
+
+    return label_file
+
+
+def _invalidate_scan(event):
+    if event.get('machine_id') is not None:
+        scan_cache.delete(str(event['machine_id']))
+
+
+# Subscribe to reading events on first use, so only processes that serve
+# scans keep a LISTEN connection
+def _start_invalidation():
+    global _invalidation_started
+    if not _invalidation_started:
+        with _invalidation_lock:
+            if not _invalidation_started:
+                reading_events.hub.add_listener(_invalidate_scan)
+                _invalidation_started = True
+
+
+# Machine, client, distributor and latest manual readings for a scanned
+# unique_code in one query (unique_code index plus idx_reading_machine_manual)
+def load_scan(unique_code):
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+
+    cur.execute('''
+        SELECT m.machine_id, m.unique_code, m.machine_name, m.type_of_machine, m.type_of_metal,
+               m.client_id, c.client_name, c.city AS client_city,
+               m.distributor_id, d.distributor_name,
+               COALESCE(r.readings, '[]'::json) AS readings
+        FROM machine m
+        LEFT JOIN client c ON c.client_id = m.client_id
+        LEFT JOIN distributor d ON d.distributor_id = m.distributor_id
+        LEFT JOIN LATERAL (
+            SELECT json_agg(latest ORDER BY latest.created_at DESC) AS readings
+            FROM (
+                SELECT reading_id, oil_refractometer, oil_ph_level, water_ph_level,
+                       oil_top_up, water_input, status, created_at
+                FROM reading
+                WHERE machine_id = m.machine_id AND status <> 'Telemetry'
+                ORDER BY created_at DESC
+                LIMIT %s
+            ) latest
+        ) r ON TRUE
+        WHERE m.unique_code = %s
+    ''', (RECENT_READINGS, unique_code))
+    machine = cur.fetchone()
+
+    cur.close()
+    conn.close()
+
+    return machine
+
+
+def resolve_scan(unique_code):
+    _start_invalidation()
+
+    machine_id = code_cache.get(unique_code)
+    if machine_id is not None:
+        machine = scan_cache.get(str(machine_id))
+        if machine is not None:
+            return machine
+
+    machine = load_scan(unique_code)
+    if machine is not None:
+        code_cache.set(unique_code, machine['machine_id'], CODE_TTL)
+        scan_cache.set(str(machine['machine_id']), machine, SCAN_TTL)
+    return machine
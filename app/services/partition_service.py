@@ -0,0 +1,218 @@
+import argparse
+import csv
+import datetime
+import gzip
+import io
+import os
+import psycopg2.extras
+from db_config import get_db_connection, pooled_connection
+
+# Months of readings kept in live partitions
+RETENTION_MONTHS = int(os.getenv('READING_RETENTION_MONTHS', 24))
+
+# Future monthly partitions kept ready ahead of time
+MONTHS_AHEAD = 3
+
+ARCHIVE_DIR = os.getenv(
+    'READING_ARCHIVE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'archive', 'readings')
+)
+
+# Columns written by the export API, live or archived
+EXPORT_COLUMNS = (
+    'reading_id', 'machine_id', 'raised_by', 'oil_refractometer', 'oil_ph_level', 'water_ph_level',
+    'oil_top_up', 'water_input', 'status', 'response_by', 'response_timestamp',
+    'post_oil_refractometer', 'post_oil_ph_level', 'post_oil_top_up', 'post_water',
+    'post_water_ph_level', 'created_at', 'updated_at'
+)
+
+FETCH_SIZE = 5000
+
+
+def ensure_partitions(months_ahead=MONTHS_AHEAD):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT ensure_reading_partitions(%s)', (months_ahead,))
+    created = cur.fetchone()[0]
+    cur.close()
+    conn.close()
+    return created
+
+
+# First day of the month `months` before today's month
+def months_ago(months):
+    today = datetime.date.today()
+    index = today.year * 12 + today.month - 1 - months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+# Monthly partitions ending on or before the retention horizon
+def expired_partitions(cur, retention_months):
+    cur.execute('''
+        SELECT c.relname,
+               substring(pg_get_expr(c.relpartbound, c.oid) FROM 'FROM \\(''([^'']+)''\\)')::date AS range_start,
+               substring(pg_get_expr(c.relpartbound, c.oid) FROM 'TO \\(''([^'']+)''\\)')::date AS range_end
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'reading'::regclass AND c.relname ~ '^reading_y[0-9]{4}m[0-9]{2}$'
+        ORDER BY 2
+    ''')
+    horizon = months_ago(retention_months)
+    return [row for row in cur.fetchall() if row[2] is not None and row[2] <= horizon]
+
+
+# Monthly tables already detached from reading, e.g. by an archive run that
+# failed before dropping them
+def detached_partitions(cur):
+    cur.execute('''
+        SELECT relname FROM pg_class
+        WHERE relkind = 'r' AND NOT relispartition AND relname ~ '^reading_y[0-9]{4}m[0-9]{2}$'
+        AND relnamespace = 'public'::regnamespace
+        ORDER BY relname
+    ''')
+    partitions = []
+    for (partition_name,) in cur.fetchall():
+        range_start = datetime.date(int(partition_name[9:13]), int(partition_name[14:16]), 1)
+        index = range_start.year * 12 + range_start.month
+        partitions.append((partition_name, range_start, datetime.date(index // 12, index % 12 + 1, 1)))
+    return partitions
+
+
+# Detach each expired partition first, so no update or response can land
+# in it after it has been copied. Then write it to a gzipped CSV and record
+# the archive and drop it in one transaction. A failure after the detach
+# leaves the table detached; the next run picks it up from there.
+def archive_expired(retention_months=RETENTION_MONTHS):
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    archived = []
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        for partition_name, _, _ in expired_partitions(cur, retention_months):
+            cur.execute(f'ALTER TABLE reading DETACH PARTITION {partition_name}')
+
+        for partition_name, range_start, range_end in detached_partitions(cur):
+            file_path = os.path.join(ARCHIVE_DIR, f'{partition_name}.csv.gz')
+            temp_path = file_path + '.tmp'
+            with gzip.open(temp_path, 'wt', newline='') as archive:
+                cur.copy_expert(f'COPY {partition_name} TO STDOUT WITH (FORMAT csv, HEADER)', archive)
+            os.replace(temp_path, file_path)
+
+            conn.autocommit = False
+            try:
+                with conn:
+                    cur.execute(f'SELECT COUNT(*) FROM {partition_name}')
+                    row_count = cur.fetchone()[0]
+                    cur.execute('''
+                        INSERT INTO reading_archive (partition_name, range_start, range_end, file_path, row_count, file_bytes)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                        ON CONFLICT (partition_name) DO UPDATE SET
+                            file_path = EXCLUDED.file_path, row_count = EXCLUDED.row_count,
+                            file_bytes = EXCLUDED.file_bytes, archived_at = NOW()
+                    ''', (partition_name, range_start, range_end, file_path, row_count, os.path.getsize(file_path)))
+                    cur.execute(f'DROP TABLE {partition_name}')
+            finally:
+                conn.autocommit = True
+
+            archived.append({'partition': partition_name, 'rows': row_count, 'file': file_path})
+    finally:
+        cur.close()
+        conn.close()
+
+    return archived
+
+
+# COPY writes offsets as +00 / +05:30; older Pythons need +00:00
+def parse_timestamp(value):
+    value = value.replace(' ', 'T')
+    if len(value) > 3 and value[-3] in '+-' and value[-2:].isdigit():
+        value += ':00'
+    parsed = datetime.datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=datetime.timezone.utc)
+
+
+def _format(value):
+    if value is None:
+        return ''
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+# CSV export of readings in [start, end) for the given machines (None for
+# all). Archived months are read back from their files, the rest streams
+# from a server-side cursor over the live partitions.
+def export_csv(start, end, machine_ids=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    writer.writerow(EXPORT_COLUMNS)
+    yield flush()
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cur.execute('''
+        SELECT file_path FROM reading_archive
+        WHERE range_start < %s AND range_end > %s
+        ORDER BY range_start
+    ''', (end.date(), start.date()))
+    archives = [row['file_path'] for row in cur.fetchall()]
+    cur.close()
+    conn.close()
+
+    for file_path in archives:
+        with gzip.open(file_path, 'rt', newline='') as archive:
+            for row in csv.DictReader(archive):
+                if machine_ids is not None and (not row['machine_id'] or int(row['machine_id']) not in machine_ids):
+                    continue
+                if not (start <= parse_timestamp(row['created_at']) < end):
+                    continue
+                writer.writerow([row.get(column, '') for column in EXPORT_COLUMNS])
+            yield flush()
+
+    query = f'''
+        SELECT {', '.join(EXPORT_COLUMNS)} FROM reading
+        WHERE created_at >= %s AND created_at < %s
+    '''
+    params = [start, end]
+    if machine_ids is not None:
+        query += ' AND machine_id = ANY(%s)'
+        params.append(list(machine_ids))
+    query += ' ORDER BY created_at, reading_id'
+
+    with pooled_connection() as conn:
+        conn.autocommit = False
+        try:
+            cur = conn.cursor(name='reading_export')
+            cur.itersize = FETCH_SIZE
+            cur.execute(query, params)
+            for count, row in enumerate(cur, 1):
+                writer.writerow([_format(value) for value in row])
+                if count % FETCH_SIZE == 0:
+                    yield flush()
+            cur.close()
+        finally:
+            conn.rollback()
+
+    yield flush()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Maintain monthly reading partitions')
+    parser.add_argument('--months-ahead', type=int, default=MONTHS_AHEAD)
+    parser.add_argument('--retention-months', type=int, default=RETENTION_MONTHS)
+    parser.add_argument('--no-archive', action='store_true', help='only create future partitions')
+    args = parser.parse_args()
+
+    print(f"Created {ensure_partitions(args.months_ahead)} partition(s)")
+    if not args.no_archive:
+        for item in archive_expired(args.retention_months):
+            print(f"Archived {item['partition']}: {item['rows']} rows -> {item['file']}")
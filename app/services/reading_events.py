@@ -0,0 +1,156 @@
+import json
+import queue
+import select
+import threading
+import time
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+from db_config import DB_PARAMS, get_db_connection
+
+CHANNEL = 'reading_events'
+SUBSCRIBER_QUEUE_SIZE = 1000
+RESUME_LIMIT = 1000
+EVENT_RETENTION_DAYS = 7
+PRUNE_INTERVAL = 3600
+RECONNECT_DELAY = 5
+
+
+class Subscription:
+    def __init__(self, client_ids):
+        # None means every client is visible
+        self.client_ids = client_ids
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def accepts(self, event):
+        return self.client_ids is None or event.get('client_id') in self.client_ids
+
+    def push(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # A subscriber that can't keep up is dropped; it reconnects and
+            # resumes from its Last-Event-ID instead of holding memory here.
+            self.overflowed = True
+
+
+# One LISTEN connection per worker process, fanned out to SSE subscribers
+class ReadingEventHub:
+    def __init__(self):
+        self._subscribers = set()
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._listen_forever, name='reading-event-listener', daemon=True)
+                self._thread.start()
+
+    def subscribe(self, client_ids):
+        self.start()
+        subscription = Subscription(client_ids)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    # In-process callback(event) for every event, e.g. cache invalidation
+    def add_listener(self, callback):
+        with self._lock:
+            self._listeners.append(callback)
+        self.start()
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Reading event listener callback failed: {e}")
+        for subscription in subscribers:
+            if subscription.accepts(event):
+                subscription.push(event)
+
+    def _listen_forever(self):
+        while True:
+            try:
+                self._listen()
+            except Exception as e:
+                print(f"Reading event listener error: {e}")
+            time.sleep(RECONNECT_DELAY)
+
+    def _listen(self):
+        conn = psycopg2.connect(**DB_PARAMS)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        try:
+            cur = conn.cursor()
+            cur.execute(f'LISTEN {CHANNEL}')
+            last_prune = 0
+
+            while True:
+                if time.time() - last_prune > PRUNE_INTERVAL:
+                    prune_events(cur)
+                    last_prune = time.time()
+
+                if select.select([conn], [], [], 5) == ([], [], []):
+                    continue
+
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    try:
+                        self.publish(json.loads(notify.payload))
+                    except ValueError:
+                        print(f"Ignoring malformed reading event: {notify.payload}")
+        finally:
+            conn.close()
+
+
+# Delete events older than the resume window
+def prune_events(cur):
+    cur.execute(
+        "DELETE FROM reading_event WHERE created_at < NOW() - %s * INTERVAL '1 day'",
+        (EVENT_RETENTION_DAYS,)
+    )
+
+
+# Events after last_event_id, used to resume an interrupted stream
+def load_events_since(last_event_id, client_ids, limit=RESUME_LIMIT):
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+
+    query = '''
+        SELECT event_id, event_type, reading_id, machine_id, client_id,
+               distributor_id, status, created_at
+        FROM reading_event
+        WHERE event_id > %s
+    '''
+    params = [last_event_id]
+
+    if client_ids is not None:
+        query += ' AND client_id = ANY(%s)'
+        params.append(list(client_ids))
+
+    query += ' ORDER BY event_id LIMIT %s'
+    params.append(limit)
+
+    cur.execute(query, params)
+    events = cur.fetchall()
+
+    cur.close()
+    conn.close()
+
+    for event in events:
+        event['created_at'] = event['created_at'].isoformat()
+    return events
+
+
+hub = ReadingEventHub()
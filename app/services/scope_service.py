@@ -0,0 +1,65 @@
+from db_config import get_db_connection
+
+# Roles that can see every client
+UNSCOPED_ROLES = ('admin', 'manufacturer')
+
+
+# SQL selecting the distributor_ids whose clients a user sees through the
+# distributor. Returns (None, ()) for roles that are not scoped that way.
+def distributor_scope_sql(current_user):
+    role = current_user['role']
+    user_id = current_user['user_id']
+
+    if role == 'manager' or role == 'distributor':
+        return 'SELECT distributor_id FROM distributor WHERE created_by = %s', (user_id,)
+
+    if role == 'employee':
+        return '''
+            SELECT distributor_id FROM distributor WHERE created_by = (
+                SELECT user_id FROM user_details
+                WHERE role IN ('manager', 'distributor') AND company = (
+                    SELECT company FROM user_details WHERE user_id = %s
+                )
+            )
+        ''', (user_id,)
+
+    return None, ()
+
+
+# SQL selecting the client_ids a user may see, using the same rules as
+# get_clients in run.py. Returns (None, ()) for roles that see everything.
+def client_scope_sql(current_user):
+    role = current_user['role']
+    user_id = current_user['user_id']
+
+    if role in UNSCOPED_ROLES:
+        return None, ()
+
+    if role in ('manager', 'distributor', 'employee'):
+        distributor_query, distributor_params = distributor_scope_sql(current_user)
+        return f'''
+            SELECT client_id FROM client
+            WHERE created_by = %s OR distributor_id IN ({distributor_query})
+        ''', (user_id, *distributor_params)
+
+    if role == 'client':
+        return 'SELECT client_id FROM client WHERE gst_number = %s', (current_user['company'],)
+
+    # Unknown roles see nothing
+    return 'SELECT client_id FROM client WHERE FALSE', ()
+
+
+# Materialize the visible client_ids; None means unrestricted
+def visible_client_ids(current_user):
+    query, params = client_scope_sql(current_user)
+    if query is None:
+        return None
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(query, params)
+    client_ids = {row[0] for row in cur.fetchall()}
+    cur.close()
+    conn.close()
+
+    return client_ids
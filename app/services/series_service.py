@@ -0,0 +1,126 @@
+import numpy as np
+from db_config import pooled_connection
+
+METRICS = ('oil_refractometer', 'oil_ph_level', 'water_ph_level')
+
+MAX_WIDTH = 2000
+MAX_MACHINES = 20
+
+# Rows pulled from the server-side cursor per round trip
+FETCH_SIZE = 5000
+
+
+# Largest-Triangle-Three-Buckets: keeps the first and last point and, for
+# each bucket in between, the point forming the largest triangle with the
+# previously kept point and the average of the next bucket
+def lttb(t, v, threshold):
+    n = len(t)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    previous = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_lo, next_hi = hi, (edges[i + 2] if i + 2 < len(edges) else n)
+        avg_t = t[next_lo:next_hi].mean() if next_hi > next_lo else t[-1]
+        avg_v = v[next_lo:next_hi].mean() if next_hi > next_lo else v[-1]
+
+        area = np.abs(
+            (t[previous] - avg_t) * (v[lo:hi] - v[previous])
+            - (t[previous] - t[lo:hi]) * (avg_v - v[previous])
+        )
+        previous = lo + int(np.argmax(area))
+        selected[i + 1] = previous
+
+    return selected
+
+
+# Min/max bucketing: the lowest and highest point of each time bucket, so
+# spikes survive at any zoom level
+def min_max(t, v, buckets, start, end):
+    n = len(t)
+    if n <= 2 * buckets:
+        return np.arange(n)
+
+    bucket = np.minimum(((t - start) / (end - start) * buckets).astype(np.int64), buckets - 1)
+    boundaries = np.flatnonzero(np.diff(bucket)) + 1
+    starts = np.concatenate(([0], boundaries))
+
+    # Points are time ordered, so buckets are contiguous runs
+    lows = np.minimum.reduceat(v, starts)
+    highs = np.maximum.reduceat(v, starts)
+    selected = []
+    for run, s in enumerate(starts):
+        e = starts[run + 1] if run + 1 < len(starts) else n
+        segment = v[s:e]
+        low = s + int(np.flatnonzero(segment == lows[run])[0])
+        high = s + int(np.flatnonzero(segment == highs[run])[0])
+        selected.extend(sorted({low, high}))
+    return np.array(selected, dtype=np.int64)
+
+
+def downsample(t, values, width, mode, start, end):
+    series = {}
+    for metric, v in values.items():
+        # Telemetry rows may leave metrics NULL (NaN here); they are gaps,
+        # not points
+        present = ~np.isnan(v)
+        metric_t, v = t[present], v[present]
+        if mode == 'minmax':
+            # Two points per bucket keep the payload at `width` points
+            index = min_max(metric_t, v, max(width // 2, 1), start, end)
+        else:
+            index = lttb(metric_t, v, width)
+        series[metric] = {
+            't': (metric_t[index] * 1000).astype(np.int64).tolist(),
+            'v': v[index].round(4).tolist()
+        }
+    return series
+
+
+# Downsampled series for several machines over [start, end). Rows stream
+# from a server-side cursor in machine order, so only one machine's range
+# is held in memory at a time.
+def machine_series(machine_ids, start, end, width, mode='lttb', metrics=METRICS):
+    start_epoch, end_epoch = start.timestamp(), end.timestamp()
+    result = {machine_id: {'machine_id': machine_id, 'points': 0, 'metrics': {}} for machine_id in machine_ids}
+
+    def flush(machine_id, rows):
+        data = np.array(rows, dtype=np.float64)
+        values = {metric: data[:, i + 1] for i, metric in enumerate(metrics)}
+        result[machine_id]['points'] = len(rows)
+        result[machine_id]['metrics'] = downsample(data[:, 0], values, width, mode, start_epoch, end_epoch)
+
+    with pooled_connection() as conn:
+        conn.autocommit = False
+        try:
+            cur = conn.cursor(name='machine_series')
+            cur.itersize = FETCH_SIZE
+            cur.execute(f'''
+                SELECT machine_id, EXTRACT(EPOCH FROM created_at)::float8, {', '.join(metrics)}
+                FROM reading
+                WHERE machine_id = ANY(%s) AND created_at >= %s AND created_at < %s
+                AND status <> 'Not In Use'
+                ORDER BY machine_id, created_at
+            ''', (list(machine_ids), start, end))
+
+            current, rows = None, []
+            for row in cur:
+                if row[0] != current:
+                    if rows:
+                        flush(current, rows)
+                    current, rows = row[0], []
+                rows.append(row[1:])
+            if rows:
+                flush(current, rows)
+
+            cur.close()
+        finally:
+            conn.rollback()
+
+    return [result[machine_id] for machine_id in machine_ids]
@@ -0,0 +1,253 @@
+import datetime
+import os
+from db_config import get_db_connection
+from app.services.scope_service import client_scope_sql, distributor_scope_sql
+from app.services.hierarchy_service import employee_scope_sql
+
+DEFAULT_BATCH = 500
+MAX_BATCH = 5000
+
+# Initial downloads only carry this much reading history (keep the
+# client_scope_sync_change trigger argument in 20_sync_changes.sql in step)
+SNAPSHOT_READING_DAYS = int(os.getenv('SYNC_SNAPSHOT_READING_DAYS', 90))
+
+# Change log entries older than this are pruned; devices further behind resync
+RETENTION_DAYS = int(os.getenv('SYNC_RETENTION_DAYS', 30))
+
+# Entity -> (table, id column, client column, synced columns). Order is the
+# order of the initial download.
+ENTITIES = {
+    'clients': ('client', 'client_id', 'client_id', (
+        'client_id', 'client_name', 'city', 'address', 'primary_contact_person', 'primary_country_code',
+        'primary_mobile_number', 'email_id', 'gst_number', 'types_of_metals', 'client_category',
+        'distributor_id', 'updated_at',
+    )),
+    'machines': ('machine', 'machine_id', 'client_id', (
+        'machine_id', 'unique_code', 'machine_name', 'type_of_machine', 'type_of_metal',
+        'client_id', 'distributor_id', 'updated_at',
+    )),
+    'employees': ('employee_details', 'id', None, (
+        'id', 'employee_name', 'mobile_country_code', 'mobile_number', 'whatsapp_country_code',
+        'whatsapp_number', 'email', 'employee_type', 'manager_id', 'manager_name', 'updated_at',
+    )),
+    'readings': ('reading', 'reading_id', 'machine_id', (
+        'reading_id', 'machine_id', 'raised_by', 'oil_refractometer', 'oil_ph_level', 'water_ph_level',
+        'oil_top_up', 'water_input', 'status', 'response_by', 'response_timestamp', 'created_at', 'updated_at',
+    )),
+}
+ENTITY_NAMES = list(ENTITIES)
+
+
+class SyncTokenError(ValueError):
+    pass
+
+
+class SyncTokenExpired(Exception):
+    pass
+
+
+# Tokens: "s.<start xmin>.<entity index>.<last id>" while the initial
+# download runs, then "c.<txid>.<change_id>" positions in sync_change
+def parse_token(token):
+    try:
+        kind, *parts = token.split('.')
+        parts = [int(part) for part in parts]
+    except ValueError:
+        raise SyncTokenError('Malformed sync token')
+
+    if kind == 's' and len(parts) == 3 and 0 <= parts[1] < len(ENTITY_NAMES):
+        return kind, parts
+    if kind == 'c' and len(parts) == 2:
+        return kind, parts
+    raise SyncTokenError('Malformed sync token')
+
+
+def _scope_filter(entity, current_user, alias=''):
+    table, id_column, client_column, _ = ENTITIES[entity]
+
+    if client_column is None:
+        return employee_scope_sql(current_user, f'{alias}{id_column}')
+
+    scope_query, scope_params = client_scope_sql(current_user)
+    if scope_query is None:
+        return '', []
+    if client_column == 'machine_id':
+        return (f' AND {alias}machine_id IN (SELECT machine_id FROM machine WHERE client_id IN ({scope_query}))',
+                list(scope_params))
+    return f' AND {alias}{client_column} IN ({scope_query})', list(scope_params)
+
+
+def _compact(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+def _add_rows(changes, entity, rows):
+    if rows:
+        entry = changes.setdefault(entity, {'columns': list(ENTITIES[entity][3]), 'rows': [], 'deleted': []})
+        entry['rows'].extend([_compact(value) for value in row] for row in rows)
+
+
+def _add_deleted(changes, entity, ids):
+    if ids:
+        entry = changes.setdefault(entity, {'columns': list(ENTITIES[entity][3]), 'rows': [], 'deleted': []})
+        entry['deleted'].extend(ids)
+
+
+def _current_xmin(cur):
+    cur.execute('SELECT txid_snapshot_xmin(txid_current_snapshot())')
+    return cur.fetchone()[0]
+
+
+def _check_horizon(cur, txid, change_id):
+    cur.execute('SELECT txid, change_id FROM sync_horizon')
+    horizon = cur.fetchone()
+    if horizon and (txid, change_id) < tuple(horizon):
+        raise SyncTokenExpired()
+
+
+# Initial download: page through the tables in ENTITIES order. Anything
+# that changes meanwhile is replayed from the log starting at start_xmin.
+def _snapshot_batch(cur, current_user, start_xmin, entity_index, last_id, limit):
+    changes = {}
+    remaining = limit
+
+    while remaining > 0 and entity_index < len(ENTITY_NAMES):
+        entity = ENTITY_NAMES[entity_index]
+        table, id_column, _, columns = ENTITIES[entity]
+        scope_sql, params = _scope_filter(entity, current_user)
+
+        query = f'SELECT {", ".join(columns)} FROM {table} WHERE {id_column} > %s'
+        params = [last_id] + params
+        if entity == 'readings':
+            query += " AND status <> 'Telemetry' AND created_at >= NOW() - make_interval(days => %s)"
+            params.append(SNAPSHOT_READING_DAYS)
+        query += f'{scope_sql} ORDER BY {id_column} LIMIT %s'
+        params.append(remaining)
+
+        cur.execute(query, params)
+        rows = cur.fetchall()
+        _add_rows(changes, entity, rows)
+        remaining -= len(rows)
+
+        if remaining > 0:
+            # This entity is exhausted
+            entity_index += 1
+            last_id = 0
+        else:
+            last_id = rows[-1][0]
+
+    if entity_index >= len(ENTITY_NAMES):
+        return changes, f'c.{start_xmin}.0', False
+    return changes, f's.{start_xmin}.{entity_index}.{last_id}', True
+
+
+# Changes after (txid, change_id) from transactions that have all finished,
+# collapsed to the last operation per row
+def _change_batch(cur, current_user, txid, change_id, limit):
+    _check_horizon(cur, txid, change_id)
+    xmin = _current_xmin(cur)
+
+    query = '''
+        SELECT txid, change_id, entity, entity_id, op FROM sync_change
+        WHERE (txid, change_id) > (%s, %s) AND txid < %s
+    '''
+    params = [txid, change_id, xmin]
+
+    # Tombstones carrying a distributor_id are for devices that saw a client
+    # through that distributor and no longer see it at all
+    scope_query, scope_params = client_scope_sql(current_user)
+    distributor_query, distributor_params = distributor_scope_sql(current_user)
+    if scope_query is None:
+        query += ' AND distributor_id IS NULL'
+    elif distributor_query is None:
+        query += f' AND distributor_id IS NULL AND (client_id IS NULL OR client_id IN ({scope_query}))'
+        params.extend(scope_params)
+    else:
+        query += f''' AND CASE WHEN distributor_id IS NULL
+                            THEN client_id IS NULL OR client_id IN ({scope_query})
+                            ELSE distributor_id IN ({distributor_query}) AND client_id NOT IN ({scope_query})
+                       END'''
+        params.extend(scope_params + distributor_params + scope_params)
+
+    query += ' ORDER BY txid, change_id LIMIT %s'
+    params.append(limit)
+
+    cur.execute(query, params)
+    log = cur.fetchall()
+
+    latest = {}
+    for _, _, entity, entity_id, op in log:
+        latest[(entity, entity_id)] = op
+
+    changes = {}
+    for entity in ENTITY_NAMES:
+        table, id_column, _, columns = ENTITIES[entity]
+        upserts = [entity_id for (name, entity_id), op in latest.items() if name == entity and op == 'U']
+        deletes = [entity_id for (name, entity_id), op in latest.items() if name == entity and op == 'D']
+
+        if upserts:
+            scope_sql, scope_params = _scope_filter(entity, current_user)
+            # Rows deleted since are skipped here; their tombstone follows
+            cur.execute(
+                f'SELECT {", ".join(columns)} FROM {table} WHERE {id_column} = ANY(%s){scope_sql} ORDER BY {id_column}',
+                [upserts] + scope_params
+            )
+            _add_rows(changes, entity, cur.fetchall())
+
+        _add_deleted(changes, entity, deletes)
+
+    if len(log) == limit:
+        return changes, f'c.{log[-1][0]}.{log[-1][1]}', True
+    # Caught up: everything before xmin has been delivered
+    return changes, f'c.{xmin}.0', False
+
+
+def sync(current_user, token=None, limit=DEFAULT_BATCH):
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        if not token:
+            start_xmin = _current_xmin(cur)
+            changes, next_token, has_more = _snapshot_batch(cur, current_user, start_xmin, 0, 0, limit)
+        else:
+            kind, parts = parse_token(token)
+            if kind == 's':
+                _check_horizon(cur, parts[0], 0)
+                changes, next_token, has_more = _snapshot_batch(cur, current_user, *parts, limit)
+            else:
+                changes, next_token, has_more = _change_batch(cur, current_user, *parts, limit)
+    finally:
+        cur.close()
+        conn.close()
+
+    return {'changes': changes, 'sync_token': next_token, 'has_more': has_more}
+
+
+# Drop old log entries and remember how far the log reaches back
+def prune_changes(retention_days=RETENTION_DAYS):
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    cur.execute('''
+        WITH pruned AS (
+            DELETE FROM sync_change
+            WHERE changed_at < NOW() - make_interval(days => %s)
+            RETURNING txid, change_id
+        ), last AS (
+            SELECT txid, change_id FROM pruned ORDER BY txid DESC, change_id DESC LIMIT 1
+        )
+        UPDATE sync_horizon h SET txid = last.txid, change_id = last.change_id
+        FROM last
+        WHERE (last.txid, last.change_id) > (h.txid, h.change_id)
+        RETURNING (SELECT COUNT(*) FROM pruned)
+    ''', (retention_days,))
+    row = cur.fetchone()
+    pruned = row[0] if row else 0
+
+    cur.close()
+    conn.close()
+
+    return pruned
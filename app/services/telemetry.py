@@ -0,0 +1,391 @@
+import datetime
+import hashlib
+import hmac
+import io
+import json
+import math
+import os
+import secrets
+import threading
+import time
+import psycopg2
+from db_config import get_db_connection
+from app.services import alert_rules
+from app.utils import metrics
+
+# Buffered messages before producers are pushed back
+MAX_BUFFER = int(os.getenv('TELEMETRY_MAX_BUFFER', 200000))
+
+# Flush when this many rows are waiting or this much time has passed
+FLUSH_ROWS = int(os.getenv('TELEMETRY_FLUSH_ROWS', 10000))
+FLUSH_INTERVAL_MS = int(os.getenv('TELEMETRY_FLUSH_INTERVAL_MS', 250))
+
+EVALUATE_ALERTS = os.getenv('TELEMETRY_EVALUATE_ALERTS', '1') == '1'
+
+# Accepted distance of a message's ts from its arrival: sensors may buffer
+# readings while offline, but never report from the future
+MAX_BACKFILL_SECONDS = int(os.getenv('TELEMETRY_MAX_BACKFILL_SECONDS', 7 * 24 * 3600))
+MAX_CLOCK_SKEW_SECONDS = int(os.getenv('TELEMETRY_MAX_CLOCK_SKEW_SECONDS', 300))
+
+# Rows a flush could not write even on their own, one JSON object per line
+DEAD_LETTER_FILE = os.getenv(
+    'TELEMETRY_DEAD_LETTER_FILE',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                 'archive', 'telemetry', 'dead_letter.jsonl')
+)
+
+# How often the unique_code -> machine_id map is reloaded
+DIRECTORY_REFRESH_SECONDS = 60
+
+# Codes missing from the map are looked up one by one, at most this many
+# times a second per process, and remembered as unknown for a while
+MISS_LOOKUPS_PER_SECOND = 5
+UNKNOWN_CODE_TTL = 60
+MAX_UNKNOWN_CODES = 10000
+
+# Gateways that post for many machines authenticate with one of these
+# instead of per-device keys
+GATEWAY_KEYS = [key for key in os.getenv('TELEMETRY_GATEWAY_KEYS', '').split(',') if key]
+
+FIELDS = ('oil_refractometer', 'oil_ph_level', 'water_ph_level')
+
+# Short names accepted by the line protocol
+FIELD_ALIASES = {'rf': 'oil_refractometer', 'oil_ph': 'oil_ph_level', 'water_ph': 'water_ph_level'}
+
+COPY_COLUMNS = ('reading_id', 'machine_id', 'oil_refractometer', 'oil_ph_level', 'water_ph_level',
+                'status', 'created_at', 'updated_at')
+
+
+class TelemetryError(ValueError):
+    pass
+
+
+class TelemetryAuthError(TelemetryError):
+    pass
+
+
+def hash_device_key(device_key):
+    return hashlib.sha256(device_key.encode()).hexdigest()
+
+
+def is_gateway_key(key):
+    return any(hmac.compare_digest(key, gateway_key) for gateway_key in GATEWAY_KEYS)
+
+
+# New random key for a machine's sensor; only its hash is stored, so the
+# key is shown once. Returns (unique_code, key), or None if there is no
+# such machine.
+def issue_device_key(machine_id):
+    device_key = secrets.token_urlsafe(32)
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('''
+        UPDATE machine SET telemetry_key_hash = %s
+        WHERE machine_id = %s
+        RETURNING unique_code
+    ''', (hash_device_key(device_key), machine_id))
+    row = cur.fetchone()
+    cur.close()
+    conn.close()
+
+    if row is None:
+        return None
+    directory.forget(row[0])
+    return row[0], device_key
+
+
+# unique_code -> (machine_id, telemetry_key_hash), reloaded periodically
+class MachineDirectory:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._codes = {}
+        self._loaded_at = 0.0
+        self._unknown = {}
+        self._lookup_second = 0
+        self._lookups = 0
+
+    def _load(self):
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute('SELECT unique_code, machine_id, telemetry_key_hash FROM machine')
+        self._codes = {code: (machine_id, key_hash) for code, machine_id, key_hash in cur.fetchall()}
+        cur.close()
+        conn.close()
+        self._loaded_at = time.monotonic()
+
+    def _lookup(self, unique_code):
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute('SELECT machine_id, telemetry_key_hash FROM machine WHERE unique_code = %s', (unique_code,))
+        row = cur.fetchone()
+        cur.close()
+        conn.close()
+        return tuple(row) if row else None
+
+    def forget(self, unique_code):
+        with self._lock:
+            self._codes.pop(unique_code, None)
+            self._unknown.pop(unique_code, None)
+
+    def resolve(self, unique_code):
+        now = time.monotonic()
+        if now - self._loaded_at > DIRECTORY_REFRESH_SECONDS:
+            with self._lock:
+                if now - self._loaded_at > DIRECTORY_REFRESH_SECONDS:
+                    self._load()
+
+        entry = self._codes.get(unique_code)
+        if entry is not None:
+            return entry
+
+        with self._lock:
+            if self._unknown.get(unique_code, 0) > now:
+                return None
+            if int(now) != self._lookup_second:
+                self._lookup_second, self._lookups = int(now), 0
+            if self._lookups >= MISS_LOOKUPS_PER_SECOND:
+                metrics.increment('telemetry.lookups_throttled')
+                return None
+            self._lookups += 1
+
+        entry = self._lookup(unique_code)
+        with self._lock:
+            if entry is not None:
+                self._codes[unique_code] = entry
+            else:
+                if len(self._unknown) >= MAX_UNKNOWN_CODES:
+                    self._unknown.clear()
+                self._unknown[unique_code] = now + UNKNOWN_CODE_TTL
+        return entry
+
+
+directory = MachineDirectory()
+
+
+# Turn a message dict (unique_code, measurements, optional ts in epoch
+# milliseconds or ISO format) into a buffer row. Unless the sender is
+# trusted (a gateway), device_key must be the machine's issued key.
+def parse_message(message, received_at=None, device_key=None, trusted=False):
+    unique_code = message.get('unique_code')
+    if not unique_code:
+        raise TelemetryError('unique_code is required')
+
+    entry = directory.resolve(unique_code)
+    if not trusted:
+        key_hash = entry[1] if entry else None
+        if not (key_hash and device_key and hmac.compare_digest(key_hash, hash_device_key(device_key))):
+            raise TelemetryAuthError('Invalid unique_code or device key')
+    elif entry is None:
+        raise TelemetryError(f'Unknown unique_code: {unique_code}')
+    machine_id = entry[0]
+
+    values = []
+    for field in FIELDS:
+        value = message.get(field)
+        try:
+            value = float(value) if value not in (None, '') else None
+        except (TypeError, ValueError):
+            raise TelemetryError(f'{field} must be a number')
+        if value is not None and not math.isfinite(value):
+            raise TelemetryError(f'{field} must be a finite number')
+        values.append(value)
+    if all(value is None for value in values):
+        raise TelemetryError('At least one measurement is required')
+
+    received_at = received_at or time.time()
+    ts = message.get('ts')
+    try:
+        if ts in (None, ''):
+            created_at = received_at
+        elif isinstance(ts, (int, float)) or str(ts).isdigit():
+            created_at = float(ts) / 1000.0
+        else:
+            created_at = datetime.datetime.fromisoformat(str(ts)).timestamp()
+    except (ValueError, OverflowError, OSError):
+        raise TelemetryError('ts must be epoch milliseconds or ISO 8601')
+    if not received_at - MAX_BACKFILL_SECONDS <= created_at <= received_at + MAX_CLOCK_SKEW_SECONDS:
+        raise TelemetryError('ts is too far from the current time')
+
+    return (machine_id, values[0], values[1], values[2], created_at)
+
+
+# Line protocol: "<unique_code> <field>=<value>[,<field>=<value>...] [<ts_ms>]"
+def parse_line(line, received_at=None, device_key=None, trusted=False):
+    parts = line.strip().split()
+    if len(parts) not in (2, 3):
+        raise TelemetryError('Expected "<unique_code> <field>=<value>,... [ts_ms]"')
+
+    message = {'unique_code': parts[0]}
+    for pair in parts[1].split(','):
+        field, _, value = pair.partition('=')
+        message[FIELD_ALIASES.get(field, field)] = value
+    if len(parts) == 3:
+        message['ts'] = parts[2]
+    return parse_message(message, received_at, device_key, trusted)
+
+
+# Bounded in-memory buffer drained by a background flusher thread.
+# offer() returns False when full (or waits up to `timeout` for room) so
+# each transport can push back in its own way.
+class TelemetryBuffer:
+    def __init__(self, max_size=MAX_BUFFER, flush_rows=FLUSH_ROWS, flush_interval_ms=FLUSH_INTERVAL_MS):
+        self.max_size = max_size
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval_ms / 1000.0
+        self._rows = []
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._room = threading.Condition(self._lock)
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='telemetry-flusher', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._lock:
+            self._ready.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def size(self):
+        return len(self._rows)
+
+    def offer(self, rows, timeout=0):
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while len(self._rows) + len(rows) > self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    metrics.increment('telemetry.rejected', len(rows))
+                    return False
+                self._room.wait(remaining)
+            self._rows.extend(rows)
+            if len(self._rows) >= self.flush_rows:
+                self._ready.notify()
+        metrics.increment('telemetry.accepted', len(rows))
+        return True
+
+    def _take(self):
+        with self._lock:
+            if len(self._rows) < self.flush_rows and not self._stop.is_set():
+                self._ready.wait(self.flush_interval)
+            rows, self._rows = self._rows, []
+            self._room.notify_all()
+        return rows
+
+    def _run(self):
+        conn = None
+        while True:
+            rows = self._take()
+            if rows:
+                try:
+                    if conn is None or conn.closed:
+                        conn = get_db_connection()
+                        conn.autocommit = False
+                    flush_or_split(conn, rows)
+                except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                    # Database unreachable: put the batch back (as far as it
+                    # fits) and retry on the next tick
+                    print(f"Telemetry flush failed ({len(rows)} rows): {e}")
+                    metrics.increment('telemetry.flush_errors')
+                    if conn is not None:
+                        conn.close()
+                        conn = None
+                    self._requeue(rows)
+                    self._stop.wait(1.0)
+            elif self._stop.is_set():
+                break
+        if conn is not None:
+            conn.close()
+
+    def _requeue(self, rows):
+        with self._lock:
+            room = max(self.max_size - len(self._rows), 0)
+            self._rows[:0] = rows[:room]
+        dropped = len(rows) - room
+        if dropped > 0:
+            print(f"Telemetry buffer full, dropped {dropped} rows")
+            metrics.increment('telemetry.dropped', dropped)
+
+
+# Flush a batch; when a row makes it fail (a bad value, a machine deleted
+# since the message arrived), split the batch in halves and retry each, so
+# only the offending rows end up in the dead-letter file. Connection errors
+# are raised for the caller to retry the whole batch.
+def flush_or_split(conn, rows):
+    try:
+        flush(conn, rows)
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        raise
+    except (psycopg2.Error, ValueError, OverflowError) as e:
+        conn.rollback()
+        metrics.increment('telemetry.flush_errors')
+        if len(rows) == 1:
+            dead_letter(rows, e)
+            return
+        middle = len(rows) // 2
+        flush_or_split(conn, rows[:middle])
+        flush_or_split(conn, rows[middle:])
+
+
+def dead_letter(rows, error):
+    print(f"Telemetry dead-lettered {len(rows)} row(s): {error}")
+    metrics.increment('telemetry.dead_lettered', len(rows))
+    os.makedirs(os.path.dirname(DEAD_LETTER_FILE), exist_ok=True)
+    with open(DEAD_LETTER_FILE, 'a') as f:
+        for machine_id, refractometer, oil_ph, water_ph, created_at in rows:
+            f.write(json.dumps({
+                'machine_id': machine_id, 'oil_refractometer': refractometer, 'oil_ph_level': oil_ph,
+                'water_ph_level': water_ph, 'created_at': created_at, 'error': str(error).strip()
+            }) + '\n')
+
+
+def _copy_value(value):
+    return '\\N' if value is None else repr(value)
+
+
+# Write a batch with one COPY in one transaction (conn must not be in
+# autocommit), so a failed batch can be retried without duplicates.
+# reading_ids are drawn from the sequence up front so alerts can reference
+# the new rows without a RETURNING round trip.
+def flush(conn, rows):
+    started = time.perf_counter()
+    cur = conn.cursor()
+
+    cur.execute("SELECT nextval('reading_reading_id_seq') FROM generate_series(1, %s)", (len(rows),))
+    reading_ids = [row[0] for row in cur.fetchall()]
+
+    buffer = io.StringIO()
+    for reading_id, (machine_id, refractometer, oil_ph, water_ph, created_at) in zip(reading_ids, rows):
+        ts = datetime.datetime.fromtimestamp(created_at, datetime.timezone.utc).isoformat()
+        buffer.write(
+            f"{reading_id}\t{machine_id}\t{_copy_value(refractometer)}\t{_copy_value(oil_ph)}\t"
+            f"{_copy_value(water_ph)}\tTelemetry\t{ts}\t{ts}\n"
+        )
+    buffer.seek(0)
+    cur.copy_expert(f"COPY reading ({', '.join(COPY_COLUMNS)}) FROM STDIN", buffer)
+
+    if EVALUATE_ALERTS:
+        alert_rules.evaluate_and_record(cur, [
+            {'reading_id': reading_id, 'machine_id': row[0], 'oil_refractometer': row[1],
+             'oil_ph_level': row[2], 'water_ph_level': row[3]}
+            for reading_id, row in zip(reading_ids, rows)
+        ])
+
+    conn.commit()
+    cur.close()
+
+    elapsed = time.perf_counter() - started
+    metrics.record_timing('telemetry.flush', elapsed)
+    metrics.increment('telemetry.flushed_rows', len(rows))
+    metrics.increment('telemetry.flushes')
+
+
+buffer = TelemetryBuffer()
@@ -0,0 +1,134 @@
+import threading
+import time
+import psycopg2.extras
+from db_config import get_db_connection
+from app.services.scope_service import client_scope_sql
+
+DEFAULT_LEASE_SECONDS = 15 * 60
+MAX_LEASE_SECONDS = 2 * 60 * 60
+MAX_CLAIM = 50
+
+# Expired leases are swept at most this often per process
+RELEASE_INTERVAL = 30
+
+_last_release = 0.0
+_release_lock = threading.Lock()
+
+QUEUE_COLUMNS = '''
+    r.reading_id, r.machine_id, r.raised_by, r.priority, r.status,
+    r.oil_refractometer, r.oil_ph_level, r.water_ph_level,
+    r.oil_top_up, r.water_input, r.created_at,
+    r.claimed_by, r.claimed_at, r.lease_expires_at
+'''
+
+
+# Return readings whose lease ran out to the queue
+def release_expired_claims(cur, force=False):
+    global _last_release
+    with _release_lock:
+        if not force and time.time() - _last_release < RELEASE_INTERVAL:
+            return 0
+        _last_release = time.time()
+
+    cur.execute('''
+        UPDATE reading
+        SET claimed_by = NULL, claimed_at = NULL, lease_expires_at = NULL
+        WHERE claimed_by IS NOT NULL AND lease_expires_at < NOW()
+    ''')
+    return cur.rowcount
+
+
+# Hand out the next pending readings to a responder. Rows locked by a
+# concurrent claim are skipped rather than waited on.
+def claim_readings(current_user, limit=1, client_id=None, lease_seconds=DEFAULT_LEASE_SECONDS):
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+
+    release_expired_claims(cur)
+
+    query = 'SELECT r.reading_id FROM reading r'
+    conditions = ["r.status = 'Pending'", 'r.claimed_by IS NULL']
+    params = []
+
+    scope_query, scope_params = client_scope_sql(current_user)
+    if client_id is not None or scope_query is not None:
+        query += ' JOIN machine m ON m.machine_id = r.machine_id'
+    if client_id is not None:
+        conditions.append('m.client_id = %s')
+        params.append(client_id)
+    if scope_query is not None:
+        conditions.append(f'm.client_id IN ({scope_query})')
+        params.extend(scope_params)
+
+    query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY r.priority DESC, r.created_at LIMIT %s FOR UPDATE OF r SKIP LOCKED'
+    params.append(limit)
+
+    cur.execute(f'''
+        WITH next AS ({query})
+        UPDATE reading r
+        SET claimed_by = %s, claimed_at = NOW(),
+            lease_expires_at = NOW() + %s * INTERVAL '1 second'
+        FROM next
+        WHERE r.reading_id = next.reading_id
+        RETURNING {QUEUE_COLUMNS}
+    ''', params + [current_user['user_id'], lease_seconds])
+    claimed = cur.fetchall()
+
+    cur.close()
+    conn.close()
+
+    claimed.sort(key=lambda row: (-row['priority'], row['created_at']))
+    return claimed
+
+
+# Give a claimed reading back; returns False if the caller doesn't hold it
+def release_reading(current_user, reading_id):
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    cur.execute('''
+        UPDATE reading
+        SET claimed_by = NULL, claimed_at = NULL, lease_expires_at = NULL
+        WHERE reading_id = %s AND claimed_by = %s
+    ''', (reading_id, current_user['user_id']))
+    released = cur.rowcount == 1
+
+    cur.close()
+    conn.close()
+
+    return released
+
+
+# Pending readings split by claim state, counted from the partial indexes
+def queue_depth():
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    cur.execute("SELECT COUNT(*) FROM reading WHERE status = 'Pending' AND claimed_by IS NULL")
+    unclaimed = cur.fetchone()[0]
+
+    cur.execute('''
+        SELECT COUNT(*),
+               COUNT(*) FILTER (WHERE lease_expires_at < NOW()),
+               MIN(claimed_at)
+        FROM reading WHERE claimed_by IS NOT NULL
+    ''')
+    claimed, expired, oldest_claim = cur.fetchone()
+
+    cur.execute('''
+        SELECT MIN(created_at) FROM reading
+        WHERE status = 'Pending' AND claimed_by IS NULL
+    ''')
+    oldest_pending = cur.fetchone()[0]
+
+    cur.close()
+    conn.close()
+
+    return {
+        'unclaimed': unclaimed,
+        'claimed': claimed,
+        'expired_leases': expired,
+        'oldest_pending_at': oldest_pending,
+        'oldest_claim_at': oldest_claim
+    }
@@ -0,0 +1,230 @@
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+import jwt
+import psycopg2.errors
+from flask import request, jsonify, g, current_app
+from db_config import set_statement_timeout, reset_statement_timeout
+from app.utils import metrics
+from app.utils.auth_utils import get_batch_identity
+
+# Requests this process works on at once across all classes
+CAPACITY = int(os.getenv('ADMISSION_CAPACITY', 32))
+
+# Priority classes, highest first.
+#   limit: concurrent requests of the class
+#   reserve: capacity the class leaves free for higher classes
+#   wait: seconds a request may queue for a slot before 503
+#   rate/burst: token bucket per user (or IP) and class
+#   timeout_ms: statement_timeout for the request's connections
+CLASSES = {
+    'critical': {'limit': CAPACITY, 'reserve': 0, 'wait': 2.0, 'rate': 20.0, 'burst': 40, 'timeout_ms': 5000},
+    'standard': {'limit': 16, 'reserve': 4, 'wait': 1.0, 'rate': 10.0, 'burst': 30, 'timeout_ms': 10000},
+    'report': {'limit': 4, 'reserve': 8, 'wait': 0.0, 'rate': 1.0, 'burst': 5, 'timeout_ms': 60000},
+}
+
+# (methods, path pattern, class); first match wins, anything else is standard
+ROUTE_CLASSES = [
+    (None, r'^/api/readings/stream$', None),
+    (('POST',), r'^/api/(login|forgot-password|reset-password)$', 'critical'),
+    (('POST',), r'^/api/readings(/\d+/response|/claim|/\d+/release)?$', 'critical'),
+    (('POST',), r'^/api/telemetry$', 'critical'),
+    (('GET',), r'^/api/machines/scan/', 'critical'),
+    (('GET',), r'^/api/readings(/export)?$', 'report'),
+    (None, r'^/api/(analytics|dashboard|fleet|sync|import)(/|$)', 'report'),
+    (('POST',), r'^/api/machines/bulk$', 'report'),
+]
+ROUTE_CLASSES = [
+    (methods, re.compile(pattern), class_name) for methods, pattern, class_name in ROUTE_CLASSES
+]
+
+# Batches are admitted as their heaviest sub-request (the last class in
+# CLASSES order among them); each sub-request pays its own rate token
+BATCH_PATH = '/batch'
+
+# Token buckets kept (least recently used are dropped past this)
+MAX_BUCKETS = 100000
+
+
+class RateLimiter:
+    def __init__(self, max_buckets=MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    # Take one token; returns 0 when allowed, else seconds until the next token
+    def acquire(self, key, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                wait = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1 - tokens) / rate
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+# Shared capacity with per-class limits. A class is admitted only while it
+# leaves `reserve` slots free, so reports can never take the slots logins
+# and reading writes need.
+class AdmissionController:
+    def __init__(self, capacity=CAPACITY, classes=CLASSES):
+        self.capacity = capacity
+        self.classes = classes
+        self._lock = threading.Lock()
+        self._freed = threading.Condition(self._lock)
+        self._total = 0
+        self._in_flight = {name: 0 for name in classes}
+
+    def _has_room(self, name):
+        config = self.classes[name]
+        return (self._in_flight[name] < config['limit']
+                and self._total < self.capacity - config['reserve'])
+
+    def acquire(self, name):
+        deadline = time.monotonic() + self.classes[name]['wait']
+        with self._lock:
+            while not self._has_room(name):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._freed.wait(remaining)
+            self._total += 1
+            self._in_flight[name] += 1
+        return True
+
+    def release(self, name):
+        with self._lock:
+            self._total -= 1
+            self._in_flight[name] -= 1
+            self._freed.notify_all()
+
+    def in_flight(self):
+        with self._lock:
+            return dict(self._in_flight, total=self._total)
+
+
+controller = AdmissionController()
+limiter = RateLimiter()
+
+
+def classify(method, path):
+    for methods, pattern, class_name in ROUTE_CLASSES:
+        if (methods is None or method in methods) and pattern.search(path):
+            return class_name
+    return 'standard'
+
+
+# Class of a batch: the heaviest class among its GET sub-requests
+def batch_class(sub_requests):
+    order = list(CLASSES)
+    classes = {
+        classify('GET', urlsplit(sub['path']).path)
+        for sub in sub_requests
+        if isinstance(sub, dict) and isinstance(sub.get('path'), str)
+    }
+    classes.discard(None)
+    return max(classes, key=order.index, default='standard')
+
+
+# Rate-limit key: the token's user when it verifies, else the client address
+def _client_key():
+    claims = get_batch_identity()
+    if claims is not None:
+        return f"user:{claims.get('user_id')}"
+
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.startswith('Bearer '):
+        try:
+            claims = jwt.decode(auth_header[7:], current_app.config['SECRET_KEY'], algorithms=["HS256"])
+            return f"user:{claims.get('user_id')}"
+        except jwt.InvalidTokenError:
+            pass
+    return f'ip:{request.remote_addr}'
+
+
+def _rate_limited(class_name):
+    config = CLASSES[class_name]
+    retry_after = limiter.acquire((_client_key(), class_name), config['rate'], config['burst'])
+    if not retry_after:
+        return None
+
+    metrics.increment(f'admission.{class_name}.rate_limited')
+    return jsonify({'message': 'Too many requests, slow down!'}), 429, {
+        'Retry-After': str(max(1, math.ceil(retry_after)))
+    }
+
+
+def _before_request():
+    if request.method == 'OPTIONS':
+        return None
+
+    # Sub-requests of a batch run inside the batch's slot, but each is
+    # charged to the caller's bucket for its own class
+    if get_batch_identity() is not None:
+        class_name = classify(request.method, request.path)
+        return _rate_limited(class_name) if class_name is not None else None
+
+    if request.method == 'POST' and request.path == BATCH_PATH:
+        data = request.get_json(silent=True) or {}
+        sub_requests = data.get('requests') if isinstance(data, dict) else None
+        class_name = batch_class(sub_requests if isinstance(sub_requests, list) else [])
+    else:
+        class_name = classify(request.method, request.path)
+        if class_name is None:
+            return None
+
+        rejected = _rate_limited(class_name)
+        if rejected:
+            return rejected
+
+    config = CLASSES[class_name]
+
+    started = time.perf_counter()
+    if not controller.acquire(class_name):
+        metrics.increment(f'admission.{class_name}.shed')
+        return jsonify({'message': 'Server is busy, retry later!'}), 503, {
+            'Retry-After': str(max(1, math.ceil(config['wait'])))
+        }
+    metrics.record_timing(f'admission.{class_name}.wait', time.perf_counter() - started)
+    metrics.increment(f'admission.{class_name}.admitted')
+
+    g.admission_class = class_name
+    g.statement_timeout_token = set_statement_timeout(config['timeout_ms'])
+    return None
+
+
+def _teardown_request(exc):
+    # Sub-requests share the batch's app context (and g); the batch's own
+    # teardown releases its slot
+    if get_batch_identity() is not None:
+        return
+    class_name = g.pop('admission_class', None)
+    if class_name is not None:
+        reset_statement_timeout(g.pop('statement_timeout_token'))
+        controller.release(class_name)
+
+
+def _statement_timed_out(e):
+    metrics.increment('admission.statement_timeouts')
+    return jsonify({'message': 'Request took too long, retry later!'}), 503, {'Retry-After': '5'}
+
+
+def init_app(app):
+    app.before_request(_before_request)
+    app.teardown_request(_teardown_request)
+    app.register_error_handler(psycopg2.errors.QueryCanceled, _statement_timed_out)
+
+
+def stats():
+    return {'capacity': CAPACITY, 'in_flight': controller.in_flight(), **metrics.snapshot('admission.')}
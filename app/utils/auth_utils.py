@@ -1,11 +1,38 @@
-
+from contextvars import ContextVar
 from functools import wraps
 from flask import request, jsonify, current_app
 import jwt
+import psycopg2.extras
+from db_config import get_db_connection
+from .cache import TieredCache
+
+# user_details rows by user_id for both apps; dropped on every worker when a
+# profile or password changes
+user_cache = TieredCache('users', maxsize=10000, ttl=300)
+
+# What views read from current_user. The password stays out, since the
+# cache is shared through L2.
+USER_COLUMNS = ('user_id', 'username', 'full_name', 'user_mailid', 'phone_number', 'role',
+                'designation', 'company', 'profile_image')
+
+# Token claims verified once by a batch request and reused by its sub-requests
+_batch_identity = ContextVar('batch_identity', default=None)
+
+def get_batch_identity():
+    return _batch_identity.get()
+
+def set_batch_identity(claims):
+    return _batch_identity.set(claims)
+
+def reset_batch_identity(token):
+    _batch_identity.reset(token)
 
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
+        if get_batch_identity() is not None:
+            return f(*args, **kwargs)
+        
         token = None
         
         if 'Authorization' in request.headers:
@@ -50,3 +77,44 @@ def role_required(allowed_roles):
         return decorated_function
     
     return decorator
+
+def load_user(user_id):
+    def fetch():
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute(f"SELECT {', '.join(USER_COLUMNS)} FROM user_details WHERE user_id = %s", (user_id,))
+        user = cur.fetchone()
+        cur.close()
+        conn.close()
+        return dict(user) if user else None
+    
+    return user_cache.get_or_set(user_id, fetch)
+
+# Load the user row for the token and pass it to the view as current_user
+def user_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        claims = get_batch_identity()
+        
+        if claims is None:
+            token = None
+            
+            if 'Authorization' in request.headers:
+                token = request.headers['Authorization'].split(" ")[1]
+            
+            if not token:
+                return jsonify({'message': 'Token is missing!'}), 401
+            
+            try:
+                claims = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
+            except:
+                return jsonify({'message': 'Token is invalid!'}), 401
+        
+        current_user = load_user(claims.get('user_id'))
+        
+        if not current_user:
+            return jsonify({'message': 'User not found!'}), 401
+        
+        return f(current_user, *args, **kwargs)
+    
+    return decorated
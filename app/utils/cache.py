@@ -0,0 +1,411 @@
+import json
+import os
+import pickle
+import select
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import psycopg2
+import psycopg2.extensions
+from db_config import DB_PARAMS, DatabaseUnavailable, breaker, get_db_connection, is_connection_error
+from app.utils import metrics
+from app.utils.resilience import mark_stale
+
+# Optional shared second tier; any Redis-protocol server works
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# redis://host:port/db for a shared L2, or "local" for the in-process
+# stand-in (tests, single-process runs). Unset means L1 only.
+CACHE_L2_URL = os.getenv('CACHE_L2_URL', '')
+
+INVALIDATION_CHANNEL = 'cache_invalidation'
+RECONNECT_DELAY = 5
+
+# Followers of an in-flight load wait this long before loading themselves
+COALESCE_TIMEOUT = 30.0
+
+# Last good values are kept this long past their TTL and served (marked
+# stale) when the database can't be reached
+STALE_MAX_AGE = int(os.getenv('CACHE_STALE_MAX_AGE', 900))
+
+
+# Small in-process cache with per-entry TTLs and LRU eviction
+class TTLCache:
+    def __init__(self, name, maxsize=1024, ttl=60):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                metrics.increment(f'cache.{self.name}.misses')
+                return None
+            self._entries.move_to_end(key)
+        metrics.increment(f'cache.{self.name}.hits')
+        return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    # Same signature as TieredCache.get_or_set
+    def get_or_set(self, key, compute, ttl=None):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value, ttl or self.ttl)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    # Applies an invalidate() for this cache's name; see register()
+    def _drop(self, key):
+        if key is None:
+            self.clear()
+        else:
+            self.delete(key)
+
+
+# Minimal in-process stand-in for the Redis commands the L2 tier uses
+class LocalL2:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return None
+            if entry[0] is not None and entry[0] < time.monotonic():
+                del self._values[key]
+                return None
+            return entry[1]
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._values[key] = (time.monotonic() + ex if ex else None, value)
+        return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self._values.pop(key, None) is not None for key in keys)
+
+    def incr(self, key):
+        with self._lock:
+            entry = self._values.get(key)
+            value = int(entry[1]) + 1 if entry else 1
+            self._values[key] = (None, str(value).encode())
+            return value
+
+
+def _connect_l2():
+    if CACHE_L2_URL == 'local':
+        return LocalL2()
+    if CACHE_L2_URL:
+        if redis is None:
+            print('CACHE_L2_URL is set but the redis package is not installed; using L1 only')
+            return None
+        return redis.Redis.from_url(CACHE_L2_URL, socket_timeout=0.5)
+    return None
+
+
+_l2 = _connect_l2()
+
+# Identifies this process in invalidation messages
+_origin = uuid.uuid4().hex
+
+# Tiered caches by name, so invalidations can be routed without an instance
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def _normalize_key(key):
+    if isinstance(key, (tuple, list)):
+        return ':'.join(str(part) for part in key)
+    return str(key)
+
+
+def _l2_call(name, method, *args, **kwargs):
+    try:
+        return getattr(_l2, method)(*args, **kwargs)
+    except Exception as e:
+        metrics.increment(f'cache.{name}.l2_errors')
+        print(f"Cache {name}: L2 {method} failed: {e}")
+        return None
+
+
+def _l2_generation(name):
+    generation = _l2_call(name, 'get', f'cache:{name}:generation')
+    return int(generation) if generation else 0
+
+
+def _invalidate_l2(name, key):
+    if _l2 is None:
+        return
+    if key is None:
+        _l2_call(name, 'incr', f'cache:{name}:generation')
+    else:
+        _l2_call(name, 'delete', f'cache:{name}:{_l2_generation(name)}:{key}')
+
+
+# Drop `key` (or everything when key is None) from cache `name` on every
+# worker. Pass the mutation's cursor so the NOTIFY goes out when its
+# transaction commits: the L2 entry is then dropped by each worker's
+# listener as the NOTIFY arrives, so a load that runs before the commit
+# can't park pre-commit data in L2. The local L1 copy is dropped right
+# away, and again when the NOTIFY arrives.
+def invalidate(name, key=None, cur=None):
+    key = None if key is None else _normalize_key(key)
+
+    cache = _caches.get(name)
+    if cache is not None:
+        cache._drop(key)
+
+    payload = json.dumps({'cache': name, 'key': key, 'sent_at': time.time(), 'origin': _origin})
+    if cur is not None:
+        cur.execute('SELECT pg_notify(%s, %s)', (INVALIDATION_CHANNEL, payload))
+    else:
+        # Nothing left to commit; don't wait for the listener
+        _invalidate_l2(name, key)
+        conn = get_db_connection()
+        notify_cur = conn.cursor()
+        notify_cur.execute('SELECT pg_notify(%s, %s)', (INVALIDATION_CHANNEL, payload))
+        notify_cur.close()
+        conn.close()
+    metrics.increment(f'cache.{name}.invalidations')
+
+
+# Let a plain TTLCache receive invalidate() calls for its name from every
+# worker. invalidate() turns keys into strings, so use string keys.
+def register(local_cache):
+    with _caches_lock:
+        _caches[local_cache.name] = local_cache
+    listener.start()
+    return local_cache
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+
+
+# L1 in-process LRU in front of an optional shared L2, with cross-worker
+# invalidation over LISTEN/NOTIFY and coalescing of concurrent loads.
+# Values must be picklable when an L2 is configured.
+class TieredCache:
+    def __init__(self, name, maxsize=1024, ttl=60):
+        self.name = name
+        self.ttl = ttl
+        self._l1 = TTLCache(f'{name}.l1', maxsize)
+        # key -> (stored_at, value); survives TTL expiry and invalidation
+        self._last_good = OrderedDict()
+        self._maxsize = maxsize
+        self._lock = threading.Lock()
+        self._inflight = {}
+        # Bumped by every invalidation; loads that raced one are not stored
+        self._epoch = 0
+        with _caches_lock:
+            _caches[name] = self
+        listener.start()
+
+    def _drop(self, key):
+        with self._lock:
+            self._epoch += 1
+        if key is None:
+            self._l1.clear()
+        else:
+            self._l1.delete(key)
+
+    def get_or_set(self, key, compute, ttl=None):
+        key = _normalize_key(key)
+        ttl = ttl or self.ttl
+
+        value = self._l1.get(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+            epoch = self._epoch
+
+        if not leader:
+            metrics.increment(f'cache.{self.name}.coalesced')
+            if flight.done.wait(COALESCE_TIMEOUT) and flight.value is not None:
+                return flight.value
+            return self._or_stale(key, compute)
+
+        try:
+            value = self._or_stale(key, lambda: self._load(key, compute, ttl, epoch))
+            flight.value = value
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def _load(self, key, compute, ttl, epoch):
+        l2_key = None
+        if _l2 is not None:
+            l2_key = f'cache:{self.name}:{_l2_generation(self.name)}:{key}'
+            data = _l2_call(self.name, 'get', l2_key)
+            if data is not None:
+                metrics.increment(f'cache.{self.name}.l2_hits')
+                value = pickle.loads(data)
+                self._store_l1(key, value, ttl, epoch)
+                return value
+
+        metrics.increment(f'cache.{self.name}.misses')
+        started = time.perf_counter()
+        value = compute()
+        metrics.record_timing(f'cache.{self.name}.load', time.perf_counter() - started)
+
+        if value is not None and self._store_l1(key, value, ttl, epoch) and l2_key is not None:
+            _l2_call(self.name, 'set', l2_key, pickle.dumps(value), ex=ttl)
+        return value
+
+    def _store_l1(self, key, value, ttl, epoch):
+        with self._lock:
+            if self._epoch != epoch:
+                return False
+            self._last_good[key] = (time.time(), value)
+            self._last_good.move_to_end(key)
+            while len(self._last_good) > self._maxsize:
+                self._last_good.popitem(last=False)
+        self._l1.set(key, value, ttl)
+        return True
+
+    # Run load(); if the database is unreachable fall back to the last good
+    # value (within STALE_MAX_AGE) and mark the response stale
+    def _or_stale(self, key, load):
+        try:
+            return load()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            if not is_connection_error(e):
+                raise
+            if not isinstance(e, DatabaseUnavailable):
+                breaker.record_failure()
+            with self._lock:
+                entry = self._last_good.get(key)
+            if entry is None or time.time() - entry[0] > STALE_MAX_AGE:
+                raise
+            metrics.increment(f'cache.{self.name}.stale_hits')
+            mark_stale(entry[0])
+            return entry[1]
+
+    def invalidate(self, key=None, cur=None):
+        invalidate(self.name, key, cur)
+
+
+# One LISTEN connection per process applying invalidations to L2 and the
+# local L1s. After a reconnect every L1 is cleared, since messages may have
+# been missed while disconnected.
+class InvalidationListener:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._listen_forever, name='cache-invalidation-listener', daemon=True)
+                self._thread.start()
+
+    def _listen_forever(self):
+        connected_before = False
+        while True:
+            try:
+                conn = psycopg2.connect(**DB_PARAMS)
+            except Exception as e:
+                print(f"Cache invalidation listener error: {e}")
+                time.sleep(RECONNECT_DELAY)
+                continue
+            try:
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                cur = conn.cursor()
+                cur.execute(f'LISTEN {INVALIDATION_CHANNEL}')
+                if connected_before:
+                    for cache in list(_caches.values()):
+                        cache._drop(None)
+                connected_before = True
+                self._listen(conn)
+            except Exception as e:
+                print(f"Cache invalidation listener error: {e}")
+            finally:
+                conn.close()
+            time.sleep(RECONNECT_DELAY)
+
+    def _listen(self, conn):
+        while True:
+            if select.select([conn], [], [], 5) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                try:
+                    message = json.loads(notify.payload)
+                except ValueError:
+                    continue
+                apply_invalidation(message)
+
+
+listener = InvalidationListener()
+
+
+# Apply one invalidation message (as sent by invalidate()) to this process
+def apply_invalidation(message):
+    # L2 first, so the L1 reload below can't pick up the old entry
+    _invalidate_l2(message.get('cache'), message.get('key'))
+    cache = _caches.get(message.get('cache'))
+    if cache is None:
+        return
+    cache._drop(message.get('key'))
+    if message.get('origin') != _origin:
+        metrics.record_timing(f"cache.{cache.name}.invalidation_lag", max(time.time() - message['sent_at'], 0))
+
+
+# Per-cache hit rates plus the raw cache.* counters and timings
+def stats():
+    snapshot = metrics.snapshot('cache.')
+    counters = snapshot['counters']
+    caches = {}
+    for name in list(_caches):
+        # TieredCache L1s count under "<name>.l1", registered TTLCaches under their own name
+        l1_hits = counters.get(f'cache.{name}.l1.hits', counters.get(f'cache.{name}.hits', 0))
+        l2_hits = counters.get(f'cache.{name}.l2_hits', 0)
+        misses = counters.get(f'cache.{name}.misses', 0)
+        lookups = l1_hits + l2_hits + misses
+        caches[name] = {
+            'l1_hits': l1_hits,
+            'l2_hits': l2_hits,
+            'misses': misses,
+            'coalesced': counters.get(f'cache.{name}.coalesced', 0),
+            'stale_hits': counters.get(f'cache.{name}.stale_hits', 0),
+            'invalidations': counters.get(f'cache.{name}.invalidations', 0),
+            'hit_rate': round((l1_hits + l2_hits) / lookups, 4) if lookups else None,
+            'invalidation_lag': snapshot['timings'].get(f'cache.{name}.invalidation_lag'),
+        }
+    return {'l2': type(_l2).__name__ if _l2 is not None else None, 'caches': caches, **snapshot}
@@ -0,0 +1,30 @@
+import os
+import smtplib
+from email.message import EmailMessage
+
+# Outgoing mail. Without SMTP_HOST nothing is sent and only the recipient
+# and subject are logged, never the body (it can carry reset tokens).
+SMTP_HOST = os.getenv('SMTP_HOST', '')
+SMTP_PORT = int(os.getenv('SMTP_PORT', 587))
+SMTP_USER = os.getenv('SMTP_USER', '')
+SMTP_PASSWORD = os.getenv('SMTP_PASSWORD', '')
+MAIL_FROM = os.getenv('MAIL_FROM', 'no-reply@localhost')
+
+
+def send_mail(to, subject, body):
+    if not SMTP_HOST:
+        print(f"Mail not sent (SMTP_HOST is not set): '{subject}' to {to}")
+        return False
+
+    message = EmailMessage()
+    message['From'] = MAIL_FROM
+    message['To'] = to
+    message['Subject'] = subject
+    message.set_content(body)
+
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30) as smtp:
+        smtp.starttls()
+        if SMTP_USER:
+            smtp.login(SMTP_USER, SMTP_PASSWORD)
+        smtp.send_message(message)
+    return True
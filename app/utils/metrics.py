@@ -0,0 +1,50 @@
+import threading
+from collections import deque
+
+# Number of recent samples kept per timing for percentiles
+SAMPLE_SIZE = 1024
+
+_lock = threading.Lock()
+_counters = {}
+_timings = {}
+
+
+def increment(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def record_timing(name, seconds):
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            timing = _timings[name] = {'count': 0, 'total': 0.0, 'max': 0.0, 'samples': deque(maxlen=SAMPLE_SIZE)}
+        timing['count'] += 1
+        timing['total'] += seconds
+        timing['max'] = max(timing['max'], seconds)
+        timing['samples'].append(seconds)
+
+
+def _percentile(sorted_samples, fraction):
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(fraction * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+# Point-in-time copy of all counters and timings (times in milliseconds)
+def snapshot(prefix=''):
+    with _lock:
+        counters = {name: value for name, value in _counters.items() if name.startswith(prefix)}
+        timings = {name: (dict(t), sorted(t['samples'])) for name, t in _timings.items() if name.startswith(prefix)}
+
+    result = {'counters': counters, 'timings': {}}
+    for name, (timing, samples) in timings.items():
+        result['timings'][name] = {
+            'count': timing['count'],
+            'avg_ms': round(timing['total'] / timing['count'] * 1000, 3) if timing['count'] else 0.0,
+            'p50_ms': round(_percentile(samples, 0.5) * 1000, 3),
+            'p95_ms': round(_percentile(samples, 0.95) * 1000, 3),
+            'max_ms': round(timing['max'] * 1000, 3)
+        }
+    return result
@@ -0,0 +1,42 @@
+import io
+import numpy as np
+
+# PostgreSQL binary COPY framing
+COPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+COPY_HEADER_SIZE = len(COPY_SIGNATURE) + 8
+
+# Fixed-width column types this loader understands (numpy type -> size)
+COLUMN_SIZES = {'i4': 4, 'i8': 8, 'f8': 8}
+
+
+# Run a SELECT through binary COPY and return its result as numpy arrays.
+#
+# columns is a list of (name, type) pairs matching the SELECT list, with
+# types 'i4', 'i8' or 'f8'. Every selected value must be non-NULL (use
+# COALESCE(x, 'NaN') for floats) so each row has the same width and the
+# whole buffer can be viewed as one structured array without a Python loop.
+def fetch_columns(cur, query, params, columns):
+    sql = cur.mogrify(query, params).decode()
+    buffer = io.BytesIO()
+    cur.copy_expert(f'COPY ({sql}) TO STDOUT WITH (FORMAT binary)', buffer)
+    data = buffer.getvalue()
+
+    if not data.startswith(COPY_SIGNATURE):
+        raise ValueError('Unexpected COPY output')
+
+    extension_length = int.from_bytes(data[COPY_HEADER_SIZE - 4:COPY_HEADER_SIZE], 'big')
+    body = data[COPY_HEADER_SIZE + extension_length:-2]  # trailer is int16 -1
+
+    fields = [('field_count', '>i2')]
+    for name, kind in columns:
+        if kind not in COLUMN_SIZES:
+            raise ValueError(f'Unsupported column type: {kind}')
+        fields.append((f'{name}_length', '>i4'))
+        fields.append((name, f'>{kind}'))
+    row_type = np.dtype(fields)
+
+    if len(body) % row_type.itemsize:
+        raise ValueError('COPY output contains NULL or variable-width values')
+
+    rows = np.frombuffer(body, dtype=row_type)
+    return {name: rows[name].astype(kind) for name, kind in columns}
@@ -0,0 +1,50 @@
+import math
+from email.utils import formatdate
+import psycopg2
+from flask import g, jsonify, has_request_context
+from db_config import DatabaseUnavailable, breaker, is_connection_error
+from app.utils import metrics
+
+
+# Note that the current response is built from data cached at `stored_at`
+# (epoch seconds) because the database could not be reached
+def mark_stale(stored_at):
+    if has_request_context():
+        g.stale_since = min(g.get('stale_since', stored_at), stored_at)
+
+
+def _add_stale_headers(response):
+    stale_since = g.get('stale_since')
+    if stale_since is not None:
+        response.headers['Warning'] = '110 - "Response is Stale"'
+        response.headers['X-Stale-Since'] = formatdate(stale_since, usegmt=True)
+        response.headers['Cache-Control'] = 'no-store'
+        metrics.increment('resilience.stale_responses')
+    return response
+
+
+def _database_unavailable(e):
+    metrics.increment('resilience.unavailable')
+    retry_after = max(1, math.ceil(getattr(e, 'retry_after', breaker.reset_seconds)))
+    return jsonify({'message': 'Database unavailable, retry later!'}), 503, {'Retry-After': str(retry_after)}
+
+
+# Connection errors raised mid-request (e.g. a pooled connection cut by a
+# failover) count towards opening the circuit. Statement errors (deadlocks,
+# serialization failures, ...) are not outages and propagate as usual.
+def _database_error(e):
+    if not is_connection_error(e):
+        raise e
+    breaker.record_failure()
+    return _database_unavailable(e)
+
+
+def init_app(app):
+    app.after_request(_add_stale_headers)
+    app.register_error_handler(DatabaseUnavailable, _database_unavailable)
+    app.register_error_handler(psycopg2.OperationalError, _database_error)
+    app.register_error_handler(psycopg2.InterfaceError, _database_error)
+
+
+def stats():
+    return {'breaker': breaker.status(), **metrics.snapshot('resilience.')}
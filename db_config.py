@@ -1,17 +1,233 @@
-# db_config.py
 import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 import psycopg2
+import psycopg2.errorcodes
+import psycopg2.errors
+import psycopg2.pool
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Connection parameters shared by direct and pooled connections
+DB_PARAMS = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'database': os.getenv('DB_NAME', 'coolant_management'),
+    'user': os.getenv('DB_USER', 'postgres'),
+    'password': os.getenv('DB_PASSWORD', 'postgres'),
+    'port': int(os.getenv('DB_PORT', 5432))
+}
+
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', 1))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', 10))
+
+# Consecutive connection failures that open the circuit, and how long it
+# stays open before one probe connection is let through
+BREAKER_FAILURES = int(os.getenv('DB_BREAKER_FAILURES', 3))
+BREAKER_RESET_SECONDS = float(os.getenv('DB_BREAKER_RESET_SECONDS', 5))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Connection borrowed by a composite request and shared by its sub-requests
+_shared_connection = ContextVar('shared_connection', default=None)
+
+# statement_timeout (ms) for connections checked out by the current request,
+# set by admission control per route
+_statement_timeout = ContextVar('statement_timeout', default=None)
+
+
+def set_statement_timeout(timeout_ms):
+    return _statement_timeout.set(timeout_ms)
+
+
+def reset_statement_timeout(token):
+    _statement_timeout.reset(token)
+
+
+class _SharedConnection:
+    # Proxy handed to route code while a shared connection is active.
+    # close() is a no-op so the owner decides when the connection goes back.
+    def __init__(self, conn):
+        self._conn = conn
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    # Transactions are opened on the underlying connection, so callers can
+    # use the usual conn.autocommit = False / with conn: pattern
+    @property
+    def autocommit(self):
+        return self._conn.autocommit
+
+    @autocommit.setter
+    def autocommit(self, value):
+        self._conn.autocommit = value
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._conn.__exit__(*exc_info)
+
+
+# Raised instead of connecting while the circuit is open. Subclasses
+# OperationalError so existing handlers for connection errors still apply.
+class DatabaseUnavailable(psycopg2.OperationalError):
+    def __init__(self, retry_after):
+        super().__init__('Database unavailable')
+        self.retry_after = retry_after
+
+
+# SQLSTATE class 08 (connection exception)
+_CONNECTION_ERRORS = tuple(
+    psycopg2.errors.lookup(code)
+    for name, code in vars(psycopg2.errorcodes).items()
+    if name.isupper() and isinstance(code, str) and len(code) == 5 and code.startswith('08')
+)
+
+
+# Whether an error means the database could not be reached, as opposed to
+# a statement failing (deadlocks, serialization failures, lock timeouts,
+# admin shutdowns of one backend). Errors raised by libpq itself (refused,
+# reset or dropped connections) carry no SQLSTATE.
+def is_connection_error(e):
+    if isinstance(e, (DatabaseUnavailable, psycopg2.InterfaceError) + _CONNECTION_ERRORS):
+        return True
+    if type(e) is psycopg2.OperationalError:
+        return e.pgcode is None or e.pgcode.startswith('08')
+    return False
+
+
+# closed: connect normally. open: fail fast until the reset timeout passes.
+# half_open: a single caller probes; success closes, failure reopens.
+class CircuitBreaker:
+    def __init__(self, failure_threshold=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def before_call(self):
+        with self._lock:
+            if self.state == 'closed':
+                return
+            if self.state == 'open':
+                remaining = self._opened_at + self.reset_seconds - time.monotonic()
+                if remaining > 0:
+                    raise DatabaseUnavailable(remaining)
+                self.state = 'half_open'
+            if self._probing:
+                raise DatabaseUnavailable(self.reset_seconds)
+            self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == 'half_open' or self._failures >= self.failure_threshold:
+                if self.state != 'open':
+                    print(f"Database circuit opened after {self._failures} failure(s)")
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def status(self):
+        with self._lock:
+            return {'state': self.state, 'failures': self._failures}
+
+
+breaker = CircuitBreaker()
+
+
+# Open a connection through the breaker
+def _connect(**options):
+    breaker.before_call()
+    try:
+        conn = psycopg2.connect(**DB_PARAMS, **options)
+    except psycopg2.OperationalError as e:
+        breaker.record_failure()
+        raise DatabaseUnavailable(breaker.reset_seconds) from e
+    breaker.record_success()
+    return conn
+
+
 def get_db_connection():
-    conn = psycopg2.connect(
-        host=os.getenv('DB_HOST', 'localhost'),
-        database=os.getenv('DB_NAME', 'coolant_management'),
-        user=os.getenv('DB_USER', 'postgres'),
-        password=os.getenv('DB_PASSWORD', 'postgres'),
-        port=int(os.getenv('DB_PORT', 5432))
-    )
+    shared = _shared_connection.get()
+    if shared is not None:
+        return _SharedConnection(shared)
+
+    timeout_ms = _statement_timeout.get()
+    if timeout_ms:
+        # Passed as a startup option, so it costs no extra round trip
+        conn = _connect(options=f'-c statement_timeout={int(timeout_ms)}')
+    else:
+        conn = _connect()
     conn.autocommit = True
     return conn
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = psycopg2.pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, **DB_PARAMS)
+    return _pool
+
+
+@contextmanager
+def pooled_connection():
+    breaker.before_call()
+    try:
+        pool = get_pool()
+        conn = pool.getconn()
+    except psycopg2.OperationalError as e:
+        breaker.record_failure()
+        raise DatabaseUnavailable(breaker.reset_seconds) from e
+    breaker.record_success()
+    conn.autocommit = True
+    timeout_ms = _statement_timeout.get()
+    try:
+        if timeout_ms:
+            with conn.cursor() as cur:
+                cur.execute('SET statement_timeout = %s', (int(timeout_ms),))
+        yield conn
+    finally:
+        # Pooled connections go back without the request's timeout
+        if timeout_ms and not conn.closed:
+            try:
+                conn.rollback()
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute('RESET statement_timeout')
+            except psycopg2.Error:
+                conn.close()
+        pool.putconn(conn, close=conn.closed != 0)
+
+
+@contextmanager
+def shared_connection():
+    # Every get_db_connection() call made inside this block (including from
+    # threads started with a copy of the current context) reuses one pooled
+    # connection instead of opening a new one.
+    with pooled_connection() as conn:
+        token = _shared_connection.set(conn)
+        try:
+            yield conn
+        finally:
+            _shared_connection.reset(token)
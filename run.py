@@ -1,4 +1,4 @@
-from flask import Flask, jsonify, request, make_response, send_from_directory
+from flask import Flask, jsonify, request, make_response, send_from_directory, Response
 from flask_cors import CORS
 import jwt
 import datetime
@@ -8,6 +8,7 @@ from functools import wraps
 from werkzeug.security import check_password_hash
 import os
 import re
+import time
 # from db_config import DB_CONFIG
 # from db_config import get_db_connection
 from db_config import get_db_connection
@@ -17,13 +18,40 @@ conn = get_db_connection()
 
 
 import uuid
+import json
+import queue
 from werkzeug.utils import secure_filename
+from app.services.reading_events import hub as reading_event_hub, load_events_since, RESUME_LIMIT
+from app.services.scope_service import visible_client_ids
+from app.services import work_queue, job_queue, alert_rules, partition_service
+from app.utils import metrics, cache, admission, resilience
+from app.utils.auth_utils import load_user, user_cache
+from app.routes.batch_routes import batch_bp
+from app.routes.analytics_routes import analytics_bp
+from app.routes.alert_routes import alert_bp
+from app.routes.dashboard_routes import dashboard_bp
+from app.routes.telemetry_routes import telemetry_bp
+from app.routes.import_routes import import_bp
+from app.routes.machine_routes import machine_bp
+from app.routes.sync_routes import sync_bp
 
 app = Flask(__name__)
 CORS(app)
+admission.init_app(app)
+resilience.init_app(app)
 
 # Secret key for JWT
-app.config['SECRET_KEY'] = 'coolant_management_secret_key'
+app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'coolant_management_secret_key')
+
+# Routes kept in app/routes
+app.register_blueprint(batch_bp)
+app.register_blueprint(analytics_bp)
+app.register_blueprint(alert_bp)
+app.register_blueprint(dashboard_bp)
+app.register_blueprint(telemetry_bp)
+app.register_blueprint(import_bp)
+app.register_blueprint(machine_bp)
+app.register_blueprint(sync_bp)
 
 # Upload folders
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
@@ -39,6 +67,10 @@ for folder in [UPLOAD_FOLDER, CLIENT_LOGO_FOLDER, DISTRIBUTOR_LOGO_FOLDER, USER_
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 
+# Dropdown and list data shared across workers (see app/utils/cache.py)
+client_list_cache = cache.TieredCache('client_lists', maxsize=2048, ttl=60)
+machine_list_cache = cache.TieredCache('machine_lists', maxsize=2048, ttl=300)
+
 # Connect to the database
 # def get_db_connection():
 #     print("DB_CONFIG:", DB_CONFIG)
@@ -52,6 +84,10 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 #     conn.autocommit = True
 #     return conn
 
+# 'Aluminium, steel' -> ['aluminium', 'steel'], matching client.metals
+def parse_metals(value):
+    return [metal.strip().lower() for metal in value.split(',') if metal.strip()]
+
 # Check if file extension is allowed
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -77,6 +113,9 @@ def token_required(f):
         # Check if token is in headers
         if 'Authorization' in request.headers:
             token = request.headers['Authorization'].split(" ")[1]
+        # EventSource can't send headers, so event streams may pass it in the query
+        elif request.accept_mimetypes.best == 'text/event-stream':
+            token = request.args.get('access_token')
         
         if not token:
             return jsonify({'message': 'Token is missing!'}), 401
@@ -85,20 +124,15 @@ def token_required(f):
             # Decode the token
             data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
             
-            # Connect to database
-            conn = get_db_connection()
-            cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-            
-            # Get current user from decoded token
-            cur.execute('SELECT * FROM user_details WHERE user_id = %s', (data['user_id'],))
-            current_user = cur.fetchone()
-            
-            cur.close()
-            conn.close()
+            # Get current user from decoded token (cached across requests)
+            current_user = load_user(data['user_id'])
             
             if not current_user:
                 return jsonify({'message': 'User not found!'}), 401
                 
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # Database outage: answered with 503 by the resilience handlers
+            raise
         except Exception as e:
             return jsonify({'message': 'Token is invalid!', 'error': str(e)}), 401
             
@@ -175,7 +209,7 @@ def forgot_password():
     cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
     
     # Check if user exists
-    cur.execute('SELECT * FROM user_details WHERE user_mailid = %s', (email,))
+    cur.execute('SELECT user_id FROM user_details WHERE user_mailid = %s', (email,))
     user = cur.fetchone()
     
     if not user:
@@ -183,29 +217,14 @@ def forgot_password():
         conn.close()
         return jsonify({'message': 'User not found!'}), 404
     
-    # Generate reset token
-    token = jwt.encode({
-        'user_id': user['user_id'],
-        'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=1)
-    }, app.config['SECRET_KEY'], algorithm="HS256")
-    
-    # Store token in database
-    cur.execute(
-        'INSERT INTO password_reset_token (user_id, token, expires_at) VALUES (%s, %s, %s) RETURNING token_id',
-        (user['user_id'], token, datetime.datetime.utcnow() + datetime.timedelta(hours=1))
-    )
+    # Token generation and sending the link happen in a background job
+    job_queue.enqueue('send_password_reset', {'user_id': user['user_id'], 'email': email}, conn=conn)
     
-    conn.commit()
     cur.close()
     conn.close()
     
-    # In a real app, send email with reset link
-    reset_link = f"http://localhost:5173/reset-password/{token}"
-    
-    # For demo purposes, return the link
     return jsonify({
-        'message': 'Password reset link sent!',
-        'reset_link': reset_link
+        'message': 'Password reset link sent!'
     })
 
 # Reset password route
@@ -227,31 +246,28 @@ def reset_password():
         conn = get_db_connection()
         cur = conn.cursor()
         
-        # Check if token exists and is valid
-        cur.execute(
-            'SELECT * FROM password_reset_token WHERE token = %s AND expires_at > %s',
-            (token, datetime.datetime.utcnow())
-        )
-        token_data = cur.fetchone()
-        
-        if not token_data:
-            cur.close()
-            conn.close()
-            return jsonify({'message': 'Invalid or expired token!'}), 400
-        
-        # Update user password
-        cur.execute(
-            'UPDATE user_details SET password = %s WHERE user_id = %s',
-            (new_password, user_id)
-        )
-        
-        # Delete used token
-        cur.execute('DELETE FROM password_reset_token WHERE token = %s', (token,))
+        # Consume a valid token and update the password in one statement
+        cur.execute('''
+            WITH used_token AS (
+                DELETE FROM password_reset_token
+                WHERE token = %s AND user_id = %s AND expires_at > NOW()
+                RETURNING user_id
+            )
+            UPDATE user_details SET password = %s
+            FROM used_token
+            WHERE user_details.user_id = used_token.user_id
+            RETURNING user_details.user_id
+        ''', (token, user_id, new_password))
+        updated = cur.fetchone()
+        if updated:
+            user_cache.invalidate(user_id, cur)
         
-        conn.commit()
         cur.close()
         conn.close()
         
+        if not updated:
+            return jsonify({'message': 'Invalid or expired token!'}), 400
+        
         return jsonify({'message': 'Password updated successfully!'})
     
     except Exception as e:
@@ -264,8 +280,8 @@ def get_readings(current_user):
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
 
-    # Fetch readings from the database
-    cur.execute('SELECT * FROM reading')
+    # Fetch readings from the database; sensor telemetry has its own views
+    cur.execute("SELECT * FROM reading WHERE status <> 'Telemetry'")
     readings = cur.fetchall()
 
     # Convert readings to a list of dictionaries
@@ -311,6 +327,13 @@ def add_reading(current_user):
     oil_top_up = data.get('oil_top_up')
     water_input = data.get('water_input')
     status = data.get('status')
+    priority = data.get('priority')
+
+    # Missing or null means the default priority; priority is a SMALLINT
+    if priority is None:
+        priority = 0
+    elif isinstance(priority, bool) or not isinstance(priority, int) or not -32768 <= priority <= 32767:
+        return jsonify({'message': 'priority must be a whole number!'}), 400
 
     conn = get_db_connection()
     cur = conn.cursor()
@@ -318,26 +341,160 @@ def add_reading(current_user):
     # Insert the new reading into the database
     cur.execute('''
         INSERT INTO reading (machine_id, raised_by, oil_refractometer, oil_ph_level, water_ph_level, 
-        oil_top_up, water_input, status, created_at, updated_at)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW(), NOW())
+        oil_top_up, water_input, status, priority, created_at, updated_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), NOW())
+        RETURNING reading_id
     ''', (machine_id, current_user['user_id'], oil_refractometer, oil_ph_level, water_ph_level,
-          oil_top_up, water_input, status))
+          oil_top_up, water_input, status, priority))
+    reading_id = cur.fetchone()[0]
+
+    # Check the reading against the alert rules for its machine
+    alerts = alert_rules.evaluate_and_record(cur, [{
+        'reading_id': reading_id,
+        'machine_id': machine_id,
+        'oil_refractometer': oil_refractometer,
+        'oil_ph_level': oil_ph_level,
+        'water_ph_level': water_ph_level,
+        'oil_top_up': oil_top_up,
+        'water_input': water_input
+    }])
 
     conn.commit()
     cur.close()
     conn.close()
 
-    return jsonify({'message': 'Reading added successfully!'}), 201
+    return jsonify({
+        'message': 'Reading added successfully!',
+        'reading_id': reading_id,
+        'alerts': [
+            {'rule_id': alert[2], 'metric': alert[3], 'value': alert[4],
+             'operator': alert[5], 'threshold': alert[6], 'severity': alert[7]}
+            for alert in alerts
+        ]
+    }), 201
+
+# Format one Server-Sent Event
+def format_sse(event):
+    return f"id: {event['event_id']}\nevent: {event['event_type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+# Live feed of new readings and responses
+@app.route('/api/readings/stream', methods=['GET'])
+@token_required
+def stream_readings(current_user):
+    client_ids = visible_client_ids(current_user)
+    
+    # Resume after the last event the browser saw
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'message': 'Invalid last event id!'}), 400
+    
+    # Subscribe before loading the backlog so nothing falls in between
+    subscription = reading_event_hub.subscribe(client_ids)
+    backlog = load_events_since(last_event_id, client_ids) if last_event_id is not None else []
+    
+    # Ids commit out of order, so only events already replayed from the
+    # backlog are skipped when they also arrive live
+    replayed = {event['event_id'] for event in backlog}
+    
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            for event in backlog:
+                yield format_sse(event)
+            
+            # Too far behind to replay everything; tell the screen to reload
+            if len(backlog) == RESUME_LIMIT:
+                yield 'event: resync\ndata: {}\n\n'
+            
+            while not subscription.overflowed:
+                try:
+                    event = subscription.queue.get(timeout=15)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                
+                if event['event_id'] in replayed:
+                    replayed.discard(event['event_id'])
+                    continue
+                yield format_sse(event)
+        finally:
+            reading_event_hub.unsubscribe(subscription)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+# CSV export of readings over any range, including archived months
+@app.route('/api/readings/export', methods=['GET'])
+@token_required
+def export_readings(current_user):
+    try:
+        end = datetime.datetime.fromisoformat(request.args['end']) if request.args.get('end') else datetime.datetime.now(datetime.timezone.utc)
+        start = datetime.datetime.fromisoformat(request.args['start']) if request.args.get('start') else end - datetime.timedelta(days=30)
+        machine_id = request.args.get('machine_id', type=int)
+    except ValueError:
+        return jsonify({'message': 'start and end must be ISO dates!'}), 400
+    
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=datetime.timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=datetime.timezone.utc)
+    if start >= end:
+        return jsonify({'message': 'start must be before end!'}), 400
+    
+    # Limit the export to machines of clients the user can see
+    client_ids = visible_client_ids(current_user)
+    machine_ids = None
+    if client_ids is not None or machine_id:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        query = 'SELECT machine_id FROM machine WHERE TRUE'
+        params = []
+        if client_ids is not None:
+            query += ' AND client_id = ANY(%s)'
+            params.append(list(client_ids))
+        if machine_id:
+            query += ' AND machine_id = %s'
+            params.append(machine_id)
+        cur.execute(query, params)
+        machine_ids = {row[0] for row in cur.fetchall()}
+        cur.close()
+        conn.close()
+    
+    filename = f"readings_{start.date().isoformat()}_{end.date().isoformat()}.csv"
+    return Response(partition_service.export_csv(start, end, machine_ids), mimetype='text/csv', headers={
+        'Content-Disposition': f'attachment; filename={filename}'
+    })
 
 # Get machines route for dropdown
 @app.route('/api/machines', methods=['GET'])
 @token_required
 def get_machines(current_user):
+    cache_key = (request.args.get('client_id', type=int), request.args.get('metal', ''))
+    return jsonify(machine_list_cache.get_or_set(cache_key, load_machines))
+
+def load_machines():
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
 
-    # Fetch machines from the database
-    cur.execute('SELECT machine_id, machine_name FROM machine')
+    # Fetch machines from the database, optionally filtered by client and metal
+    query = 'SELECT machine_id, machine_name FROM machine WHERE TRUE'
+    params = []
+
+    client_id = request.args.get('client_id', type=int)
+    if client_id:
+        query += ' AND client_id = %s'
+        params.append(client_id)
+
+    metals = parse_metals(request.args.get('metal', ''))
+    if metals:
+        query += ' AND metal_key = ANY(%s)'
+        params.append(metals)
+
+    cur.execute(query, params)
     machines = cur.fetchall()
 
     # Convert machines to a list of dictionaries
@@ -351,7 +508,7 @@ def get_machines(current_user):
     cur.close()
     conn.close()
 
-    return jsonify(machines_list)
+    return machines_list
 
 # Process reading response
 @app.route('/api/readings/<int:reading_id>/response', methods=['POST'])
@@ -372,17 +529,29 @@ def add_response(current_user, reading_id):
     conn = get_db_connection()
     cur = conn.cursor()
 
-    # Update the reading with the response data
+    # Update the reading with the response data, releasing its claim.
+    # Readings claimed by someone else can't be answered until the lease ends.
     cur.execute('''
         UPDATE reading 
         SET response_by = %s, response_timestamp = %s, 
         post_oil_refractometer = %s, post_oil_ph_level = %s, 
         post_oil_top_up = %s, post_water = %s, 
         post_water_ph_level = %s, status = %s,
+        claimed_by = NULL, claimed_at = NULL, lease_expires_at = NULL,
         updated_at = NOW()
         WHERE reading_id = %s
+        AND (claimed_by IS NULL OR claimed_by = %s OR lease_expires_at < NOW())
     ''', (response_by, response_timestamp, post_oil_refractometer, post_oil_ph_level,
-          post_oil_top_up, post_water, post_water_ph_level, status, reading_id))
+          post_oil_top_up, post_water, post_water_ph_level, status, reading_id, response_by))
+
+    if cur.rowcount == 0:
+        cur.execute('SELECT claimed_by FROM reading WHERE reading_id = %s', (reading_id,))
+        claimed = cur.fetchone()
+        cur.close()
+        conn.close()
+        if not claimed:
+            return jsonify({'message': 'Reading not found!'}), 404
+        return jsonify({'message': 'Reading is claimed by another user!'}), 409
 
     conn.commit()
     cur.close()
@@ -390,6 +559,75 @@ def add_response(current_user, reading_id):
 
     return jsonify({'message': 'Reading response added successfully!'})
 
+# Claim the next pending readings to respond to
+@app.route('/api/readings/claim', methods=['POST'])
+@token_required
+def claim_readings(current_user):
+    data = request.json or {}
+    
+    try:
+        limit = min(max(int(data.get('limit', 1)), 1), work_queue.MAX_CLAIM)
+        lease_seconds = min(max(int(data.get('lease_seconds', work_queue.DEFAULT_LEASE_SECONDS)), 60),
+                            work_queue.MAX_LEASE_SECONDS)
+        client_id = int(data['client_id']) if data.get('client_id') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'message': 'limit, lease_seconds and client_id must be numbers!'}), 400
+    
+    started = time.perf_counter()
+    readings = work_queue.claim_readings(current_user, limit, client_id, lease_seconds)
+    metrics.record_timing('reading_queue.claim', time.perf_counter() - started)
+    metrics.increment('reading_queue.claimed', len(readings))
+    if not readings:
+        metrics.increment('reading_queue.empty_claims')
+    
+    return jsonify({'readings': readings})
+
+# Give a claimed reading back to the queue
+@app.route('/api/readings/<int:reading_id>/release', methods=['POST'])
+@token_required
+def release_reading(current_user, reading_id):
+    if not work_queue.release_reading(current_user, reading_id):
+        return jsonify({'message': 'Reading is not claimed by you!'}), 409
+    
+    metrics.increment('reading_queue.released')
+    return jsonify({'message': 'Reading released successfully!'})
+
+# Queue depth and claim latency
+@app.route('/api/readings/queue/stats', methods=['GET'])
+@token_required
+def reading_queue_stats(current_user):
+    return jsonify({
+        'depth': work_queue.queue_depth(),
+        'metrics': metrics.snapshot('reading_queue.')
+    })
+
+# Cache hit rates and invalidation lag of this worker
+@app.route('/api/cache/stats', methods=['GET'])
+@token_required
+def cache_stats(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized!'}), 403
+    
+    return jsonify(cache.stats())
+
+# Admission control counters: admitted, shed (503) and rate limited (429)
+@app.route('/api/admission/stats', methods=['GET'])
+@token_required
+def admission_stats(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized!'}), 403
+    
+    return jsonify(admission.stats())
+
+# Database circuit breaker state and stale responses served
+@app.route('/api/resilience/stats', methods=['GET'])
+@token_required
+def resilience_stats(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized!'}), 403
+    
+    return jsonify(resilience.stats())
+
 # Delete reading
 @app.route('/api/readings/<int:reading_id>', methods=['DELETE'])
 @token_required
@@ -468,6 +706,8 @@ def update_profile(current_user):
             WHERE user_id = %s
         ''', (full_name, designation, phone_number, email, company, current_user['user_id']))
     
+    user_cache.invalidate(current_user['user_id'], cur)
+    
     conn.commit()
     cur.close()
     conn.close()
@@ -488,13 +728,17 @@ def change_password(current_user):
     current_password = data.get('currentPassword')
     new_password = data.get('newPassword')
     
-    # Verify current password
-    if current_password != current_user['password']:
-        return jsonify({'message': 'Current password is incorrect!'}), 400
-    
     conn = get_db_connection()
     cur = conn.cursor()
     
+    # Verify current password against the database, not the cached user
+    cur.execute('SELECT password FROM user_details WHERE user_id = %s', (current_user['user_id'],))
+    stored = cur.fetchone()
+    if not stored or current_password != stored[0]:
+        cur.close()
+        conn.close()
+        return jsonify({'message': 'Current password is incorrect!'}), 400
+    
     # Update password
     cur.execute('''
         UPDATE user_details 
@@ -502,6 +746,8 @@ def change_password(current_user):
         WHERE user_id = %s
     ''', (new_password, current_user['user_id']))
     
+    user_cache.invalidate(current_user['user_id'], cur)
+    
     conn.commit()
     cur.close()
     conn.close()
@@ -514,6 +760,13 @@ def change_password(current_user):
 @app.route('/api/clients', methods=['GET'])
 @token_required
 def get_clients(current_user):
+    # Cached per user and filter; every client change drops the lists
+    cache_key = (current_user['user_id'], current_user['role'], current_user['company'],
+                 request.args.get('metal', ''), request.args.get('match', ''))
+    return jsonify(client_list_cache.get_or_set(cache_key, lambda: load_clients(current_user)))
+
+# Clients visible to current_user
+def load_clients(current_user):
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
     
@@ -521,9 +774,18 @@ def get_clients(current_user):
     role = current_user['role']
     user_id = current_user['user_id']
     
+    # Optional metal filter, served by the GIN index on client.metals
+    metals = parse_metals(request.args.get('metal', ''))
+    metal_filter = ''
+    metal_params = ()
+    if metals:
+        operator = '@>' if request.args.get('match') == 'all' else '&&'
+        metal_filter = f'AND metals {operator} %s::text[]'
+        metal_params = (metals,)
+    
     if role == 'admin' or role == 'manufacturer':
         # Admins and manufacturers can see all clients
-        cur.execute('''
+        cur.execute(f'''
             SELECT client_id, client_name, city, address, primary_contact_person,
                    CONCAT(primary_country_code, primary_mobile_number) as primary_number,
                    secondary_contact_person,
@@ -532,11 +794,12 @@ def get_clients(current_user):
                    CONCAT(whatsapp_country_code, whatsapp_communication_number) as whatsapp_number,
                    client_logo, distributor_id
             FROM client
+            WHERE TRUE {metal_filter}
             ORDER BY client_name
-        ''')
+        ''', metal_params)
     elif role == 'manager' or role == 'distributor':
         # Managers and distributors see their clients
-        cur.execute('''
+        cur.execute(f'''
             SELECT client_id, client_name, city, address, primary_contact_person,
                    CONCAT(primary_country_code, primary_mobile_number) as primary_number,
                    secondary_contact_person,
@@ -545,14 +808,14 @@ def get_clients(current_user):
                    CONCAT(whatsapp_country_code, whatsapp_communication_number) as whatsapp_number,
                    client_logo, distributor_id
             FROM client
-            WHERE created_by = %s OR distributor_id IN (
+            WHERE (created_by = %s OR distributor_id IN (
                 SELECT distributor_id FROM distributor WHERE created_by = %s
-            )
+            )) {metal_filter}
             ORDER BY client_name
-        ''', (user_id, user_id))
+        ''', (user_id, user_id, *metal_params))
     elif role == 'employee':
         # Employees see their company's clients
-        cur.execute('''
+        cur.execute(f'''
             SELECT client_id, client_name, city, address, primary_contact_person,
                    CONCAT(primary_country_code, primary_mobile_number) as primary_number,
                    secondary_contact_person,
@@ -561,19 +824,19 @@ def get_clients(current_user):
                    CONCAT(whatsapp_country_code, whatsapp_communication_number) as whatsapp_number,
                    client_logo, distributor_id
             FROM client
-            WHERE created_by = %s OR distributor_id IN (
+            WHERE (created_by = %s OR distributor_id IN (
                 SELECT distributor_id FROM distributor WHERE created_by = (
                     SELECT user_id FROM user_details 
                     WHERE role IN ('manager', 'distributor') AND company = (
                         SELECT company FROM user_details WHERE user_id = %s
                     )
                 )
-            )
+            )) {metal_filter}
             ORDER BY client_name
-        ''', (user_id, user_id))
+        ''', (user_id, user_id, *metal_params))
     elif role == 'client':
         # Clients only see themselves
-        cur.execute('''
+        cur.execute(f'''
             SELECT client_id, client_name, city, address, primary_contact_person,
                    CONCAT(primary_country_code, primary_mobile_number) as primary_number,
                    secondary_contact_person,
@@ -582,9 +845,9 @@ def get_clients(current_user):
                    CONCAT(whatsapp_country_code, whatsapp_communication_number) as whatsapp_number,
                    client_logo, distributor_id
             FROM client
-            WHERE gst_number = %s
+            WHERE gst_number = %s {metal_filter}
             ORDER BY client_name
-        ''', (current_user['company'],))
+        ''', (current_user['company'], *metal_params))
     
     clients = cur.fetchall()
     
@@ -618,7 +881,7 @@ def get_clients(current_user):
     cur.close()
     conn.close()
     
-    return jsonify(result)
+    return result
 
 # Add new client
 @app.route('/api/clients', methods=['POST'])
@@ -676,6 +939,9 @@ def add_client(current_user):
     
     client_id = cur.fetchone()[0]
     
+    cache.invalidate('client_lists', cur=cur)
+    cache.invalidate('scan_scope', cur=cur)
+    
     conn.commit()
     cur.close()
     conn.close()
@@ -689,26 +955,8 @@ def add_client(current_user):
 @app.route('/api/clients/<int:client_id>', methods=['PUT'])
 @token_required
 def update_client(current_user, client_id):
-    # Check if client exists and user has permission
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    
-    cur.execute('SELECT * FROM client WHERE client_id = %s', (client_id,))
-    client = cur.fetchone()
-    
-    if not client:
-        cur.close()
-        conn.close()
-        return jsonify({'message': 'Client not found!'}), 404
-    
-    # Check permissions
-    if current_user['role'] == 'client' and client['gst_number'] != current_user['company']:
-        cur.close()
-        conn.close()
-        return jsonify({'message': 'Unauthorized!'}), 403
-    
     # Handle file upload if present
-    client_logo = client['client_logo']
+    new_logo = None
     if 'client_logo' in request.files:
         file = request.files['client_logo']
         if file and allowed_file(file.filename):
@@ -716,41 +964,85 @@ def update_client(current_user, client_id):
             ext = file.filename.rsplit('.', 1)[1].lower()
             filename = f"client_{uuid.uuid4().hex}.{ext}"
             file.save(os.path.join(CLIENT_LOGO_FOLDER, filename))
-            client_logo = filename
+            new_logo = filename
     
-    # Get form data
-    client_name = request.form.get('client_name', client['client_name'])
-    city = request.form.get('city', client['city'])
-    address = request.form.get('address', client['address'])
-    primary_contact = request.form.get('primary_contact_person', client['primary_contact_person'])
-    primary_mobile = request.form.get('primary_mobile_number', client['primary_mobile_number'])
-    whatsapp_number = request.form.get('whatsapp_number', client['whatsapp_communication_number'])
-    secondary_contact = request.form.get('secondary_contact_person', client['secondary_contact_person'])
-    secondary_mobile = request.form.get('secondary_mobile_number', client['secondary_mobile_number'])
-    email = request.form.get('email', client['email_id'])
-    gst_number = request.form.get('gst_number', client['gst_number'])
-    types_of_metals = request.form.get('types_of_metals', client['types_of_metals'])
-    client_category = request.form.get('client_category', client['client_category'])
-    distributor_id = request.form.get('distributor_id', client['distributor_id'])
-    
-    # Update client
-    cur.execute('''
-        UPDATE client 
-        SET client_name = %s, city = %s, address = %s, primary_contact_person = %s,
-            primary_mobile_number = %s, secondary_contact_person = %s, secondary_mobile_number = %s,
-            email_id = %s, gst_number = %s, types_of_metals = %s, client_category = %s,
-            whatsapp_communication_number = %s, client_logo = %s, distributor_id = %s,
-            updated_at = NOW()
-        WHERE client_id = %s
-    ''', (
-        client_name, city, address, primary_contact, primary_mobile,
-        secondary_contact, secondary_mobile, email, gst_number, types_of_metals,
-        client_category, whatsapp_number, client_logo, distributor_id, client_id
-    ))
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
     
-    conn.commit()
-    cur.close()
-    conn.close()
+    # The update, the cache invalidation and the logo cleanup job commit
+    # together, so a rolled back update never deletes the logo it still uses
+    conn.autocommit = False
+    try:
+        with conn:
+            # Update client in one statement. Fields missing from the form keep
+            # their current value, clients may only update themselves, and the
+            # previous logo is returned from the locked row.
+            cur.execute('''
+                UPDATE client c
+                SET client_name = COALESCE(%s, c.client_name),
+                    city = COALESCE(%s, c.city),
+                    address = COALESCE(%s, c.address),
+                    primary_contact_person = COALESCE(%s, c.primary_contact_person),
+                    primary_mobile_number = COALESCE(%s, c.primary_mobile_number),
+                    secondary_contact_person = COALESCE(%s, c.secondary_contact_person),
+                    secondary_mobile_number = COALESCE(%s, c.secondary_mobile_number),
+                    email_id = COALESCE(%s, c.email_id),
+                    gst_number = COALESCE(%s, c.gst_number),
+                    types_of_metals = COALESCE(%s, c.types_of_metals),
+                    client_category = COALESCE(%s, c.client_category),
+                    whatsapp_communication_number = COALESCE(%s, c.whatsapp_communication_number),
+                    client_logo = COALESCE(%s, c.client_logo),
+                    distributor_id = COALESCE(%s, c.distributor_id),
+                    updated_at = NOW()
+                FROM (SELECT client_id, client_logo FROM client WHERE client_id = %s FOR UPDATE) AS previous
+                WHERE c.client_id = previous.client_id
+                AND (%s <> 'client' OR c.gst_number = %s)
+                RETURNING previous.client_logo
+            ''', (
+                request.form.get('client_name'),
+                request.form.get('city'),
+                request.form.get('address'),
+                request.form.get('primary_contact_person'),
+                request.form.get('primary_mobile_number'),
+                request.form.get('secondary_contact_person'),
+                request.form.get('secondary_mobile_number'),
+                request.form.get('email'),
+                request.form.get('gst_number'),
+                request.form.get('types_of_metals'),
+                request.form.get('client_category'),
+                request.form.get('whatsapp_number'),
+                new_logo,
+                request.form.get('distributor_id'),
+                client_id,
+                current_user['role'], current_user['company']
+            ))
+            updated = cur.fetchone()
+            
+            if not updated:
+                # Only failed updates pay for the lookup that explains why
+                cur.execute('SELECT 1 FROM client WHERE client_id = %s', (client_id,))
+                exists = cur.fetchone()
+                
+                if new_logo:
+                    job_queue.enqueue('delete_file', {'path': f"client_logos/{new_logo}"}, conn=conn)
+            else:
+                # Client names and distributors show up in scans and scopes
+                cache.invalidate('client_lists', cur=cur)
+                cache.invalidate('machine_scan', cur=cur)
+                cache.invalidate('scan_scope', cur=cur)
+                
+                # Delete the replaced logo in the background
+                if new_logo and updated['client_logo']:
+                    job_queue.enqueue('delete_file', {'path': f"client_logos/{updated['client_logo']}"}, conn=conn)
+    finally:
+        cur.close()
+        conn.autocommit = True
+        conn.close()
+    
+    if not updated:
+        if not exists:
+            return jsonify({'message': 'Client not found!'}), 404
+        return jsonify({'message': 'Unauthorized!'}), 403
     
     return jsonify({
         'message': 'Client updated successfully!'
@@ -767,30 +1059,28 @@ def delete_client(current_user, client_id):
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
     
-    # Check if client exists
-    cur.execute('SELECT client_logo FROM client WHERE client_id = %s', (client_id,))
-    client = cur.fetchone()
-    
-    if not client:
+    # Delete client and queue the logo cleanup in one transaction
+    conn.autocommit = False
+    try:
+        with conn:
+            cur.execute('DELETE FROM client WHERE client_id = %s RETURNING client_logo', (client_id,))
+            client = cur.fetchone()
+            
+            if client:
+                cache.invalidate('client_lists', cur=cur)
+                cache.invalidate('machine_scan', cur=cur)
+                cache.invalidate('scan_scope', cur=cur)
+                
+                # Delete client logo file in the background
+                if client['client_logo']:
+                    job_queue.enqueue('delete_file', {'path': f"client_logos/{client['client_logo']}"}, conn=conn)
+    finally:
         cur.close()
+        conn.autocommit = True
         conn.close()
-        return jsonify({'message': 'Client not found!'}), 404
     
-    # Delete client logo file if exists
-    if client['client_logo']:
-        try:
-            file_path = os.path.join(CLIENT_LOGO_FOLDER, client['client_logo'])
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        except Exception as e:
-            print(f"Error deleting file: {e}")
-    
-    # Delete client
-    cur.execute('DELETE FROM client WHERE client_id = %s', (client_id,))
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+    if not client:
+        return jsonify({'message': 'Client not found!'}), 404
     
     return jsonify({
         'message': 'Client deleted successfully!'
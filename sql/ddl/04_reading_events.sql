@@ -0,0 +1,47 @@
+-- Reading change feed for live screens (Server-Sent Events)
+
+-- Durable event log so subscribers can resume from Last-Event-ID
+CREATE TABLE IF NOT EXISTS reading_event (
+    event_id BIGSERIAL PRIMARY KEY,
+    event_type VARCHAR(20) NOT NULL, -- 'created' or 'responded'
+    reading_id INT NOT NULL,
+    machine_id INT,
+    client_id INT,
+    distributor_id INT,
+    status reading_status NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_reading_event_created_at ON reading_event(created_at);
+
+-- Record the event and wake up listeners on channel 'reading_events'
+CREATE OR REPLACE FUNCTION notify_reading_event()
+RETURNS TRIGGER AS $$
+DECLARE
+    event reading_event%ROWTYPE;
+    kind VARCHAR(20);
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        kind := 'created';
+    ELSIF NEW.response_timestamp IS DISTINCT FROM OLD.response_timestamp
+          OR NEW.status IS DISTINCT FROM OLD.status THEN
+        kind := 'responded';
+    ELSE
+        RETURN NEW;
+    END IF;
+
+    INSERT INTO reading_event (event_type, reading_id, machine_id, client_id, distributor_id, status)
+    SELECT kind, NEW.reading_id, NEW.machine_id, m.client_id, m.distributor_id, NEW.status
+    FROM (SELECT 1) AS one
+    LEFT JOIN machine m ON m.machine_id = NEW.machine_id
+    RETURNING * INTO event;
+
+    PERFORM pg_notify('reading_events', row_to_json(event)::text);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER reading_event_notify
+AFTER INSERT OR UPDATE ON reading
+FOR EACH ROW
+EXECUTE PROCEDURE notify_reading_event();
@@ -0,0 +1,23 @@
+-- Work queue over Pending readings
+
+ALTER TABLE reading ADD COLUMN IF NOT EXISTS priority SMALLINT NOT NULL DEFAULT 0;
+ALTER TABLE reading ADD COLUMN IF NOT EXISTS claimed_by INT REFERENCES user_details(user_id);
+ALTER TABLE reading ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE reading ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP WITH TIME ZONE;
+
+ALTER TABLE reading
+ADD CONSTRAINT reading_claim_check
+CHECK (
+    (claimed_by IS NULL AND claimed_at IS NULL AND lease_expires_at IS NULL) OR
+    (claimed_by IS NOT NULL AND claimed_at IS NOT NULL AND lease_expires_at IS NOT NULL)
+);
+
+-- Unclaimed pending readings in claim order; only this small subset is indexed
+CREATE INDEX IF NOT EXISTS idx_reading_pending_queue
+ON reading (priority DESC, created_at)
+WHERE status = 'Pending' AND claimed_by IS NULL;
+
+-- Outstanding leases, for releasing expired claims
+CREATE INDEX IF NOT EXISTS idx_reading_claim_lease
+ON reading (lease_expires_at)
+WHERE claimed_by IS NOT NULL;
@@ -0,0 +1,41 @@
+-- Background job queue
+
+CREATE TYPE job_status AS ENUM ('queued', 'running', 'succeeded', 'dead');
+
+CREATE TABLE IF NOT EXISTS job (
+    job_id BIGSERIAL PRIMARY KEY,
+    job_type VARCHAR(50) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    status job_status NOT NULL DEFAULT 'queued',
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    run_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_by VARCHAR(100),
+    locked_at TIMESTAMP WITH TIME ZONE,
+    heartbeat_at TIMESTAMP WITH TIME ZONE,
+    last_error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Jobs waiting to run, in due order
+CREATE INDEX IF NOT EXISTS idx_job_ready ON job (run_at) WHERE status = 'queued';
+
+-- Running jobs, for recovering the ones whose worker stopped sending
+-- heartbeats
+CREATE INDEX IF NOT EXISTS idx_job_running ON job (heartbeat_at) WHERE status = 'running';
+
+-- Dead-letter view: jobs that used up their retries
+CREATE OR REPLACE VIEW dead_job AS
+SELECT job_id, job_type, payload, attempts, last_error, created_at, updated_at
+FROM job
+WHERE status = 'dead';
+
+CREATE TRIGGER update_job_timestamp
+BEFORE UPDATE ON job
+FOR EACH ROW
+EXECUTE PROCEDURE update_timestamp();
+
+ALTER TABLE job
+ADD CONSTRAINT job_attempts_check
+CHECK (attempts >= 0 AND max_attempts > 0);
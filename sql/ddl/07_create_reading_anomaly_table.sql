@@ -0,0 +1,22 @@
+-- Anomaly flags produced by the fleet scoring job
+
+CREATE TABLE IF NOT EXISTS reading_anomaly (
+    anomaly_id BIGSERIAL PRIMARY KEY,
+    reading_id INT NOT NULL,
+    machine_id INT NOT NULL REFERENCES machine(machine_id) ON DELETE CASCADE,
+    metric VARCHAR(30) NOT NULL,
+    kind VARCHAR(20) NOT NULL,
+    score FLOAT NOT NULL,
+    detected_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (reading_id, metric, kind)
+);
+
+CREATE INDEX IF NOT EXISTS idx_reading_anomaly_machine ON reading_anomaly(machine_id, detected_at DESC);
+
+ALTER TABLE reading_anomaly
+ADD CONSTRAINT reading_anomaly_metric_check
+CHECK (metric IN ('oil_refractometer', 'oil_ph_level', 'water_ph_level'));
+
+ALTER TABLE reading_anomaly
+ADD CONSTRAINT reading_anomaly_kind_check
+CHECK (kind IN ('zscore', 'drift', 'changepoint'));
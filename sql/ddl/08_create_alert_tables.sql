@@ -0,0 +1,56 @@
+-- Threshold alert rules and the alerts they raise
+
+CREATE TABLE IF NOT EXISTS alert_rule (
+    rule_id SERIAL PRIMARY KEY,
+    rule_name VARCHAR(100) NOT NULL,
+    -- Scope: NULL matches anything
+    client_id INT REFERENCES client(client_id) ON DELETE CASCADE,
+    type_of_metal VARCHAR(50),
+    type_of_machine VARCHAR(50),
+    machine_id INT REFERENCES machine(machine_id) ON DELETE CASCADE,
+    metric VARCHAR(30) NOT NULL,
+    operator VARCHAR(2) NOT NULL,
+    threshold FLOAT NOT NULL,
+    severity VARCHAR(10) NOT NULL DEFAULT 'warning',
+    is_active BOOLEAN NOT NULL DEFAULT TRUE,
+    created_by INT REFERENCES user_details(user_id),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS reading_alert (
+    alert_id BIGSERIAL PRIMARY KEY,
+    reading_id INT NOT NULL,
+    machine_id INT NOT NULL REFERENCES machine(machine_id) ON DELETE CASCADE,
+    rule_id INT REFERENCES alert_rule(rule_id) ON DELETE SET NULL,
+    metric VARCHAR(30) NOT NULL,
+    value FLOAT NOT NULL,
+    operator VARCHAR(2) NOT NULL,
+    threshold FLOAT NOT NULL,
+    severity VARCHAR(10) NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_reading_alert_machine ON reading_alert(machine_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_reading_alert_reading ON reading_alert(reading_id);
+
+CREATE TRIGGER update_alert_rule_timestamp
+BEFORE UPDATE ON alert_rule
+FOR EACH ROW
+EXECUTE PROCEDURE update_timestamp();
+
+ALTER TABLE alert_rule
+ADD CONSTRAINT alert_rule_metric_check
+CHECK (metric IN ('oil_refractometer', 'oil_ph_level', 'water_ph_level', 'oil_top_up', 'water_input'));
+
+ALTER TABLE alert_rule
+ADD CONSTRAINT alert_rule_operator_check
+CHECK (operator IN ('<', '<=', '>', '>='));
+
+ALTER TABLE alert_rule
+ADD CONSTRAINT alert_rule_severity_check
+CHECK (severity IN ('info', 'warning', 'critical'));
+
+ALTER TABLE alert_rule
+ADD CONSTRAINT alert_rule_machine_type_check
+CHECK (type_of_machine IS NULL OR type_of_machine IN ('Mill', 'Lathe', 'Drill', 'Grinder', 'Cutter', 'Press', 'Other'));
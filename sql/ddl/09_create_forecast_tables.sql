@@ -0,0 +1,42 @@
+-- Oil and water top-up forecasts
+
+-- One row per refit; the API serves the latest completed run
+CREATE TABLE IF NOT EXISTS forecast_run (
+    run_id SERIAL PRIMARY KEY,
+    horizon_weeks INT NOT NULL,
+    history_weeks INT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'running',
+    machines INT,
+    started_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
+-- Weekly forecast per machine
+CREATE TABLE IF NOT EXISTS machine_forecast (
+    run_id INT NOT NULL REFERENCES forecast_run(run_id) ON DELETE CASCADE,
+    machine_id INT NOT NULL,
+    period_start DATE NOT NULL,
+    oil_top_up FLOAT NOT NULL,
+    water_input FLOAT NOT NULL,
+    PRIMARY KEY (run_id, machine_id, period_start)
+);
+
+-- Weekly forecast summed per client and per distributor
+CREATE TABLE IF NOT EXISTS forecast_rollup (
+    run_id INT NOT NULL REFERENCES forecast_run(run_id) ON DELETE CASCADE,
+    scope_type VARCHAR(20) NOT NULL,
+    scope_id INT NOT NULL,
+    period_start DATE NOT NULL,
+    oil_top_up FLOAT NOT NULL,
+    water_input FLOAT NOT NULL,
+    machines INT NOT NULL,
+    PRIMARY KEY (run_id, scope_type, scope_id, period_start)
+);
+
+ALTER TABLE forecast_run
+ADD CONSTRAINT forecast_run_status_check
+CHECK (status IN ('running', 'completed', 'failed'));
+
+ALTER TABLE forecast_rollup
+ADD CONSTRAINT forecast_rollup_scope_check
+CHECK (scope_type IN ('client', 'distributor'));
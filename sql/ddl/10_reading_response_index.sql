@@ -0,0 +1,4 @@
+-- Completed responses by response time, for effectiveness analytics
+CREATE INDEX IF NOT EXISTS idx_reading_completed_response
+ON reading (response_timestamp)
+WHERE status = 'Completed';
@@ -0,0 +1,5 @@
+-- Per-machine time ranges for chart series; the covered metrics allow
+-- index-only scans
+CREATE INDEX IF NOT EXISTS idx_reading_machine_created
+ON reading (machine_id, created_at)
+INCLUDE (oil_refractometer, oil_ph_level, water_ph_level, status);
@@ -0,0 +1,16 @@
+-- Normalized metals for indexed filtering. Both columns are generated, so
+-- existing rows are backfilled when the column is added and every writer
+-- keeps using types_of_metals / type_of_metal unchanged.
+
+-- 'Aluminium, Steel,' -> {aluminium,steel}
+ALTER TABLE client ADD COLUMN IF NOT EXISTS metals TEXT[]
+GENERATED ALWAYS AS (
+    array_remove(regexp_split_to_array(lower(btrim(types_of_metals)), '\s*,\s*'), '')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_client_metals ON client USING GIN (metals);
+
+ALTER TABLE machine ADD COLUMN IF NOT EXISTS metal_key VARCHAR(50)
+GENERATED ALWAYS AS (lower(btrim(type_of_metal))) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_machine_metal_key ON machine (metal_key);
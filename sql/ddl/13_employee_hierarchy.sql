@@ -0,0 +1,96 @@
+-- Employee reporting lines keyed by id, with a closure table holding every
+-- (ancestor, descendant) pair so a manager's whole subtree is one index
+-- range on the primary key
+
+ALTER TABLE employee_details
+ADD COLUMN IF NOT EXISTS manager_id INT REFERENCES employee_details(id) ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS idx_employee_manager_id ON employee_details(manager_id);
+
+-- Backfill manager_id from manager_name; duplicate names resolve to the
+-- oldest manager record
+UPDATE employee_details e
+SET manager_id = m.id
+FROM (
+    SELECT DISTINCT ON (employee_name) id, employee_name
+    FROM employee_details
+    WHERE employee_type = 'Manager'
+    ORDER BY employee_name, id
+) m
+WHERE e.manager_name = m.employee_name AND e.manager_id IS NULL AND e.id <> m.id;
+
+CREATE TABLE IF NOT EXISTS employee_hierarchy (
+    ancestor_id INT NOT NULL REFERENCES employee_details(id) ON DELETE CASCADE,
+    descendant_id INT NOT NULL REFERENCES employee_details(id) ON DELETE CASCADE,
+    depth INT NOT NULL,
+    PRIMARY KEY (ancestor_id, descendant_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_employee_hierarchy_descendant ON employee_hierarchy(descendant_id);
+
+-- Build the closure from the backfilled reporting lines, stopping at cycles
+INSERT INTO employee_hierarchy (ancestor_id, descendant_id, depth)
+WITH RECURSIVE paths AS (
+    SELECT id AS ancestor_id, id AS descendant_id, 0 AS depth, ARRAY[id] AS path
+    FROM employee_details
+    UNION ALL
+    SELECT p.ancestor_id, e.id, p.depth + 1, p.path || e.id
+    FROM paths p
+    JOIN employee_details e ON e.manager_id = p.descendant_id
+    WHERE NOT e.id = ANY(p.path)
+)
+SELECT ancestor_id, descendant_id, MIN(depth) FROM paths
+GROUP BY ancestor_id, descendant_id
+ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION maintain_employee_hierarchy()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO employee_hierarchy (ancestor_id, descendant_id, depth)
+        SELECT ancestor_id, NEW.id, depth + 1 FROM employee_hierarchy WHERE descendant_id = NEW.manager_id
+        UNION ALL
+        SELECT NEW.id, NEW.id, 0;
+        RETURN NEW;
+    END IF;
+
+    IF NEW.manager_id IS NOT DISTINCT FROM OLD.manager_id THEN
+        RETURN NEW;
+    END IF;
+
+    -- The new manager may not be the employee or one of their reports
+    IF NEW.manager_id IS NOT NULL AND EXISTS (
+        SELECT 1 FROM employee_hierarchy WHERE ancestor_id = NEW.id AND descendant_id = NEW.manager_id
+    ) THEN
+        RAISE EXCEPTION 'Employee % cannot report to %, who is in their own subtree', NEW.id, NEW.manager_id;
+    END IF;
+
+    -- Detach the subtree from the old manager's chain
+    DELETE FROM employee_hierarchy h
+    USING employee_hierarchy sub
+    WHERE sub.ancestor_id = NEW.id
+    AND h.descendant_id = sub.descendant_id
+    AND h.ancestor_id IN (
+        SELECT ancestor_id FROM employee_hierarchy WHERE descendant_id = NEW.id AND depth > 0
+    );
+
+    -- Attach it under the new manager's chain
+    INSERT INTO employee_hierarchy (ancestor_id, descendant_id, depth)
+    SELECT a.ancestor_id, s.descendant_id, a.depth + s.depth + 1
+    FROM employee_hierarchy a
+    CROSS JOIN employee_hierarchy s
+    WHERE a.descendant_id = NEW.manager_id AND s.ancestor_id = NEW.id;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER employee_hierarchy_insert
+AFTER INSERT ON employee_details
+FOR EACH ROW
+EXECUTE PROCEDURE maintain_employee_hierarchy();
+
+CREATE TRIGGER employee_hierarchy_update
+AFTER UPDATE OF manager_id ON employee_details
+FOR EACH ROW
+EXECUTE PROCEDURE maintain_employee_hierarchy();
@@ -0,0 +1,146 @@
+-- Convert reading to monthly range partitions on created_at.
+-- Run in a maintenance window: rows are copied into the new partitioned
+-- table inside one transaction.
+
+BEGIN;
+
+-- Create one monthly partition (no-op if it exists)
+CREATE OR REPLACE FUNCTION create_reading_partition(month_start DATE)
+RETURNS BOOLEAN AS $$
+DECLARE
+    partition_name TEXT := format('reading_y%sm%s', to_char(month_start, 'YYYY'), to_char(month_start, 'MM'));
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN FALSE;
+    END IF;
+
+    EXECUTE format(
+        'CREATE TABLE %I PARTITION OF reading FOR VALUES FROM (%L) TO (%L)',
+        partition_name, month_start, (month_start + INTERVAL '1 month')::date
+    );
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Make sure partitions exist from the current month through months_ahead
+CREATE OR REPLACE FUNCTION ensure_reading_partitions(months_ahead INT)
+RETURNS INT AS $$
+DECLARE
+    created INT := 0;
+BEGIN
+    FOR i IN 0..months_ahead LOOP
+        IF create_reading_partition((date_trunc('month', CURRENT_DATE) + make_interval(months => i))::date) THEN
+            created := created + 1;
+        END IF;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE reading RENAME TO reading_unpartitioned;
+ALTER INDEX reading_pkey RENAME TO reading_unpartitioned_pkey;
+DROP TRIGGER IF EXISTS update_reading_timestamp ON reading_unpartitioned;
+DROP TRIGGER IF EXISTS reading_event_notify ON reading_unpartitioned;
+
+-- created_at is the partition key; give rows without one their last
+-- update time (triggers are gone, so updated_at is left as it was)
+UPDATE reading_unpartitioned
+SET created_at = COALESCE(updated_at, CURRENT_TIMESTAMP)
+WHERE created_at IS NULL;
+DROP INDEX IF EXISTS idx_reading_pending_queue;
+DROP INDEX IF EXISTS idx_reading_claim_lease;
+DROP INDEX IF EXISTS idx_reading_completed_response;
+DROP INDEX IF EXISTS idx_reading_machine_created;
+
+-- Same columns, defaults (including the reading_id sequence) and checks
+CREATE TABLE reading (
+    LIKE reading_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS
+) PARTITION BY RANGE (created_at);
+
+ALTER TABLE reading ALTER COLUMN created_at SET NOT NULL;
+ALTER TABLE reading ADD PRIMARY KEY (reading_id, created_at);
+ALTER SEQUENCE reading_reading_id_seq OWNED BY reading.reading_id;
+
+ALTER TABLE reading ADD FOREIGN KEY (machine_id) REFERENCES machine(machine_id);
+ALTER TABLE reading ADD FOREIGN KEY (raised_by) REFERENCES user_details(user_id);
+ALTER TABLE reading ADD FOREIGN KEY (response_by) REFERENCES user_details(user_id);
+ALTER TABLE reading ADD FOREIGN KEY (claimed_by) REFERENCES user_details(user_id);
+
+-- Partitions for the existing history plus the next three months
+DO $$
+DECLARE
+    month_start DATE;
+BEGIN
+    SELECT COALESCE(date_trunc('month', MIN(created_at)), date_trunc('month', CURRENT_DATE))::date
+    INTO month_start FROM reading_unpartitioned;
+
+    WHILE month_start < date_trunc('month', CURRENT_DATE)::date LOOP
+        PERFORM create_reading_partition(month_start);
+        month_start := (month_start + INTERVAL '1 month')::date;
+    END LOOP;
+
+    PERFORM ensure_reading_partitions(3);
+END;
+$$;
+
+-- Catches rows outside every monthly partition; should stay empty
+CREATE TABLE reading_default PARTITION OF reading DEFAULT;
+
+INSERT INTO reading
+SELECT * FROM reading_unpartitioned;
+
+-- Indexes are declared once on the parent and created on every partition
+CREATE INDEX idx_reading_pending_queue
+ON reading (priority DESC, created_at)
+WHERE status = 'Pending' AND claimed_by IS NULL;
+
+CREATE INDEX idx_reading_claim_lease
+ON reading (lease_expires_at)
+WHERE claimed_by IS NOT NULL;
+
+CREATE INDEX idx_reading_completed_response
+ON reading (response_timestamp)
+WHERE status = 'Completed';
+
+CREATE INDEX idx_reading_machine_created
+ON reading (machine_id, created_at)
+INCLUDE (oil_refractometer, oil_ph_level, water_ph_level, status);
+
+-- reading_id lookups (responses, deletes) without a created_at
+CREATE INDEX idx_reading_id ON reading (reading_id);
+
+CREATE TRIGGER update_reading_timestamp
+BEFORE UPDATE ON reading
+FOR EACH ROW
+EXECUTE PROCEDURE update_timestamp();
+
+CREATE TRIGGER reading_event_notify
+AFTER INSERT OR UPDATE ON reading
+FOR EACH ROW
+EXECUTE PROCEDURE notify_reading_event();
+
+-- Never drop history that did not make it across
+DO $$
+BEGIN
+    IF (SELECT COUNT(*) FROM reading) <> (SELECT COUNT(*) FROM reading_unpartitioned) THEN
+        RAISE EXCEPTION 'reading row counts differ after the backfill; keeping reading_unpartitioned';
+    END IF;
+END;
+$$;
+
+DROP TABLE reading_unpartitioned;
+
+-- Partitions detached past the retention horizon and archived to disk
+CREATE TABLE IF NOT EXISTS reading_archive (
+    partition_name VARCHAR(63) PRIMARY KEY,
+    range_start DATE NOT NULL,
+    range_end DATE NOT NULL,
+    file_path TEXT NOT NULL,
+    row_count BIGINT NOT NULL,
+    file_bytes BIGINT NOT NULL,
+    archived_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_reading_archive_range ON reading_archive(range_start, range_end);
+
+COMMIT;
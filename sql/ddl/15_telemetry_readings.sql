@@ -0,0 +1,58 @@
+-- Sensor telemetry stored in reading under its own status, so it never
+-- shows up as work (Pending) or as a response (Completed).
+-- ALTER TYPE ... ADD VALUE must run outside a transaction block.
+
+ALTER TYPE reading_status ADD VALUE IF NOT EXISTS 'Telemetry';
+
+ALTER TABLE reading DROP CONSTRAINT IF EXISTS reading_status_check;
+ALTER TABLE reading
+ADD CONSTRAINT reading_status_check
+CHECK (status IN ('Pending', 'Completed', 'Not In Use', 'Telemetry'));
+
+-- Sensors may report any subset of the measurements
+ALTER TABLE reading DROP CONSTRAINT IF EXISTS reading_null_check;
+ALTER TABLE reading
+ADD CONSTRAINT reading_null_check
+CHECK (
+    (status = 'Not In Use' AND oil_refractometer IS NULL AND oil_ph_level IS NULL AND water_ph_level IS NULL) OR
+    (status = 'Telemetry' AND COALESCE(oil_refractometer, oil_ph_level, water_ph_level) IS NOT NULL) OR
+    (status IN ('Pending', 'Completed') AND oil_refractometer IS NOT NULL AND oil_ph_level IS NOT NULL AND water_ph_level IS NOT NULL)
+);
+
+-- Sensor rows have no user behind them
+ALTER TABLE reading ALTER COLUMN raised_by DROP NOT NULL;
+ALTER TABLE reading
+ADD CONSTRAINT reading_raised_by_check
+CHECK (status = 'Telemetry' OR raised_by IS NOT NULL);
+
+-- Telemetry arrives every few seconds per machine; keep it out of the
+-- event log and NOTIFY channel used by the live screens
+CREATE OR REPLACE FUNCTION notify_reading_event()
+RETURNS TRIGGER AS $$
+DECLARE
+    event reading_event%ROWTYPE;
+    kind VARCHAR(20);
+BEGIN
+    IF NEW.status = 'Telemetry' THEN
+        RETURN NEW;
+    END IF;
+
+    IF TG_OP = 'INSERT' THEN
+        kind := 'created';
+    ELSIF NEW.response_timestamp IS DISTINCT FROM OLD.response_timestamp
+          OR NEW.status IS DISTINCT FROM OLD.status THEN
+        kind := 'responded';
+    ELSE
+        RETURN NEW;
+    END IF;
+
+    INSERT INTO reading_event (event_type, reading_id, machine_id, client_id, distributor_id, status)
+    SELECT kind, NEW.reading_id, NEW.machine_id, m.client_id, m.distributor_id, NEW.status
+    FROM (SELECT 1) AS one
+    LEFT JOIN machine m ON m.machine_id = NEW.machine_id
+    RETURNING * INTO event;
+
+    PERFORM pg_notify('reading_events', row_to_json(event)::text);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,19 @@
+-- Bulk CSV imports and their error reports
+
+CREATE TABLE IF NOT EXISTS data_import (
+    import_id SERIAL PRIMARY KEY,
+    entity VARCHAR(20) NOT NULL,
+    file_name VARCHAR(255),
+    total_rows INT NOT NULL DEFAULT 0,
+    inserted_rows INT NOT NULL DEFAULT 0,
+    failed_rows INT NOT NULL DEFAULT 0,
+    error_file TEXT,
+    created_by INT REFERENCES user_details(user_id),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_data_import_created_by ON data_import(created_by, created_at DESC);
+
+ALTER TABLE data_import
+ADD CONSTRAINT data_import_entity_check
+CHECK (entity IN ('clients', 'distributors'));
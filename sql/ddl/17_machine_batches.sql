@@ -0,0 +1,22 @@
+-- Bulk machine onboarding: sequence-backed unique codes and label sheets
+
+-- Codes are '<prefix>-<8 digit number>' drawn from this sequence, so bulk
+-- registration never has to retry on unique_code collisions
+CREATE SEQUENCE IF NOT EXISTS machine_code_seq;
+
+CREATE TABLE IF NOT EXISTS machine_batch (
+    batch_id SERIAL PRIMARY KEY,
+    machine_count INT NOT NULL,
+    label_status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    label_file TEXT,
+    created_by INT REFERENCES user_details(user_id),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+ALTER TABLE machine_batch
+ADD CONSTRAINT machine_batch_label_status_check
+CHECK (label_status IN ('pending', 'ready'));
+
+ALTER TABLE machine ADD COLUMN IF NOT EXISTS batch_id INT REFERENCES machine_batch(batch_id);
+
+CREATE INDEX IF NOT EXISTS idx_machine_batch_id ON machine(batch_id) WHERE batch_id IS NOT NULL;
@@ -0,0 +1,5 @@
+-- Latest manual (non-telemetry) readings of a machine for scan lookups,
+-- without walking past high-frequency sensor rows
+CREATE INDEX IF NOT EXISTS idx_reading_machine_manual
+ON reading (machine_id, created_at DESC)
+WHERE status <> 'Telemetry';
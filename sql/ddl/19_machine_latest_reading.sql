@@ -0,0 +1,135 @@
+-- Latest manual reading of every machine, kept in step with reading by
+-- triggers so "current fleet status" is a primary-key lookup instead of a
+-- DISTINCT ON over the whole history. Telemetry rows are not tracked.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS machine_latest_reading (
+    machine_id INT PRIMARY KEY REFERENCES machine(machine_id) ON DELETE CASCADE,
+    reading_id INT NOT NULL,
+    raised_by INT,
+    oil_refractometer FLOAT,
+    oil_ph_level FLOAT,
+    water_ph_level FLOAT,
+    oil_top_up FLOAT,
+    water_input FLOAT,
+    status reading_status NOT NULL,
+    response_by INT,
+    response_timestamp TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX IF NOT EXISTS idx_machine_latest_status ON machine_latest_reading(status, created_at);
+
+-- Recompute one machine from history (used when its latest row changes
+-- machine or timestamp, or is deleted)
+CREATE OR REPLACE FUNCTION refresh_machine_latest_reading(target_machine INT)
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM machine_latest_reading WHERE machine_id = target_machine;
+
+    INSERT INTO machine_latest_reading (machine_id, reading_id, raised_by, oil_refractometer, oil_ph_level,
+                                        water_ph_level, oil_top_up, water_input, status, response_by,
+                                        response_timestamp, created_at, updated_at)
+    SELECT machine_id, reading_id, raised_by, oil_refractometer, oil_ph_level,
+           water_ph_level, oil_top_up, water_input, status, response_by,
+           response_timestamp, created_at, updated_at
+    FROM reading
+    WHERE machine_id = target_machine AND status <> 'Telemetry'
+    ORDER BY created_at DESC, reading_id DESC
+    LIMIT 1;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION maintain_machine_latest_reading()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        IF EXISTS (SELECT 1 FROM machine_latest_reading
+                   WHERE machine_id = OLD.machine_id AND reading_id = OLD.reading_id) THEN
+            PERFORM refresh_machine_latest_reading(OLD.machine_id);
+        END IF;
+        RETURN OLD;
+    END IF;
+
+    IF TG_OP = 'UPDATE' AND (NEW.machine_id IS DISTINCT FROM OLD.machine_id
+                             OR NEW.created_at IS DISTINCT FROM OLD.created_at
+                             OR (NEW.status = 'Telemetry') <> (OLD.status = 'Telemetry')) THEN
+        PERFORM refresh_machine_latest_reading(OLD.machine_id);
+        IF NEW.machine_id IS DISTINCT FROM OLD.machine_id THEN
+            PERFORM refresh_machine_latest_reading(NEW.machine_id);
+        END IF;
+        RETURN NEW;
+    END IF;
+
+    IF NEW.status = 'Telemetry' OR NEW.machine_id IS NULL THEN
+        RETURN NEW;
+    END IF;
+
+    -- Insert, or a response on any reading: only replace the stored row with
+    -- one at least as recent, so out-of-order inserts don't win
+    INSERT INTO machine_latest_reading (machine_id, reading_id, raised_by, oil_refractometer, oil_ph_level,
+                                        water_ph_level, oil_top_up, water_input, status, response_by,
+                                        response_timestamp, created_at, updated_at)
+    VALUES (NEW.machine_id, NEW.reading_id, NEW.raised_by, NEW.oil_refractometer, NEW.oil_ph_level,
+            NEW.water_ph_level, NEW.oil_top_up, NEW.water_input, NEW.status, NEW.response_by,
+            NEW.response_timestamp, NEW.created_at, NEW.updated_at)
+    ON CONFLICT (machine_id) DO UPDATE SET
+        reading_id = EXCLUDED.reading_id,
+        raised_by = EXCLUDED.raised_by,
+        oil_refractometer = EXCLUDED.oil_refractometer,
+        oil_ph_level = EXCLUDED.oil_ph_level,
+        water_ph_level = EXCLUDED.water_ph_level,
+        oil_top_up = EXCLUDED.oil_top_up,
+        water_input = EXCLUDED.water_input,
+        status = EXCLUDED.status,
+        response_by = EXCLUDED.response_by,
+        response_timestamp = EXCLUDED.response_timestamp,
+        created_at = EXCLUDED.created_at,
+        updated_at = EXCLUDED.updated_at
+    WHERE (EXCLUDED.created_at, EXCLUDED.reading_id)
+          >= (machine_latest_reading.created_at, machine_latest_reading.reading_id);
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Telemetry rows are filtered before the function is called. Updates
+-- still fire when either side is a manual reading, so a status change in
+-- or out of 'Telemetry' refreshes the machine.
+DROP TRIGGER IF EXISTS machine_latest_reading_trigger ON reading;
+
+CREATE TRIGGER machine_latest_reading_trigger
+AFTER INSERT ON reading
+FOR EACH ROW WHEN (NEW.status <> 'Telemetry')
+EXECUTE PROCEDURE maintain_machine_latest_reading();
+
+DROP TRIGGER IF EXISTS machine_latest_reading_update ON reading;
+
+CREATE TRIGGER machine_latest_reading_update
+AFTER UPDATE ON reading
+FOR EACH ROW WHEN (NEW.status <> 'Telemetry' OR OLD.status <> 'Telemetry')
+EXECUTE PROCEDURE maintain_machine_latest_reading();
+
+DROP TRIGGER IF EXISTS machine_latest_reading_delete ON reading;
+
+CREATE TRIGGER machine_latest_reading_delete
+AFTER DELETE ON reading
+FOR EACH ROW WHEN (OLD.status <> 'Telemetry')
+EXECUTE PROCEDURE maintain_machine_latest_reading();
+
+-- Backfill from history
+INSERT INTO machine_latest_reading (machine_id, reading_id, raised_by, oil_refractometer, oil_ph_level,
+                                    water_ph_level, oil_top_up, water_input, status, response_by,
+                                    response_timestamp, created_at, updated_at)
+SELECT DISTINCT ON (machine_id)
+       machine_id, reading_id, raised_by, oil_refractometer, oil_ph_level,
+       water_ph_level, oil_top_up, water_input, status, response_by,
+       response_timestamp, created_at, updated_at
+FROM reading
+WHERE machine_id IS NOT NULL AND status <> 'Telemetry'
+ORDER BY machine_id, created_at DESC, reading_id DESC
+ON CONFLICT (machine_id) DO NOTHING;
+
+COMMIT;
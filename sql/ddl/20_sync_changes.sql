@@ -0,0 +1,170 @@
+-- Change log for delta sync to offline devices. Triggers on the synced
+-- tables append one row per insert/update ('U') and delete ('D', the
+-- tombstone); devices page through it with a sync token.
+
+BEGIN;
+
+ALTER TABLE employee_details ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP;
+UPDATE employee_details SET updated_at = created_at WHERE created_at IS NOT NULL;
+
+-- Keep updated_at honest on the synced tables
+CREATE OR REPLACE FUNCTION touch_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at := NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS client_touch_updated_at ON client;
+CREATE TRIGGER client_touch_updated_at BEFORE UPDATE ON client
+FOR EACH ROW EXECUTE PROCEDURE touch_updated_at();
+
+DROP TRIGGER IF EXISTS machine_touch_updated_at ON machine;
+CREATE TRIGGER machine_touch_updated_at BEFORE UPDATE ON machine
+FOR EACH ROW EXECUTE PROCEDURE touch_updated_at();
+
+DROP TRIGGER IF EXISTS reading_touch_updated_at ON reading;
+CREATE TRIGGER reading_touch_updated_at BEFORE UPDATE ON reading
+FOR EACH ROW EXECUTE PROCEDURE touch_updated_at();
+
+DROP TRIGGER IF EXISTS employee_touch_updated_at ON employee_details;
+CREATE TRIGGER employee_touch_updated_at BEFORE UPDATE ON employee_details
+FOR EACH ROW EXECUTE PROCEDURE touch_updated_at();
+
+-- txid orders changes by transaction: a token only moves past a txid once
+-- every older transaction has finished, so late commits are never skipped.
+-- distributor_id is only set on the tombstones written when a client moves
+-- away from that distributor.
+CREATE TABLE IF NOT EXISTS sync_change (
+    change_id BIGSERIAL PRIMARY KEY,
+    txid BIGINT NOT NULL DEFAULT txid_current(),
+    entity VARCHAR(20) NOT NULL,
+    entity_id BIGINT NOT NULL,
+    op CHAR(1) NOT NULL,
+    client_id INT,
+    distributor_id INT,
+    changed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_sync_change_position ON sync_change(txid, change_id);
+CREATE INDEX IF NOT EXISTS idx_sync_change_changed_at ON sync_change(changed_at);
+
+ALTER TABLE sync_change
+ADD CONSTRAINT sync_change_op_check
+CHECK (op IN ('U', 'D'));
+
+-- Position up to which the log has been pruned; older tokens must resync
+CREATE TABLE IF NOT EXISTS sync_horizon (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    txid BIGINT NOT NULL DEFAULT 0,
+    change_id BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO sync_horizon (id) VALUES (TRUE) ON CONFLICT DO NOTHING;
+
+-- Arguments: entity name, id column, client column ('' for unscoped rows,
+-- 'machine_id' resolves the client through machine)
+CREATE OR REPLACE FUNCTION capture_sync_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    new_row JSONB;
+    old_row JSONB;
+    new_client INT;
+    old_client INT;
+BEGIN
+    IF TG_OP <> 'DELETE' THEN
+        new_row := to_jsonb(NEW);
+    END IF;
+    IF TG_OP <> 'INSERT' THEN
+        old_row := to_jsonb(OLD);
+    END IF;
+
+    IF TG_ARGV[2] = 'machine_id' THEN
+        SELECT client_id INTO new_client FROM machine WHERE machine_id = (new_row->>'machine_id')::int;
+        SELECT client_id INTO old_client FROM machine WHERE machine_id = (old_row->>'machine_id')::int;
+    ELSIF TG_ARGV[2] <> '' THEN
+        new_client := (new_row->>TG_ARGV[2])::int;
+        old_client := (old_row->>TG_ARGV[2])::int;
+    END IF;
+
+    -- A row that moved to another client is a delete for the old one
+    IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND old_client IS DISTINCT FROM new_client) THEN
+        INSERT INTO sync_change (entity, entity_id, op, client_id)
+        VALUES (TG_ARGV[0], (old_row->>TG_ARGV[1])::bigint, 'D', old_client);
+    END IF;
+
+    IF TG_OP <> 'DELETE' THEN
+        INSERT INTO sync_change (entity, entity_id, op, client_id)
+        VALUES (TG_ARGV[0], (new_row->>TG_ARGV[1])::bigint, 'U', new_client);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS client_sync_change ON client;
+CREATE TRIGGER client_sync_change AFTER INSERT OR UPDATE OR DELETE ON client
+FOR EACH ROW EXECUTE PROCEDURE capture_sync_change('clients', 'client_id', 'client_id');
+
+DROP TRIGGER IF EXISTS machine_sync_change ON machine;
+CREATE TRIGGER machine_sync_change AFTER INSERT OR UPDATE OR DELETE ON machine
+FOR EACH ROW EXECUTE PROCEDURE capture_sync_change('machines', 'machine_id', 'client_id');
+
+-- Sensor telemetry is not synced to devices, so those rows never reach
+-- the trigger function
+DROP TRIGGER IF EXISTS reading_sync_change ON reading;
+CREATE TRIGGER reading_sync_change AFTER INSERT OR UPDATE ON reading
+FOR EACH ROW WHEN (NEW.status <> 'Telemetry')
+EXECUTE PROCEDURE capture_sync_change('readings', 'reading_id', 'machine_id');
+
+DROP TRIGGER IF EXISTS reading_sync_delete ON reading;
+CREATE TRIGGER reading_sync_delete AFTER DELETE ON reading
+FOR EACH ROW WHEN (OLD.status <> 'Telemetry')
+EXECUTE PROCEDURE capture_sync_change('readings', 'reading_id', 'machine_id');
+
+DROP TRIGGER IF EXISTS employee_sync_change ON employee_details;
+CREATE TRIGGER employee_sync_change AFTER INSERT OR UPDATE OR DELETE ON employee_details
+FOR EACH ROW EXECUTE PROCEDURE capture_sync_change('employees', 'id', '');
+
+-- A client moving to another distributor changes who may see it and
+-- everything under it. Devices that saw it through the old distributor get
+-- tombstones for the client, its machines and readings; devices that see
+-- it through the new one get the machines and recent readings an initial
+-- download would have carried (the client row itself is logged by
+-- client_sync_change). Argument: reading history in days, as
+-- SYNC_SNAPSHOT_READING_DAYS.
+CREATE OR REPLACE FUNCTION capture_client_scope_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF OLD.distributor_id IS NOT NULL THEN
+        INSERT INTO sync_change (entity, entity_id, op, client_id, distributor_id)
+        SELECT 'clients', OLD.client_id, 'D', OLD.client_id, OLD.distributor_id
+        UNION ALL
+        SELECT 'machines', machine_id, 'D', OLD.client_id, OLD.distributor_id
+        FROM machine WHERE client_id = OLD.client_id
+        UNION ALL
+        SELECT 'readings', r.reading_id, 'D', OLD.client_id, OLD.distributor_id
+        FROM reading r JOIN machine m ON m.machine_id = r.machine_id
+        WHERE m.client_id = OLD.client_id AND r.status <> 'Telemetry';
+    END IF;
+
+    INSERT INTO sync_change (entity, entity_id, op, client_id)
+    SELECT 'machines', machine_id, 'U', NEW.client_id
+    FROM machine WHERE client_id = NEW.client_id
+    UNION ALL
+    SELECT 'readings', r.reading_id, 'U', NEW.client_id
+    FROM reading r JOIN machine m ON m.machine_id = r.machine_id
+    WHERE m.client_id = NEW.client_id AND r.status <> 'Telemetry'
+    AND r.created_at >= NOW() - make_interval(days => TG_ARGV[0]::int);
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS client_scope_sync_change ON client;
+CREATE TRIGGER client_scope_sync_change AFTER UPDATE OF distributor_id ON client
+FOR EACH ROW WHEN (OLD.distributor_id IS DISTINCT FROM NEW.distributor_id)
+EXECUTE PROCEDURE capture_client_scope_change('90');
+
+COMMIT;
@@ -0,0 +1,5 @@
+-- Per-machine keys for POST /api/telemetry. unique_code is printed on the
+-- machine label, so it identifies a sensor but does not authenticate it.
+-- Only the SHA-256 of the key is stored.
+
+ALTER TABLE machine ADD COLUMN IF NOT EXISTS telemetry_key_hash CHAR(64);
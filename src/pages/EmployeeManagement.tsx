@@ -42,7 +42,7 @@ import {
   Edit, Trash, Search, Plus, Filter, ArrowLeft, ArrowRight 
 } from "lucide-react";
 import Layout from "@/components/layout/Layout";
-import fetchWithAuth from "@/utils/auth-fetch";
+import fetchWithAuth, { fetchBatchWithAuth } from "@/utils/auth-fetch";
 import { use } from "@tanstack/react-query";
 
 // Define the Employee interface
@@ -181,11 +181,46 @@ const EmployeeManagement: React.FC = () => {
     }
   };
   
+  // Load employees, types and managers in a single batch round trip
+  const fetchInitialData = async () => {
+    setIsLoading(true);
+    try {
+      const apiUrl = import.meta.env.VITE_API_URL;
+      const [employeesResult, typesResult, managersResult] = await fetchBatchWithAuth([
+        { id: "employees", url: `${apiUrl}/employees?page=1&limit=${pagination.limit}` },
+        { id: "types", url: `${apiUrl}/employees/types` },
+        { id: "managers", url: `${apiUrl}/employees/managers` },
+      ]);
+      
+      if (employeesResult.status !== 200) {
+        throw new Error("Failed to fetch employees");
+      }
+      
+      setEmployees(employeesResult.body.employees);
+      setPagination(employeesResult.body.pagination);
+      
+      if (typesResult.status === 200) {
+        setEmployeeTypes(typesResult.body.types);
+      }
+      
+      if (managersResult.status === 200) {
+        setManagers(managersResult.body.managers);
+      }
+    } catch (error) {
+      console.error("Error loading employee data:", error);
+      toast({
+        title: "Error",
+        description: "Failed to load employees. Please try again.",
+        variant: "destructive",
+      });
+    } finally {
+      setIsLoading(false);
+    }
+  };
+  
   // Initial data loading
   useEffect(() => {
-    fetchEmployees();
-    fetchEmployeeTypes();
-    fetchManagers();
+    fetchInitialData();
   }, []);
   
   // Handle form input changes
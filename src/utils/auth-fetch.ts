@@ -42,4 +42,42 @@ const fetchWithAuth = async (url: string, options: FetchOptions = {}) => {
   }
 };
 
+export interface BatchRequest {
+  id?: string;
+  url: string;
+}
+
+export interface BatchResponse<T = any> {
+  id: string;
+  status: number;
+  body: T;
+}
+
+/**
+ * Runs several GET requests in a single round trip through the batch endpoint.
+ * Results come back in the same order as the requests.
+ */
+export const fetchBatchWithAuth = async (
+  requests: BatchRequest[],
+  batchUrl = `${import.meta.env.VITE_API_URL}/batch`
+): Promise<BatchResponse[]> => {
+  const response = await fetchWithAuth(batchUrl, {
+    method: 'POST',
+    body: JSON.stringify({
+      requests: requests.map((request) => {
+        // The server routes sub-requests by path, so drop the origin
+        const url = new URL(request.url, window.location.origin);
+        return { id: request.id, path: `${url.pathname}${url.search}` };
+      }),
+    }),
+  });
+
+  if (!response.ok) {
+    throw new Error(`Batch request failed with status ${response.status}`);
+  }
+
+  const data = await response.json();
+  return data.responses;
+};
+
 export default fetchWithAuth;
@@ -0,0 +1,121 @@
+import argparse
+import signal
+import socketserver
+import threading
+import time
+from app.services import telemetry
+from app.utils import metrics
+
+# Seconds a TCP connection waits for buffer room before the line is refused
+TCP_BACKPRESSURE_TIMEOUT = 5.0
+
+# Lines parsed before handing a batch to the buffer
+BATCH_LINES = 500
+
+
+# The socket listeners have no per-message credentials; run them only on
+# the sensor network, and expose POST /api/telemetry (device keys) instead
+# where that is not trusted
+def parse_lines(lines, received_at):
+    rows = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            rows.append(telemetry.parse_line(line, received_at, trusted=True))
+        except (telemetry.TelemetryError, ValueError):
+            metrics.increment('telemetry.invalid')
+    return rows
+
+
+# One datagram may carry several newline-separated lines. UDP has no flow
+# control, so a full buffer drops the datagram (counted as rejected).
+class UDPHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        data = self.request[0].decode('utf-8', errors='replace')
+        rows = parse_lines(data.splitlines(), time.time())
+        if rows:
+            telemetry.buffer.offer(rows)
+
+
+# Long-lived sensor connections. When the buffer is full the handler stops
+# reading, so the kernel's TCP window pushes back on the sender.
+class TCPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        batch = []
+        last_flush = time.monotonic()
+        for raw in self.rfile:
+            batch.append(raw.decode('utf-8', errors='replace'))
+            if len(batch) >= BATCH_LINES or time.monotonic() - last_flush > 0.05:
+                if not self.submit(batch):
+                    return
+                batch = []
+                last_flush = time.monotonic()
+        if batch:
+            self.submit(batch)
+
+    def submit(self, lines):
+        rows = parse_lines(lines, time.time())
+        if rows and not telemetry.buffer.offer(rows, timeout=TCP_BACKPRESSURE_TIMEOUT):
+            self.wfile.write(b'BUSY\n')
+            return False
+        return True
+
+
+class ThreadingUDPServer(socketserver.ThreadingMixIn, socketserver.UDPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve_http(host, port):
+    from flask import Flask
+    from app.routes.telemetry_routes import telemetry_bp
+
+    app = Flask(__name__)
+    app.register_blueprint(telemetry_bp)
+    app.run(host=host, port=port, threaded=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sensor telemetry gateway (UDP/TCP line protocol and HTTP)')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--udp-port', type=int, default=8089)
+    parser.add_argument('--tcp-port', type=int, default=8094)
+    parser.add_argument('--http-port', type=int, default=0, help='also serve POST /api/telemetry (0 = off)')
+    parser.add_argument('--stats-interval', type=float, default=10.0, help='seconds between stats lines')
+    args = parser.parse_args()
+
+    telemetry.buffer.start()
+
+    servers = [
+        ThreadingUDPServer((args.host, args.udp_port), UDPHandler),
+        ThreadingTCPServer((args.host, args.tcp_port), TCPHandler),
+    ]
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    if args.http_port:
+        threading.Thread(target=serve_http, args=(args.host, args.http_port), daemon=True).start()
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+
+    print(f"Telemetry gateway listening on udp/{args.udp_port} tcp/{args.tcp_port}"
+          + (f" http/{args.http_port}" if args.http_port else ''))
+
+    while not stop_event.wait(args.stats_interval):
+        snapshot = metrics.snapshot('telemetry.')
+        flush = snapshot['timings'].get('telemetry.flush', {})
+        print(f"buffered={telemetry.buffer.size()} counters={snapshot['counters']} "
+              f"flush_p95_ms={flush.get('p95_ms', 0)}")
+
+    for server in servers:
+        server.shutdown()
+    # Drain what is left before exiting
+    telemetry.buffer.stop()
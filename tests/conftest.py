@@ -0,0 +1,53 @@
+import json
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DDL_DIR = os.path.join(ROOT, 'sql', 'ddl')
+
+
+# Tests that need Postgres read TEST_DB: a JSON object of connection
+# parameters, missing keys taken from DB_PARAMS. Point it at a throwaway
+# database; tests create and drop their own tables.
+@pytest.fixture
+def test_db():
+    raw = os.getenv('TEST_DB')
+    if not raw:
+        pytest.skip('TEST_DB is not set')
+    import db_config
+    return {**db_config.DB_PARAMS, **json.loads(raw)}
+
+
+def _reset_public_schema(conn):
+    cur = conn.cursor()
+    cur.execute('DROP SCHEMA IF EXISTS public CASCADE')
+    cur.execute('CREATE SCHEMA public')
+    cur.close()
+
+
+# The default test database with its public schema rebuilt from the given
+# sql/ddl files, e.g. ddl_database('01_create_tables.sql'), and dropped
+# again afterwards
+@pytest.fixture
+def ddl_database(test_db, monkeypatch):
+    import db_config
+    monkeypatch.setattr(db_config, 'DB_PARAMS', test_db)
+
+    def build(*files):
+        conn = db_config.get_db_connection()
+        _reset_public_schema(conn)
+        cur = conn.cursor()
+        for name in files:
+            with open(os.path.join(DDL_DIR, name)) as f:
+                cur.execute(f.read())
+        cur.close()
+        conn.close()
+
+    yield build
+
+    conn = db_config.get_db_connection()
+    _reset_public_schema(conn)
+    conn.close()
@@ -0,0 +1,58 @@
+import time
+import jwt
+import pytest
+from flask import Flask, jsonify
+import db_config
+from app.routes.batch_routes import batch_bp, MAX_PARALLEL
+
+QUERY_SECONDS = 0.5
+
+
+@pytest.fixture
+def pool(test_db, monkeypatch):
+    monkeypatch.setattr(db_config, 'DB_PARAMS', test_db)
+    monkeypatch.setattr(db_config, 'DB_POOL_MAX', MAX_PARALLEL + 1)
+    monkeypatch.setattr(db_config, '_pool', None)
+    yield
+    if db_config._pool is not None:
+        db_config._pool.closeall()
+
+
+def test_sub_requests_run_in_parallel_on_their_own_connections(pool):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'test'
+    app.register_blueprint(batch_bp)
+
+    @app.route('/api/backend')
+    def backend():
+        conn = db_config.get_db_connection()
+        cur = conn.cursor()
+        cur.execute('SELECT pg_backend_pid(), pg_sleep(%s)', (QUERY_SECONDS,))
+        pid = cur.fetchone()[0]
+        cur.close()
+        conn.close()
+        return jsonify({'pid': pid})
+
+    token = jwt.encode({'user_id': 1}, 'test', algorithm='HS256')
+    started = time.perf_counter()
+    response = app.test_client().post(
+        '/batch',
+        json={'requests': [{'path': '/api/backend'} for _ in range(MAX_PARALLEL)]},
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    elapsed = time.perf_counter() - started
+
+    assert response.status_code == 200
+    results = response.json['responses']
+    assert [result['status'] for result in results] == [200] * MAX_PARALLEL
+    assert len({result['body']['pid'] for result in results}) == MAX_PARALLEL
+    assert elapsed < QUERY_SECONDS * MAX_PARALLEL / 2
+
+
+def test_run_serves_the_batch_endpoint(test_db, monkeypatch):
+    monkeypatch.setattr(db_config, 'DB_PARAMS', test_db)
+    # Imported here: run connects to the database at import
+    import run
+
+    assert 'batch_bp' in run.app.blueprints
+    assert any(rule.rule == '/batch' for rule in run.app.url_map.iter_rules())
@@ -0,0 +1,136 @@
+import json
+import threading
+import time
+import uuid
+import pytest
+from app.utils import cache, metrics
+
+
+# Stands in for the mutation's cursor: collects the NOTIFY payloads that
+# would go out when its transaction commits
+class NotifyCursor:
+    def __init__(self):
+        self.payloads = []
+
+    def execute(self, query, params):
+        assert 'pg_notify' in query
+        self.payloads.append(json.loads(params[1]))
+
+
+@pytest.fixture
+def l2(monkeypatch):
+    local = cache.LocalL2()
+    monkeypatch.setattr(cache, '_l2', local)
+    return local
+
+
+@pytest.fixture
+def name():
+    return f'test_{uuid.uuid4().hex[:8]}'
+
+
+def _counter(name, suffix):
+    return metrics.snapshot(f'cache.{name}.')['counters'].get(f'cache.{name}.{suffix}', 0)
+
+
+def _l2_key(name, key):
+    return f'cache:{name}:{cache._l2_generation(name)}:{key}'
+
+
+def test_ttl_and_tiered_caches_share_get_or_set_signature(l2, name):
+    local = cache.TTLCache(f'{name}_local', ttl=60)
+    tiered = cache.TieredCache(name, ttl=60)
+
+    for instance in (local, tiered):
+        assert instance.get_or_set('k', lambda: 'value', 5) == 'value'
+        assert instance.get_or_set('k', lambda: 'other') == 'value'
+
+
+def test_second_worker_is_served_from_l2(l2, name):
+    loads = []
+    first = cache.TieredCache(name, ttl=60)
+    assert first.get_or_set('k', lambda: loads.append(1) or {'v': 1}) == {'v': 1}
+
+    # Another worker: empty L1, same L2
+    second = cache.TieredCache(name, ttl=60)
+    assert second.get_or_set('k', lambda: loads.append(2) or {'v': 2}) == {'v': 1}
+
+    assert loads == [1]
+    assert _counter(name, 'misses') == 1
+    assert _counter(name, 'l2_hits') == 1
+
+
+def test_concurrent_misses_coalesce_into_one_load(l2, name):
+    values = cache.TieredCache(name, ttl=60)
+    loads = []
+    start = threading.Barrier(8)
+    results = []
+
+    def load():
+        loads.append(1)
+        time.sleep(0.2)
+        return 'value'
+
+    def reader():
+        start.wait()
+        results.append(values.get_or_set('k', load))
+
+    threads = [threading.Thread(target=reader) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ['value'] * 8
+    assert len(loads) == 1
+    assert _counter(name, 'coalesced') == 7
+
+
+def test_l2_entry_is_dropped_when_the_invalidation_arrives(l2, name):
+    values = cache.TieredCache(name, ttl=60)
+    values.get_or_set('k', lambda: 'old')
+    assert l2.get(_l2_key(name, 'k')) is not None
+
+    cur = NotifyCursor()
+    cache.invalidate(name, 'k', cur=cur)
+
+    # Before commit: the local L1 copy is gone, L2 is left for the listener
+    assert values._l1.get('k') is None
+    assert l2.get(_l2_key(name, 'k')) is not None
+    assert cur.payloads[0]['cache'] == name and cur.payloads[0]['key'] == 'k'
+
+    # The NOTIFY arrives after commit (from another worker, so lag is timed)
+    message = dict(cur.payloads[0], origin='other-worker', sent_at=time.time() - 0.05)
+    cache.apply_invalidation(message)
+    assert l2.get(_l2_key(name, 'k')) is None
+    assert values.get_or_set('k', lambda: 'new') == 'new'
+
+    lag = metrics.snapshot(f'cache.{name}.')['timings'][f'cache.{name}.invalidation_lag']
+    assert lag['count'] == 1 and lag['max_ms'] >= 50
+
+
+def test_load_racing_an_invalidation_is_not_stored(l2, name):
+    values = cache.TieredCache(name, ttl=60)
+
+    def load():
+        # A write commits while this load is running
+        cache.invalidate(name, 'k', cur=NotifyCursor())
+        return 'read before the write'
+
+    assert values.get_or_set('k', load) == 'read before the write'
+    assert values._l1.get('k') is None
+    assert l2.get(_l2_key(name, 'k')) is None
+    assert values.get_or_set('k', lambda: 'fresh') == 'fresh'
+
+
+def test_full_invalidation_bumps_the_l2_generation(l2, name):
+    values = cache.TieredCache(name, ttl=60)
+    values.get_or_set('a', lambda: 1)
+    values.get_or_set('b', lambda: 2)
+
+    cur = NotifyCursor()
+    cache.invalidate(name, cur=cur)
+    cache.apply_invalidation(cur.payloads[0])
+
+    assert values.get_or_set('a', lambda: 10) == 10
+    assert values.get_or_set('b', lambda: 20) == 20
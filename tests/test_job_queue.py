@@ -0,0 +1,171 @@
+import threading
+import time
+import pytest
+import jwt
+import db_config
+from app.services import job_queue
+
+JOB_SECONDS = 1.5
+
+ADMIN_EMAIL = 'admin@example.com'
+
+
+def _slow(handler):
+    def slow(payload):
+        time.sleep(JOB_SECONDS)
+        handler(payload)
+    return slow
+
+
+@pytest.fixture
+def jobs(ddl_database, monkeypatch):
+    ddl_database('01_create_tables.sql', '06_create_job_table.sql')
+
+    # The real handlers, each made to take JOB_SECONDS
+    from app.services import job_handlers
+    monkeypatch.setitem(job_queue.JOB_HANDLERS, 'send_password_reset', _slow(job_handlers.send_password_reset))
+    monkeypatch.setitem(job_queue.JOB_HANDLERS, 'delete_file', _slow(job_handlers.delete_file))
+
+
+def _wait_for_status(job_id, status, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = job_queue.get_job(job_id)
+        if job['status'] == status:
+            return job
+        time.sleep(0.05)
+    pytest.fail(f'job {job_id} did not reach {status}')
+
+
+def _requeue_stale():
+    conn = db_config.get_db_connection()
+    cur = conn.cursor()
+    requeued = job_queue.requeue_stale_jobs(cur)
+    cur.close()
+    conn.close()
+    return requeued
+
+
+def _seed(client_count):
+    conn = db_config.get_db_connection()
+    cur = conn.cursor()
+    cur.execute('''
+        INSERT INTO user_details (username, password, full_name, user_mailid, role)
+        VALUES ('admin', 'unused', 'Admin', %s, 'admin')
+        RETURNING user_id
+    ''', (ADMIN_EMAIL,))
+    user_id = cur.fetchone()[0]
+
+    client_ids = []
+    for i in range(client_count):
+        cur.execute('''
+            INSERT INTO client (client_name, city, address, primary_contact_person, primary_mobile_number,
+                                email_id, gst_number, types_of_metals, client_category,
+                                whatsapp_communication_number, client_logo)
+            VALUES (%s, 'Pune', 'Plot 1', 'Contact', '9000000000', %s, %s, 'Steel', 'A', '9000000000', %s)
+            RETURNING client_id
+        ''', (f'Client {i}', f'client{i}@example.com', f'GST{i}', f'job_queue_test_{i}.png'))
+        client_ids.append(cur.fetchone()[0])
+    cur.close()
+    conn.close()
+    return user_id, client_ids
+
+
+def _queued_job_ids():
+    conn = db_config.get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT job_id FROM job WHERE status = 'queued' ORDER BY job_id")
+    job_ids = [row[0] for row in cur.fetchall()]
+    cur.close()
+    conn.close()
+    return job_ids
+
+
+def test_request_latency_is_independent_of_job_duration(jobs):
+    # Imported here: run connects to the database at import
+    import run
+
+    user_id, client_ids = _seed(3)
+    token = jwt.encode({'user_id': user_id}, run.app.config['SECRET_KEY'], algorithm='HS256')
+    headers = {'Authorization': f'Bearer {token}'}
+
+    client = run.app.test_client()
+    latencies = []
+    for _ in range(2):
+        started = time.perf_counter()
+        response = client.post('/api/forgot-password', json={'email': ADMIN_EMAIL})
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200
+    for client_id in client_ids:
+        started = time.perf_counter()
+        response = client.delete(f'/api/clients/{client_id}', headers=headers)
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200
+
+    job_ids = _queued_job_ids()
+    assert len(job_ids) == 5
+
+    # Requests return long before any job could have run
+    assert max(latencies) < JOB_SECONDS / 5
+
+    stop_event = threading.Event()
+    thread = threading.Thread(target=job_queue.work, args=(stop_event, 0.05, 'test-worker'))
+    started = time.perf_counter()
+    thread.start()
+    try:
+        for job_id in job_ids:
+            _wait_for_status(job_id, 'succeeded', JOB_SECONDS * len(job_ids) + 5)
+    finally:
+        stop_event.set()
+        thread.join()
+    assert time.perf_counter() - started >= JOB_SECONDS * len(job_ids)
+
+    # The reset handler really ran
+    conn = db_config.get_db_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT COUNT(*) FROM password_reset_token WHERE user_id = %s', (user_id,))
+    assert cur.fetchone()[0] == 2
+    cur.close()
+    conn.close()
+
+
+def test_long_running_job_is_not_requeued_while_heartbeating(jobs, monkeypatch):
+    monkeypatch.setattr(job_queue, 'HEARTBEAT_SECONDS', 0.1)
+    monkeypatch.setattr(job_queue, 'STALE_JOB_SECONDS', 0.5)
+
+    job_id = job_queue.enqueue('delete_file', {'path': 'client_logos/job_queue_test.png'})
+    stop_event = threading.Event()
+    thread = threading.Thread(target=job_queue.work, args=(stop_event, 0.05, 'test-worker'))
+    thread.start()
+    try:
+        _wait_for_status(job_id, 'running', 5)
+        # The job runs three times longer than the stale threshold
+        while job_queue.get_job(job_id)['status'] == 'running':
+            assert _requeue_stale() == 0
+            time.sleep(0.1)
+        job = job_queue.get_job(job_id)
+    finally:
+        stop_event.set()
+        thread.join()
+
+    assert job['status'] == 'succeeded'
+    assert job['attempts'] == 1
+
+
+def test_job_without_heartbeat_is_requeued(jobs, monkeypatch):
+    monkeypatch.setattr(job_queue, 'STALE_JOB_SECONDS', 0.5)
+
+    # A worker that died right after taking the job
+    job_id = job_queue.enqueue('delete_file', {'path': 'client_logos/job_queue_test.png'})
+    conn = db_config.get_db_connection()
+    cur = conn.cursor()
+    assert job_queue.dequeue(cur, 'dead-worker') is not None
+    cur.close()
+    conn.close()
+
+    assert _requeue_stale() == 0
+    time.sleep(0.6)
+    assert _requeue_stale() == 1
+    job = job_queue.get_job(job_id)
+    assert job['status'] == 'queued'
+    assert job['last_error'] == 'Worker stopped before finishing the job'
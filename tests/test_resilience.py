@@ -0,0 +1,130 @@
+import time
+import psycopg2
+import psycopg2.errors
+import pytest
+from flask import Flask, jsonify
+import db_config
+from app.utils import cache, resilience
+
+# Nothing listens here, so connecting fails the way it does during a failover
+DEAD_DATABASE = {'host': '127.0.0.1', 'port': 1, 'connect_timeout': 1}
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    monkeypatch.setattr(db_config.breaker, 'reset_seconds', 0.5)
+    db_config.breaker.record_success()
+    yield db_config.breaker
+    db_config.breaker.record_success()
+
+
+@pytest.fixture
+def outage(monkeypatch):
+    monkeypatch.setattr(db_config, 'DB_PARAMS', {**db_config.DB_PARAMS, **DEAD_DATABASE})
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    resilience.init_app(app)
+    values = cache.TieredCache('resilience_test', ttl=60)
+    loads = {'count': 0}
+
+    def select_one():
+        conn = db_config.get_db_connection()
+        cur = conn.cursor()
+        cur.execute('SELECT 1')
+        value = cur.fetchone()[0]
+        cur.close()
+        conn.close()
+        return value
+
+    @app.route('/db')
+    def db():
+        return jsonify({'value': select_one()})
+
+    @app.route('/cached')
+    def cached():
+        def load():
+            loads['count'] += 1
+            # The first load stands in for a healthy database
+            return 'fresh' if loads['count'] == 1 else select_one()
+        return jsonify({'value': values.get_or_set('key', load)})
+
+    @app.route('/cached/deadlock')
+    def cached_deadlock():
+        def load():
+            raise psycopg2.errors.DeadlockDetected('deadlock detected')
+        return jsonify({'value': values.get_or_set('key', load)})
+
+    @app.route('/deadlock')
+    def deadlock():
+        raise psycopg2.errors.DeadlockDetected('deadlock detected')
+
+    app.values = values
+    return app
+
+
+def test_connection_errors_open_the_breaker_then_fail_fast(app, breaker, outage):
+    client = app.test_client()
+
+    for _ in range(breaker.failure_threshold):
+        response = client.get('/db')
+        assert response.status_code == 503
+        assert int(response.headers['Retry-After']) >= 1
+    assert breaker.status()['state'] == 'open'
+
+    started = time.monotonic()
+    assert client.get('/db').status_code == 503
+    assert time.monotonic() - started < 0.5
+
+
+def test_cached_value_is_served_stale_during_an_outage(app, breaker, outage):
+    client = app.test_client()
+    assert client.get('/cached').json == {'value': 'fresh'}
+
+    app.values._drop('key')
+    response = client.get('/cached')
+    assert response.status_code == 200
+    assert response.json == {'value': 'fresh'}
+    assert response.headers['Warning'] == '110 - "Response is Stale"'
+    assert 'X-Stale-Since' in response.headers
+
+
+def test_statement_errors_are_not_outages(app, breaker):
+    app.config['PROPAGATE_EXCEPTIONS'] = False
+    client = app.test_client()
+
+    assert client.get('/deadlock').status_code == 500
+    assert breaker.status() == {'state': 'closed', 'failures': 0}
+
+    # A deadlock is not a reason to serve stale data
+    app.values._last_good['key'] = (time.time(), 'old')
+    assert client.get('/cached/deadlock').status_code == 500
+    assert breaker.status() == {'state': 'closed', 'failures': 0}
+
+
+def test_is_connection_error():
+    assert db_config.is_connection_error(db_config.DatabaseUnavailable(1))
+    assert db_config.is_connection_error(psycopg2.OperationalError('server closed the connection unexpectedly'))
+    assert db_config.is_connection_error(psycopg2.InterfaceError('connection already closed'))
+    assert db_config.is_connection_error(psycopg2.errors.lookup('08006')())
+    for code in ('40P01', '40001', '55P03', '57P01', '57014'):
+        assert not db_config.is_connection_error(psycopg2.errors.lookup(code)())
+
+
+def test_recovers_after_failover(app, breaker, test_db, monkeypatch):
+    client = app.test_client()
+    live = test_db
+
+    monkeypatch.setattr(db_config, 'DB_PARAMS', {**live, **DEAD_DATABASE})
+    for _ in range(breaker.failure_threshold):
+        assert client.get('/db').status_code == 503
+    assert breaker.status()['state'] == 'open'
+
+    # The standby takes over; the first probe after the reset timeout closes
+    # the circuit again
+    monkeypatch.setattr(db_config, 'DB_PARAMS', live)
+    time.sleep(breaker.reset_seconds)
+    assert client.get('/db').json == {'value': 1}
+    assert breaker.status()['state'] == 'closed'
@@ -0,0 +1,45 @@
+import json
+import numpy as np
+import pytest
+from app.services import series_service
+
+
+# Manual readings every minute with telemetry rows in between that only
+# report oil_refractometer (water_ph_level and oil_ph_level are NULL)
+def _mixed_rows(count=3000):
+    rows = []
+    for i in range(count):
+        t = 1700000000.0 + i * 30
+        if i % 2:
+            rows.append((t, 5.0 + (i % 17) * 0.1, None, None))
+        else:
+            rows.append((t, 5.0 + (i % 13) * 0.1, 7.0 + (i % 7) * 0.1, 8.0 - (i % 5) * 0.1))
+    return rows
+
+
+@pytest.mark.parametrize('mode', ['lttb', 'minmax'])
+def test_series_with_telemetry_rows_downsamples_only_present_values(mode):
+    rows = _mixed_rows()
+    data = np.array(rows, dtype=np.float64)
+    values = {metric: data[:, i + 1] for i, metric in enumerate(series_service.METRICS)}
+    start, end = rows[0][0], rows[-1][0] + 1
+
+    series = series_service.downsample(data[:, 0], values, 200, mode, start, end)
+
+    # Strict JSON: NaN would be rejected
+    json.dumps(series, allow_nan=False)
+
+    manual_times = {int(row[0] * 1000) for row in rows if row[2] is not None}
+    for metric in ('oil_ph_level', 'water_ph_level'):
+        assert 0 < len(series[metric]['t']) <= 200
+        assert set(series[metric]['t']) <= manual_times
+    assert 0 < len(series['oil_refractometer']['t']) <= 200
+
+
+def test_series_of_only_telemetry_gaps_is_empty():
+    t = np.arange(10, dtype=np.float64)
+    values = {'oil_ph_level': np.full(10, np.nan)}
+
+    for mode in ('lttb', 'minmax'):
+        series = series_service.downsample(t, values, 4, mode, 0.0, 10.0)
+        assert series['oil_ph_level'] == {'t': [], 'v': []}
@@ -0,0 +1,85 @@
+import argparse
+import multiprocessing
+import signal
+import threading
+from app.services import job_queue
+import app.services.job_handlers  # noqa: F401 - registers the job handlers
+
+
+# Run the worker threads of one process until SIGTERM/SIGINT
+def run_process(threads, poll_interval):
+    stop_event = threading.Event()
+
+    def stop(signum, frame):
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    workers = [
+        threading.Thread(target=job_queue.work, args=(stop_event, poll_interval), name=f'job-worker-{i}')
+        for i in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+# Periodically requeue jobs whose worker died mid-run and make sure every
+# recurring job has a next run queued (the first pass runs at startup)
+def run_reaper(stop_event, interval):
+    from db_config import get_db_connection
+
+    while True:
+        try:
+            conn = get_db_connection()
+            cur = conn.cursor()
+            requeued = job_queue.requeue_stale_jobs(cur)
+            cur.close()
+            conn.close()
+            if requeued:
+                print(f"Requeued {requeued} stale job(s)")
+
+            seeded = job_queue.seed_recurring_jobs()
+            if seeded:
+                print(f"Queued {seeded} recurring job(s)")
+        except Exception as e:
+            print(f"Job reaper error: {e}")
+
+        if stop_event.wait(interval):
+            break
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run background job workers')
+    parser.add_argument('--processes', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--threads', type=int, default=4, help='worker threads per process')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='seconds to wait when the queue is empty')
+    args = parser.parse_args()
+
+    stop_event = threading.Event()
+    reaper = threading.Thread(target=run_reaper, args=(stop_event, 60), daemon=True)
+    reaper.start()
+
+    if args.processes == 1:
+        run_process(args.threads, args.poll_interval)
+    else:
+        processes = [
+            multiprocessing.Process(target=run_process, args=(args.threads, args.poll_interval))
+            for _ in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+
+        def stop(signum, frame):
+            for process in processes:
+                process.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        for process in processes:
+            process.join()
+
+    stop_event.set()